@@ -1,14 +1,81 @@
 from flask_admin.contrib.sqla import ModelView
+from flask_admin.contrib.sqla.ajax import QueryAjaxModelLoader
+from sqlalchemy.orm import joinedload, load_only
 from wtforms import Form, StringField, PasswordField, SelectField, FloatField
 from wtforms.validators import DataRequired
-from models import User, Course, Grade, db
+from models import User, Term, Course, Grade, WaitlistEntry, db, refresh_enrolled_counts
 from flask import flash, redirect, request, url_for
-from flask_admin.base import expose
+from flask_admin.base import expose, BaseView
+import waitlist
+import auth
+import catalog
+import passwords
+import seats
+import grade_stats
+import grading
+import audit
+import dashboards
+import enrollment_index
+import cache_sync
+from instrumentation import instrumentation
+
+# List pages load only the columns they show and join the related names in
+# the same query, and relationship fields are searchable selects that fetch
+# a bounded page of matches instead of rendering every user or course.
+
+AJAX_MAX_RESULTS = 20
+
+
+class BoundedAjaxLoader(QueryAjaxModelLoader):
+    # Lookups for the searchable selects. The client picks the page size, so
+    # it is capped here, and only the primary key and label columns are read.
+
+    def __init__(self, name, session, model, criteria=(), **options):
+        options.setdefault('order_by', getattr(model, options['fields'][0]))
+        super().__init__(name, session, model, **options)
+        self.criteria = criteria
+
+    def get_query(self):
+        return (self.session.query(self.model)
+                .options(load_only(getattr(self.model, self.pk), *self._cached_fields))
+                .filter(*self.criteria))
+
+    def get_one(self, pk):
+        # Submitted ids must also match the criteria (a student for a grade,
+        # a teacher for a course)
+        with self.session.no_autoflush:
+            return self.get_query().filter(getattr(self.model, self.pk) == pk).first()
+
+    def get_list(self, term, offset=0, limit=AJAX_MAX_RESULTS):
+        return super().get_list(term or '', max(offset or 0, 0),
+                                min(limit or AJAX_MAX_RESULTS, AJAX_MAX_RESULTS))
+
+
+def _ajax_ref(name, model, field, *criteria):
+    return BoundedAjaxLoader(name, db.session, model, criteria=criteria, fields=[field])
+
+
+def _changes(model, *names):
+    # {attribute: [old, new]} for the given attributes modified since the
+    # model was loaded; read before committing
+    state = db.inspect(model)
+    changes = {}
+    for name in names:
+        history = state.attrs[name].history
+        old = history.deleted[0] if history.deleted else None
+        new = history.added[0] if history.added else None
+        if history.has_changes() and old != new:
+            changes[name] = [old, new]
+    return changes
+
 
 class UserView(ModelView):
     column_list = ('id', 'username', 'role')
     form_columns = ('username', 'password', 'role')
     
+    def get_query(self):
+        return super().get_query().options(load_only(User.id, User.username, User.role))
+    
     # Use this for role options
     form_choices = {
         'role': [
@@ -39,12 +106,20 @@ class UserView(ModelView):
             if username:
                 model.username = username
             if password:  # Only update password if provided
-                model.password = password
+                passwords.set_password(model, password)
             if role:
                 model.role = role
+            changes = _changes(model, 'username', 'role')
             
             try:
                 self.session.commit()
+                audit.record('user_update', user_id=model.id, changes=changes,
+                             password_changed=bool(password))
+                # Role and username are cached per user id, in every process
+                auth.invalidate(model.id)
+                cache_sync.announce(cache_sync.IDENTITIES)
+                # Teacher names appear in the course catalog
+                catalog.bump()
                 flash('User successfully updated', 'success')
                 return redirect(url_for('.index_view'))
             except Exception as ex:
@@ -54,22 +129,72 @@ class UserView(ModelView):
         # For GET requests, render the form
         return self.render('admin/user_edit.html', model=model)
 
+    def on_model_change(self, form, model, is_created):
+        # Users created through the admin form arrive with a plaintext password
+        if model.password:
+            passwords.set_password(model, model.password)
+
+    def after_model_change(self, form, model, is_created):
+        if is_created:
+            audit.record('user_create', user_id=model.id, username=model.username, role=model.role)
+
+    def on_model_delete(self, model):
+        # The user's enrollment rows go away with them, so release their seats
+        # in the same transaction
+        course_ids = [course.id for course in model.courses_enrolled]
+        if course_ids:
+            Course.query.filter(Course.id.in_(course_ids)).update(
+                {Course.enrolled_count: Course.enrolled_count - 1},
+                synchronize_session=False)
+        model.freed_course_ids = course_ids
+        WaitlistEntry.query.filter_by(user_id=model.id).delete(synchronize_session=False)
+
+    def after_model_delete(self, model):
+        audit.record('user_delete', user_id=model.id, username=model.username,
+                     dropped_course_ids=model.freed_course_ids)
+        auth.invalidate(model.id)
+        cache_sync.announce(cache_sync.IDENTITIES)
+        dashboards.invalidate(model.id)
+        enrollment_index.student_deleted(model.id)
+        catalog.bump()
+        if model.freed_course_ids:
+            waitlist.promoter.notify(*model.freed_course_ids)
+            seats.publish(*model.freed_course_ids)
+
+
+def _open_terms():
+    return Term.query.filter(Term.status == 'open').order_by(Term.id)
+
+class TermView(ModelView):
+    column_list = ('id', 'name', 'status', 'archived_at')
+    # Terms are archived with archive.py, which also sets the status
+    form_columns = ('name',)
+    # Courses and transcripts refer to their term
+    can_delete = False
 
 class CourseView(ModelView):
-    column_list = ('id', 'name', 'capacity', 'timeslot', 'teacher')
-    form_columns = ('name', 'capacity', 'timeslot', 'teacher_id')
+    column_list = ('id', 'name', 'capacity', 'timeslot', 'teacher', 'term')
+    form_columns = ('name', 'capacity', 'timeslot', 'teacher', 'term')
+    
+    form_args = {
+        'term': {'query_factory': _open_terms}
+    }
     
     column_formatters = {
         'teacher': lambda v, c, m, p: m.teacher.username if m.teacher else 'Unknown'
     }
     
-    # Customize the form field for teacher_id
-    form_args = {
-        'teacher_id': {
-            'label': 'Teacher'
-        }
+    form_ajax_refs = {
+        'teacher': _ajax_ref('teacher', User, 'username', User.role == 'teacher')
     }
     
+    def get_query(self):
+        return super().get_query().options(
+            load_only(Course.id, Course.name, Course.capacity, Course.timeslot, Course.teacher_id,
+                      Course.term_id),
+            joinedload(Course.teacher).load_only(User.id, User.username),
+            joinedload(Course.term).load_only(Term.id, Term.name))
+    
     # Override the edit view to use our custom implementation
     @expose('/edit/', methods=('GET', 'POST'))
     def edit_view(self):
@@ -82,15 +207,18 @@ class CourseView(ModelView):
             flash(f'Record {id} not found', 'error')
             return redirect(url_for('.index_view'))
         
-        # Get teacher options for dropdown
-        teachers = User.query.filter_by(role='teacher').all()
-        
         if request.method == 'POST':
             # Manual form processing
             name = request.form.get('name')
             capacity = request.form.get('capacity')
             timeslot = request.form.get('timeslot')
             teacher_id = request.form.get('teacher_id')
+            term_id = request.form.get('term_id')
+            
+            # The dropdown only offers teachers; a submitted id is held to the same filter
+            if teacher_id and self.form_ajax_refs['teacher'].get_one(teacher_id) is None:
+                flash('Teacher not found', 'error')
+                return redirect(url_for('.edit_view', id=id))
             
             if name:
                 model.name = name
@@ -100,9 +228,20 @@ class CourseView(ModelView):
                 model.timeslot = timeslot
             if teacher_id:
                 model.teacher_id = int(teacher_id)
+            if term_id is not None:
+                model.term_id = int(term_id) if term_id else None
+            changes = _changes(model, 'name', 'capacity', 'timeslot', 'teacher_id', 'term_id')
+            
+            # Re-sync the roster counter along with the edit
+            refresh_enrolled_counts([model.id])
             
             try:
                 self.session.commit()
+                audit.record('course_update', course_id=model.id, changes=changes)
+                # A capacity increase may open seats for waiting students
+                waitlist.promoter.notify(model.id)
+                catalog.bump()
+                seats.publish(model.id)
                 flash('Course successfully updated', 'success')
                 return redirect(url_for('.index_view'))
             except Exception as ex:
@@ -110,25 +249,52 @@ class CourseView(ModelView):
                 self.session.rollback()
         
         # For GET requests, render the form
+        terms = _open_terms().all()
+        if model.term is not None and model.term not in terms:
+            terms.append(model.term)
         return self.render('admin/course_edit.html',
                           model=model,
-                          teachers=teachers)
+                          terms=terms)
+
+    def after_model_change(self, form, model, is_created):
+        if is_created:
+            audit.record('course_create', course_id=model.id, name=model.name,
+                         capacity=model.capacity, timeslot=model.timeslot, teacher_id=model.teacher_id,
+                         term_id=model.term_id)
+        catalog.bump()
+        seats.resync()
+
+    def on_model_delete(self, model):
+        # The course's grades are deleted with it
+        grade_stats.forget([model.id])
+        model.student_ids = [student.id for student in model.students]
+
+    def after_model_delete(self, model):
+        audit.record('course_delete', course_id=model.id, name=model.name)
+        dashboards.invalidate(*model.student_ids)
+        enrollment_index.course_deleted(model.id)
+        catalog.bump()
+        seats.resync()
 
 
 class EnhancedGradeView(ModelView):
     column_list = ('id', 'student', 'course', 'value')
-    form_columns = ('student_id', 'course_id', 'value')
+    form_columns = ('student', 'course', 'value')
     
     column_formatters = {
         'student': lambda v, c, m, p: m.student.username if m.student else 'Unknown',
         'course': lambda v, c, m, p: m.course.name if m.course else 'Unknown'
     }
     
-    def _student_query_factory(self):
-        return User.query.filter_by(role='student')
+    form_ajax_refs = {
+        'student': _ajax_ref('student', User, 'username', User.role == 'student'),
+        'course': _ajax_ref('course', Course, 'name')
+    }
     
-    def _course_query_factory(self):
-        return Course.query.all()
+    def get_query(self):
+        return super().get_query().options(
+            joinedload(Grade.student).load_only(User.id, User.username),
+            joinedload(Grade.course).load_only(Course.id, Course.name))
     
     # Override the edit view to use our custom implementation
     @expose('/edit/', methods=('GET', 'POST'))
@@ -142,25 +308,47 @@ class EnhancedGradeView(ModelView):
             flash(f'Record {id} not found', 'error')
             return redirect(url_for('.index_view'))
         
-        # Get options for dropdowns
-        students = User.query.filter_by(role='student').all()
-        courses = Course.query.all()
-        
         if request.method == 'POST':
             # Manual form processing
             student_id = request.form.get('student_id')
             course_id = request.form.get('course_id')
             value = request.form.get('value')
             
+            # The dropdowns only offer students and courses; submitted ids are
+            # held to the same filters
+            if student_id and self.form_ajax_refs['student'].get_one(student_id) is None:
+                flash('Student not found', 'error')
+                return redirect(url_for('.edit_view', id=id))
+            if course_id and self.form_ajax_refs['course'].get_one(course_id) is None:
+                flash('Course not found', 'error')
+                return redirect(url_for('.edit_view', id=id))
+            
+            try:
+                value = grading.parse_value(value) if value else None
+            except ValueError:
+                flash('Invalid grade value', 'error')
+                return self.render('admin/grade_edit.html', model=model)
+            
+            old_student_id, old_course_id, old_value = model.student_id, model.course_id, model.value
             if student_id:
                 model.student_id = int(student_id)
             if course_id:
                 model.course_id = int(course_id)
-            if value:
-                model.value = float(value)
+            if value is not None:
+                model.value = value
             
             try:
+                # Aggregates move with the grade, or not at all
+                grade_stats.record_changes([(old_course_id, old_value, None),
+                                            (model.course_id, None, model.value)])
                 self.session.commit()
+                if (old_student_id, old_course_id) != (model.student_id, model.course_id):
+                    audit.record('grade', student_id=old_student_id, course_id=old_course_id,
+                                 old=old_value, new=None, source='admin')
+                    old_value = None
+                audit.record('grade', student_id=model.student_id, course_id=model.course_id,
+                             old=old_value, new=model.value, source='admin')
+                dashboards.invalidate(old_student_id, model.student_id)
                 flash('Grade successfully updated', 'success')
                 return redirect(url_for('.index_view'))
             except Exception as ex:
@@ -169,6 +357,42 @@ class EnhancedGradeView(ModelView):
         
         # For GET requests, render the form
         return self.render('admin/grade_edit.html',
-                          model=model,
-                          students=students,
-                          courses=courses)
\ No newline at end of file
+                          model=model)
+
+    def on_model_change(self, form, model, is_created):
+        # Edits go through edit_view above; this covers the create form
+        if is_created:
+            grade_stats.record_changes([(model.course.id, None, model.value)])
+
+    def on_model_delete(self, model):
+        grade_stats.record_changes([(model.course_id, model.value, None)])
+
+    def after_model_change(self, form, model, is_created):
+        if is_created:
+            audit.record('grade', student_id=model.student_id, course_id=model.course_id,
+                         old=None, new=model.value, source='admin')
+            dashboards.invalidate(model.student_id)
+
+    def after_model_delete(self, model):
+        audit.record('grade', student_id=model.student_id, course_id=model.course_id,
+                     old=model.value, new=None, source='admin')
+        dashboards.invalidate(model.student_id)
+
+
+class PerformanceView(BaseView):
+    # Per-endpoint request and SQL stats collected by instrumentation.py
+    
+    def is_accessible(self):
+        user = auth.current_user()
+        return user is not None and user.role == 'admin'
+    
+    def inaccessible_callback(self, name, **kwargs):
+        return redirect('http://localhost:3000/login')
+    
+    @expose('/', methods=('GET', 'POST'))
+    def index(self):
+        if request.method == 'POST':
+            instrumentation.reset()
+            flash('Statistics reset', 'success')
+            return redirect(url_for('.index'))
+        return self.render('admin/performance.html', stats=instrumentation.snapshot())
@@ -1,18 +1,50 @@
-from flask import Flask, request, jsonify, session, redirect, url_for, render_template
+from flask import Flask, Response, request, jsonify, session, redirect, stream_with_context
 from flask_cors import CORS
 from flask_admin import Admin, AdminIndexView
-from models import db, User, Course, Grade, enrollments
-import os
-from admin_views import UserView, CourseView, EnhancedGradeView
+from sqlalchemy.exc import OperationalError
+from models import db, User, Term, Course, Grade
+import io
+import csv
+from admin_views import UserView, TermView, CourseView, EnhancedGradeView, PerformanceView
+from queries import student_transcript, course_detail, search_courses, ROSTER_FIELDS
+import enrollment
+import waitlist
+import grading
+import grade_stats
+import auth
+import database
+import catalog
+import dashboards
+import enrollment_index
+import passwords
+import schedule
+import export
+import bulk_import
+import seats
+import audit
+import cache_sync
+from instrumentation import instrumentation
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///student_enrollment.db'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'your-secret-key'
 app.config['FLASK_ADMIN_SWATCH'] = 'cerulean'
+# Any setting can be overridden from the environment, e.g. FLASK_SECRET_KEY
+app.config.from_prefixed_env()
 
 CORS(app, supports_credentials=True)
+database.configure(app)
 db.init_app(app)
+database.init_engine(app)
+auth.init_app(app)
+catalog.init_app(app)
+dashboards.init_app(app)
+enrollment_index.init_app(app)
+passwords.init_app(app)
+seats.init_app(app)
+audit.init_app(app)
+cache_sync.init_app(app)
+instrumentation.init_app(app)
 
 # Create admin security
 class SecureAdminIndexView(AdminIndexView):
@@ -20,7 +52,7 @@ class SecureAdminIndexView(AdminIndexView):
         user_id = session.get('user_id')
         if not user_id:
             return False
-        user = User.query.get(user_id)
+        user = auth.current_user()
         return user and user.role == 'admin'
     
     def inaccessible_callback(self, name, **kwargs):
@@ -31,13 +63,12 @@ admin = Admin(app, name='Student Enrollment Admin',
               template_mode='bootstrap3',
               index_view=SecureAdminIndexView())
 
-# Import necessary modules for admin views
-from flask_admin.contrib.sqla import ModelView
-
 # Add views
 admin.add_view(UserView(User, db.session))
+admin.add_view(TermView(Term, db.session))
 admin.add_view(CourseView(Course, db.session))
 admin.add_view(EnhancedGradeView(Grade, db.session, endpoint='grade'))
+admin.add_view(PerformanceView(name='Performance', endpoint='performance'))
 
 # Admin login route
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -61,10 +92,32 @@ def admin_index():
 @app.route('/api/login', methods=['POST'])
 def login():
     data = request.json
+    
+    # Throttle before looking anything up, so bursts never reach the hasher
+    retry_after = passwords.throttle(data['username'], request.remote_addr or '')
+    if retry_after:
+        response = jsonify({
+            'success': False,
+            'error': 'Too many login attempts, try again later'
+        })
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response, 429
+    
     user = User.query.filter_by(username=data['username']).first()
     
-    if user and (user.password == data['password']):
+    try:
+        valid = passwords.verify_login(user, data['password'])
+    except passwords.KdfBusy:
+        return jsonify({
+            'success': False,
+            'error': 'Server busy, try again shortly'
+        }), 503
+    
+    if valid:
+        # Persists a rehashed password, if verify_login produced one
+        db.session.commit()
         session['user_id'] = user.id
+        auth.remember(user)
         if user.role == 'admin':
             session['admin_logged_in'] = True
         return jsonify({
@@ -82,7 +135,7 @@ def login_page():
     if 'admin_logged_in' in session:
         return redirect('/admin/')
     if 'user_id' in session:
-        user = User.query.get(session['user_id'])
+        user = auth.current_user()
         if user and user.role == 'admin':
             session['admin_logged_in'] = True
             return redirect('/admin/')
@@ -100,7 +153,7 @@ def get_user():
     user_id = session.get('user_id')
     
     if user_id:
-        user = User.query.get(user_id)
+        user = auth.current_user()
         if user:
             return jsonify({
                 'authenticated': True,
@@ -116,34 +169,16 @@ def student_courses():
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get(user_id)
+    user = auth.current_user()
     
     if not user or user.role != 'student':
         return jsonify({'error': 'Permission denied'}), 403
     
-    enrolled_courses = []
-    for course in user.courses_enrolled:
-        course_dict = course.to_dict()
-        course_dict['enrolled'] = True
-        grade = Grade.query.filter_by(student_id=user.id, course_id=course.id).first()
-        if grade:
-            course_dict['grade'] = grade.value
-        enrolled_courses.append(course_dict)
-    
-    # Get available courses (not enrolled in)
-    all_courses = Course.query.all()
-    enrolled_course_ids = [c.id for c in user.courses_enrolled]
-    available_courses = []
-    for course in all_courses:
-        if course.id not in enrolled_course_ids:
-            course_dict = course.to_dict()
-            course_dict['enrolled'] = False
-            available_courses.append(course_dict)
-    
-    return jsonify({
-        'enrolled_courses': enrolled_courses,
-        'available_courses': available_courses
-    })
+    entry = dashboards.cache.student(user.id)
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
 
 @app.route('/api/teacher/courses', methods=['GET'])
 def teacher_courses():
@@ -153,53 +188,62 @@ def teacher_courses():
         return jsonify({'error': 'Not logged in'}), 401
     
     # Get the user from database
-    user = User.query.get(current_user_id)
+    user = auth.current_user()
     
     # Check if user is a teacher
     if not user or user.role != 'teacher':
         return jsonify({'error': 'Unauthorized'}), 403
     
-    # Debug information
-    print(f"Teacher ID: {user.id}, Username: {user.username}")
+    # Slow or failing requests show up in the per-endpoint stats
+    # (/api/admin/stats) instead of being printed here
+    entry = dashboards.cache.teacher(user.id)
+    response = Response(entry.body, mimetype='application/json')
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+def int_arg(name):
+    # Optional integer query argument. request.args.get(name, type=int)
+    # quietly turns a malformed value into None; this raises ValueError.
+    value = request.args.get(name)
+    return None if value is None else int(value)
+
+def teaches(user, course_id):
+    # Ownership from a primary key read, before any roster is loaded
+    if not user or user.role != 'teacher':
+        return False
+    teacher_id = db.session.query(Course.teacher_id).filter(Course.id == course_id).scalar()
+    return teacher_id == user.id
+
+@app.route('/api/teacher/course/<int:course_id>')
+def course_details(course_id):
+    user_id = session.get('user_id')
     
-    # Get courses taught by the teacher
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not teaches(user, course_id):
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    # Optional roster paging (?limit=&after=<last student id>) and field
+    # selection (?fields=id,username,grade)
     try:
-        if hasattr(user.courses_teaching, 'all'):
-            courses = user.courses_teaching.all()
-        else:
-            courses = list(user.courses_teaching)
-            
-        print(f"Found {len(courses)} courses for teacher")
-        
-        # If no courses found, check if there are any courses in the database
-        if not courses:
-            total_courses = Course.query.count()
-            print(f"Total courses in database: {total_courses}")
-            
-            # Check if teacher_id is properly set in courses
-            courses_with_this_teacher = Course.query.filter_by(teacher_id=user.id).all()
-            print(f"Courses with teacher_id={user.id}: {len(courses_with_this_teacher)}")
-            
-            # Manual inspection of courses
-            all_courses = Course.query.all()
-            for c in all_courses:
-                print(f"Course ID: {c.id}, Name: {c.name}, Teacher ID: {c.teacher_id}")
-        
-    except Exception as e:
-        print(f"Error getting courses: {str(e)}")
-        return jsonify({'error': f'Failed to retrieve courses: {str(e)}'}), 500
-    
-    # Convert courses to dictionary format
-    courses_list = []
-    for course in courses:
-        try:
-            course_dict = course.to_dict()
-            courses_list.append(course_dict)
-        except Exception as e:
-            print(f"Error converting course {course.id} to dict: {str(e)}")
-            # Continue with the next course if there's an error
-    
-    return jsonify(courses_list)
+        limit = min(int(request.args.get('limit', 500)), 1000)
+        after = int_arg('after')
+    except ValueError:
+        return jsonify({'error': 'Invalid paging parameters'}), 400
+    if limit < 1:
+        return jsonify({'error': 'Invalid paging parameters'}), 400
+    
+    fields = ROSTER_FIELDS
+    if request.args.get('fields'):
+        fields = tuple(request.args['fields'].split(','))
+        if not set(fields) <= set(ROSTER_FIELDS):
+            return jsonify({'error': f"fields must be among {', '.join(ROSTER_FIELDS)}"}), 400
+    
+    return jsonify(course_detail(course_id, after=after, limit=limit, fields=fields))
 
 @app.route('/api/teacher/course/<int:course_id>/students')
 def course_students(course_id):
@@ -208,29 +252,12 @@ def course_students(course_id):
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get(user_id)
-    course = Course.query.get(course_id)
+    user = auth.current_user()
     
-    if not user or user.role != 'teacher' or not course or course.teacher_id != user.id:
+    if not teaches(user, course_id):
         return jsonify({'error': 'Permission denied'}), 403
     
-    students_data = []
-    for student in course.students:
-        # Create a custom dictionary without email
-        student_dict = {
-            'id': student.id,
-            'username': student.username,
-            'role': student.role
-        }
-        
-        grade = Grade.query.filter_by(student_id=student.id, course_id=course.id).first()
-        if grade:
-            student_dict['grade'] = grade.value
-        else:
-            student_dict['grade'] = None
-        students_data.append(student_dict)
-    
-    return jsonify(students_data)
+    return jsonify(course_detail(course_id)['students'])
 
 @app.route('/api/teacher/update-grade', methods=['POST'])
 def update_grade():
@@ -239,7 +266,7 @@ def update_grade():
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get(user_id)
+    user = auth.current_user()
     data = request.json
     course = Course.query.get(data['course_id'])
     
@@ -247,25 +274,93 @@ def update_grade():
         return jsonify({'error': 'Permission denied'}), 403
     
     student = User.query.get(data['student_id'])
-    if not student or course not in student.courses_enrolled:
+    if not student or not enrollment.is_enrolled(student.id, course.id):
         return jsonify({'error': 'Student not enrolled in this course'}), 400
     
-    grade = Grade.query.filter_by(student_id=data['student_id'], course_id=data['course_id']).first()
-    
-    if grade:
-        grade.value = data['value']
-    else:
-        grade = Grade(
-            student_id=data['student_id'],
-            course_id=data['course_id'],
-            value=data['value']
-        )
-        db.session.add(grade)
-    
+    try:
+        value = grading.parse_value(data['value'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid grade value'}), 400
+    
+    changes = grading.upsert_grades([{
+        'student_id': student.id,
+        'course_id': course.id,
+        'value': value
+    }])
     db.session.commit()
+    grading.audit_grades(changes)
+    dashboards.invalidate(student.id)
     
     return jsonify({'success': True})
 
+@app.route('/api/teacher/grades', methods=['POST'])
+def update_grades():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    data = request.json
+    course = Course.query.get(data['course_id'])
+    
+    if not user or user.role != 'teacher' or not course or course.teacher_id != user.id:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    if not isinstance(data.get('grades'), list):
+        return jsonify({'error': 'grades must be a list'}), 400
+    
+    saved, errors = grading.submit_grades(course.id, data['grades'])
+    
+    return jsonify({
+        'success': not errors,
+        'saved': saved,
+        'errors': errors
+    })
+
+@app.route('/api/teacher/course/<int:course_id>/stats')
+def course_grade_stats(course_id):
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    course = db.session.get(Course, course_id)
+    
+    if not user or user.role != 'teacher' or not course or course.teacher_id != user.id:
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify(grade_stats.course_stats(course_id))
+
+@app.route('/api/student/gpa')
+def student_gpa():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'student':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify(grade_stats.student_gpa(user.id))
+
+@app.route('/api/student/transcript')
+def transcript():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'student':
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    return jsonify({'terms': student_transcript(user.id)})
+
 @app.route('/api/student/enroll', methods=['POST'])
 def enroll_course():
     user_id = session.get('user_id')
@@ -273,21 +368,26 @@ def enroll_course():
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get(user_id)
+    user = auth.current_user()
     data = request.json
-    course = Course.query.get(data['course_id'])
     
-    if not user or user.role != 'student' or not course:
+    if not user or user.role != 'student':
         return jsonify({'error': 'Permission denied or course not found'}), 403
     
-    if course in user.courses_enrolled:
-        return jsonify({'error': 'Already enrolled in this course'}), 400
+    result = enrollment.enroll(user.id, data['course_id'])
     
-    if len(course.students) >= course.capacity:
-        return jsonify({'error': 'Course is full'}), 400
-    
-    user.courses_enrolled.append(course)
-    db.session.commit()
+    if result == enrollment.COURSE_NOT_FOUND:
+        return jsonify({'error': 'Permission denied or course not found'}), 403
+    if result == enrollment.ALREADY_ENROLLED:
+        return jsonify({'error': 'Already enrolled in this course'}), 400
+    if result == enrollment.FULL:
+        return jsonify({'error': 'Course is full', 'full': True}), 400
+    if result == enrollment.SCHEDULE_CONFLICT:
+        conflicts = Course.query.filter(Course.id.in_(schedule.find_conflicts(user.id, data['course_id']))).all()
+        return jsonify({
+            'error': 'Schedule conflict with ' + ', '.join(course.name for course in conflicts),
+            'conflicts': [course.id for course in conflicts]
+        }), 400
     
     return jsonify({'success': True})
 
@@ -298,23 +398,71 @@ def drop_course():
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get(user_id)
+    user = auth.current_user()
     data = request.json
-    course = Course.query.get(data['course_id'])
     
-    if not user or user.role != 'student' or not course:
+    if not user or user.role != 'student':
         return jsonify({'error': 'Permission denied or course not found'}), 403
     
-    if course not in user.courses_enrolled:
+    result = enrollment.drop(user.id, data['course_id'])
+    
+    if result == enrollment.COURSE_NOT_FOUND:
+        return jsonify({'error': 'Permission denied or course not found'}), 403
+    if result == enrollment.NOT_ENROLLED:
         return jsonify({'error': 'Not enrolled in this course'}), 400
     
-    user.courses_enrolled.remove(course)
+    # Hand the freed seat to the next student in line
+    waitlist.promoter.notify(data['course_id'])
     
-    grade = Grade.query.filter_by(student_id=user.id, course_id=course.id).first()
-    if grade:
-        db.session.delete(grade)
+    return jsonify({'success': True})
+
+@app.route('/api/student/waitlist', methods=['GET', 'POST'])
+def course_waitlist():
+    user_id = session.get('user_id')
     
-    db.session.commit()
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'student':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    if request.method == 'GET':
+        return jsonify(waitlist.student_waitlist(user.id))
+    
+    data = request.json
+    result = waitlist.join(user.id, data['course_id'])
+    
+    if result == waitlist.COURSE_NOT_FOUND:
+        return jsonify({'error': 'Permission denied or course not found'}), 403
+    if result == waitlist.HAS_OPEN_SEATS:
+        return jsonify({'error': 'Course has open seats, enroll directly'}), 400
+    if result == waitlist.ALREADY_ENROLLED:
+        return jsonify({'error': 'Already enrolled in this course'}), 400
+    if result == waitlist.ALREADY_WAITLISTED:
+        return jsonify({'error': 'Already on the waitlist for this course'}), 400
+    
+    return jsonify({
+        'success': True,
+        'position': waitlist.position(user.id, data['course_id'])
+    })
+
+@app.route('/api/student/waitlist/leave', methods=['POST'])
+def leave_waitlist():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    data = request.json
+    
+    if not user or user.role != 'student':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    if not waitlist.leave(user.id, data['course_id']):
+        return jsonify({'error': 'Not on the waitlist for this course'}), 400
     
     return jsonify({'success': True})
 
@@ -325,22 +473,248 @@ def get_courses():
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
     
-    user = User.query.get(user_id)
+    user = auth.current_user()
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    courses = Course.query.all()
-    courses_data = [course.to_dict() for course in courses]
+    snapshot = catalog.cache.snapshot()
+    response = Response(snapshot.body, mimetype='application/json')
+    response.set_etag(snapshot.etag)
+    # Clients may keep the body but must revalidate it every time
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+@app.route('/api/courses/search')
+def course_search():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    if not auth.current_user():
+        return jsonify({'error': 'User not found'}), 404
     
-    return jsonify(courses_data)
+    args = request.args
+    try:
+        limit = min(int(args.get('limit', 50)), 200)
+        teacher_id = int_arg('teacher_id')
+        min_seats = int_arg('min_seats')
+    except ValueError:
+        return jsonify({'error': 'Invalid search parameters'}), 400
+    
+    try:
+        results = search_courses(prefix=args.get('prefix'),
+                                 contains=args.get('q'),
+                                 teacher_id=teacher_id,
+                                 timeslot=args.get('timeslot'),
+                                 min_seats=min_seats,
+                                 cursor=args.get('cursor'),
+                                 limit=max(limit, 1))
+    except ValueError as e:
+        return jsonify({'error': str(e) or 'Invalid search parameters'}), 400
+    
+    return jsonify(results)
 
-with app.app_context():
-    db.create_all()
+@app.route('/api/admin/schedule-conflicts')
+def schedule_conflicts():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify(schedule.conflict_report())
+
+@app.route('/api/admin/courses/<int:course_a>/shared/<int:course_b>')
+def shared_students(course_a, course_b):
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    student_ids = enrollment_index.shared_students(course_a, course_b)
+    return jsonify({
+        'course_ids': [course_a, course_b],
+        'enrolled': [enrollment_index.roster_size(course_a), enrollment_index.roster_size(course_b)],
+        'shared': len(student_ids),
+        'student_ids': student_ids
+    })
+
+@app.route('/api/admin/enrollment-index')
+def enrollment_index_stats():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify(dict(enrollment_index.index.stats(), enabled=enrollment_index.enabled))
+
+@app.route('/api/admin/export/<name>')
+def export_data(name):
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    fmt = request.args.get('format', 'csv')
+    if name not in export.EXPORTS or fmt not in export.FORMATS:
+        return jsonify({'error': 'Unknown export or format'}), 404
+    
+    try:
+        course_id = int_arg('course_id')
+    except ValueError:
+        return jsonify({'error': 'Invalid course_id'}), 400
+    
+    response = Response(stream_with_context(export.stream_export(name, fmt, course_id)),
+                        mimetype=export.FORMATS[fmt])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{fmt}'
+    return response
+
+@app.route('/api/admin/import/<kind>', methods=['POST'])
+def import_data(kind):
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    fmt = request.args.get('format', 'csv')
+    if kind not in bulk_import.KINDS or fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'Unknown import or format'}), 404
+    
+    # ?skip=<rows> resumes after the rows a failed request committed, as
+    # reported in its error response
+    try:
+        chunk_size = int(request.args.get('chunk_size', 5000))
+        skip = int(request.args.get('skip', 0))
+    except ValueError:
+        return jsonify({'error': 'Invalid parameters'}), 400
+    if chunk_size < 1 or skip < 0:
+        return jsonify({'error': 'Invalid parameters'}), 400
+    
+    # The request body is read as a stream, chunk by chunk
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    progress = {'rows_done': skip}
+    
+    def save_progress(rows_done):
+        progress['rows_done'] = rows_done
+    
+    try:
+        stats = bulk_import.run_import(kind, bulk_import.read_records(stream, fmt),
+                                       chunk_size=chunk_size, skip=skip, on_chunk=save_progress)
+    except (ValueError, csv.Error) as e:
+        return jsonify({'error': f'Invalid input: {e}', 'rows_done': progress['rows_done']}), 400
+    except passwords.KdfBusy:
+        return jsonify({'error': 'Server busy, try again shortly', 'rows_done': progress['rows_done']}), 503
+    
+    return jsonify(bulk_import.finish(kind, stats))
+
+@app.route('/api/admin/stats')
+def request_stats():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    return jsonify(instrumentation.snapshot())
+
+@app.route('/api/courses/seats/stream')
+def seat_stream():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    # Seat deltas are shared by every client; no per-user state or queries
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    response = Response(seats.feed.subscribe(last_id), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/admin/audit')
+def audit_events():
+    user_id = session.get('user_id')
+    
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    
+    user = auth.current_user()
+    
+    if not user or user.role != 'admin':
+        return jsonify({'error': 'Permission denied'}), 403
+    
+    # Newest first; filter with ?course_id= / ?student_id=, page with ?before=<last id>
+    try:
+        course_id = int_arg('course_id')
+        student_id = int_arg('student_id')
+        before = int_arg('before')
+        limit = min(int(request.args.get('limit', 100)), 1000)
+    except ValueError:
+        return jsonify({'error': 'Invalid parameters'}), 400
+    
+    events = audit.recent(course_id, student_id, before, limit)
+    return jsonify({
+        'events': events,
+        'next_before': events[-1]['id'] if len(events) == limit else None,
+        'writer': audit.log.stats()
+    })
+
+waitlist.promoter.start(app)
+seats.feed.start(app)
+audit.log.start(app)
+
+def ensure_admin():
+    # Default admin account for a database without one
     if not User.query.filter_by(role='admin').first():
-        admin_user = User(username='admin', password='admin', role='admin')
+        admin_user = User(username='admin', role='admin')
+        passwords.set_password(admin_user, 'admin')
         db.session.add(admin_user)
         db.session.commit()
 
+with app.app_context():
+    db.create_all()
+    try:
+        ensure_admin()
+    except OperationalError as e:
+        # A database created before newer columns: repair_db.py adds them,
+        # then creates the admin account
+        db.session.rollback()
+        print(f"Error creating the admin user, run repair_db.py: {e}")
+
+# Load the enrollments table and read cache_versions, so they start once the
+# tables exist
+enrollment_index.start(app)
+cache_sync.sync.start(app)
+
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
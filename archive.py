@@ -0,0 +1,176 @@
+import argparse
+import time
+from datetime import datetime
+from models import (db, User, Term, Course, Grade, WaitlistEntry, ArchivedCourse, ArchivedGrade,
+                    enrollments, archived_enrollments)
+import grade_stats
+import catalog
+import dashboards
+import cache_sync
+
+# Term rollover. archive_term() moves a closed term's courses, with their
+# enrollments and grades, out of the live tables into archived_courses,
+# archived_enrollments and archived_grades, so that the tables behind
+# /api/courses, rosters and grading only hold current terms. Transcripts
+# still cover every term through the `transcripts` view.
+#
+# Rows move in chunks of `chunk_size`, each chunk copied and deleted in its
+# own short transaction, so the database is never write-locked for longer
+# than one chunk and requests get in between chunks. The term is marked
+# 'archiving' first; an interrupted run is finished by running it again.
+# Running servers are told through cache_sync.py and drop their caches within
+# CACHE_SYNC_INTERVAL seconds of the end of the run.
+#
+#   python archive.py                              list terms
+#   python archive.py "Fall 2024"                  archive a term
+#   python archive.py "Fall 2024" --next "Spring 2025"
+#                                                  open the next term with a copy
+#                                                  of its courses, then archive it
+
+CHUNK_SIZE = 500
+
+
+def _term_courses(term_id):
+    return db.select(Course.id).where(Course.term_id == term_id)
+
+
+def _move_grades(course_ids, limit=None):
+    ids = db.select(Grade.id).where(Grade.course_id.in_(course_ids)).order_by(Grade.id)
+    if limit is not None:
+        ids = ids.limit(limit)
+    ids = list(db.session.scalars(ids))
+    if ids:
+        db.session.execute(ArchivedGrade.__table__.insert().from_select(
+            ['id', 'student_id', 'course_id', 'value'],
+            db.select(Grade.id, Grade.student_id, Grade.course_id, Grade.value).where(Grade.id.in_(ids))))
+        Grade.query.filter(Grade.id.in_(ids)).delete(synchronize_session=False)
+    return len(ids)
+
+
+def _move_enrollments(course_ids, limit=None):
+    keys = (db.select(enrollments.c.user_id, enrollments.c.course_id)
+            .where(enrollments.c.course_id.in_(course_ids))
+            .order_by(enrollments.c.course_id, enrollments.c.user_id))
+    if limit is not None:
+        keys = keys.limit(limit)
+    keys = [tuple(key) for key in db.session.execute(keys)]
+    if keys:
+        selected = db.tuple_(enrollments.c.user_id, enrollments.c.course_id).in_(keys)
+        db.session.execute(archived_enrollments.insert().from_select(
+            ['user_id', 'course_id'], db.select(enrollments.c.user_id, enrollments.c.course_id).where(selected)))
+        db.session.execute(enrollments.delete().where(selected))
+    return len(keys)
+
+
+def _move_courses(term_id, limit):
+    ids = list(db.session.scalars(_term_courses(term_id).order_by(Course.id).limit(limit)))
+    if not ids:
+        return 0
+    # Enrollments or grades written since the earlier passes go with their course
+    _move_enrollments(ids)
+    _move_grades(ids)
+    db.session.execute(ArchivedCourse.__table__.insert().from_select(
+        ['id', 'term_id', 'name', 'capacity', 'timeslot', 'teacher_id', 'teacher_name', 'enrolled_count'],
+        db.select(Course.id, Course.term_id, Course.name, Course.capacity, Course.timeslot,
+                  Course.teacher_id, User.username, Course.enrolled_count)
+        .outerjoin(User, User.id == Course.teacher_id)
+        .where(Course.id.in_(ids))))
+    WaitlistEntry.query.filter(WaitlistEntry.course_id.in_(ids)).delete(synchronize_session=False)
+    grade_stats.forget(ids)
+    Course.query.filter(Course.id.in_(ids)).delete(synchronize_session=False)
+    return len(ids)
+
+
+def _in_chunks(step, pause):
+    # Runs step() one committed chunk at a time until it moves nothing
+    moved = 0
+    while True:
+        count = step()
+        db.session.commit()
+        if not count:
+            return moved
+        moved += count
+        if pause:
+            time.sleep(pause)
+
+
+def archive_term(term, chunk_size=CHUNK_SIZE, pause=0.0):
+    # Returns (courses, enrollments, grades) moved by this run
+    if term.status == 'archived':
+        return 0, 0, 0
+    term.status = 'archiving'
+    db.session.commit()
+
+    course_ids = _term_courses(term.id)
+    grades = _in_chunks(lambda: _move_grades(course_ids, chunk_size), pause)
+    enrolled = _in_chunks(lambda: _move_enrollments(course_ids, chunk_size), pause)
+    courses = _in_chunks(lambda: _move_courses(term.id, chunk_size), pause)
+
+    term.status = 'archived'
+    term.archived_at = datetime.utcnow()
+    db.session.commit()
+    catalog.bump()
+    # Includes the shared dashboard level, which other processes read
+    dashboards.clear()
+    # Running servers drop their catalog, dashboards and enrollment index
+    cache_sync.announce(cache_sync.DATA)
+    return courses, enrolled, grades
+
+
+def start_term(name, copy_from=None):
+    # New open term, optionally with a copy of another term's courses
+    # (same names, capacities, timeslots and teachers; empty rosters)
+    term = Term(name=name)
+    db.session.add(term)
+    db.session.flush()
+    if copy_from is not None:
+        db.session.execute(Course.__table__.insert().from_select(
+            ['name', 'capacity', 'timeslot', 'teacher_id', 'term_id',
+             'meeting_days', 'start_minute', 'end_minute'],
+            db.select(Course.name, Course.capacity, Course.timeslot, Course.teacher_id,
+                      db.literal(term.id), Course.meeting_days, Course.start_minute, Course.end_minute)
+            .where(Course.term_id == copy_from.id)
+            .order_by(Course.id)))
+    db.session.commit()
+    return term
+
+
+def term_summary():
+    live = dict(db.session.query(Course.term_id, db.func.count(Course.id)).group_by(Course.term_id))
+    archived = dict(db.session.query(ArchivedCourse.term_id, db.func.count(ArchivedCourse.id))
+                    .group_by(ArchivedCourse.term_id))
+    return [dict(term.to_dict(), live_courses=live.get(term.id, 0), archived_courses=archived.get(term.id, 0))
+            for term in Term.query.order_by(Term.id)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Archive a closed term out of the live tables')
+    parser.add_argument('term', nargs='?', help='name of the term to archive; lists terms if omitted')
+    parser.add_argument('--next', help='first open a new term with a copy of its courses')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='rows moved per transaction')
+    parser.add_argument('--pause', type=float, default=0.05, help='seconds to wait between chunks')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if not args.term:
+            for term in term_summary():
+                print(f"{term['name']}: {term['status']}, {term['live_courses']} live courses, "
+                      f"{term['archived_courses']} archived")
+            return
+
+        term = Term.query.filter_by(name=args.term).first()
+        if term is None:
+            parser.error(f"No term named {args.term!r}")
+        if args.next:
+            start_term(args.next, copy_from=term)
+            print(f"Opened {args.next} with the courses of {term.name}")
+
+        start = time.monotonic()
+        courses, enrolled, grades = archive_term(term, args.chunk_size, args.pause)
+        print(f"Archived {term.name}: {courses} courses, {enrolled} enrollments, {grades} grades "
+              f"in {time.monotonic() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
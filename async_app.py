@@ -0,0 +1,305 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from itsdangerous import BadSignature
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+from app import app as flask_app
+from models import db, User, Course
+from queries import (course_summaries_query, course_summary, enrolled_course_ids_query,
+                     student_grades_query, build_dashboard)
+import auth
+import catalog
+import database
+import export
+import seats
+
+# asyncio tier for the read-heavy and long-lived endpoints: /api/user,
+# /api/courses, /api/student/courses, the seat stream and the admin exports.
+# Each in-flight request is a coroutine waiting on the async engine rather
+# than a thread, so thousands of open streams or slow requests cost memory,
+# not workers. Logins and every write stay on the Flask app; put both behind
+# one proxy and route these GETs here.
+#
+# Shares the models, queries, settings and session cookie with app.py, so a
+# user logged in through Flask is logged in here.
+#
+#   python async_app.py --port 5001      (or: uvicorn async_app:app --port 5001)
+
+engine = database.create_async_engine(flask_app)
+Session = async_sessionmaker(engine, expire_on_commit=False)
+_session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def session_user_id(request):
+    # user_id from the Flask session cookie, verified with the app's secret key
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if not cookie:
+        return None
+    try:
+        data = _session_serializer.loads(
+            cookie, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except BadSignature:
+        return None
+    return data.get('user_id')
+
+
+async def current_user(user_id):
+    # Same process-wide identity cache as auth.current_user()
+    identity = auth.identity_cache.get(user_id)
+    if identity is None:
+        async with Session() as session:
+            row = (await session.execute(
+                db.select(User.id, User.username, User.role).where(User.id == user_id))).first()
+        if row is not None:
+            identity = auth.Identity(*row)
+            auth.identity_cache.put(identity)
+    return identity
+
+
+def _not_modified(request, etag):
+    candidates = [tag.strip() for tag in request.headers.get('if-none-match', '').split(',')]
+    return '*' in candidates or etag in candidates or 'W/' + etag in candidates
+
+
+class AsyncCatalog:
+    # The catalog snapshot of catalog.py, rebuilt at most every `max_age`
+    # seconds. Changes are bumped in the Flask process and cannot be seen from
+    # here, as with several Flask workers.
+
+    def __init__(self, max_age):
+        self.max_age = max_age
+        self._snapshot = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self, snapshot):
+        return snapshot is not None and time.monotonic() - snapshot.built_at < self.max_age
+
+    async def snapshot(self):
+        if self._is_fresh(self._snapshot):
+            return self._snapshot
+        # One rebuild at a time; requests that waited reuse its result
+        async with self._lock:
+            if not self._is_fresh(self._snapshot):
+                async with Session() as session:
+                    rows = await session.execute(course_summaries_query())
+                    courses = [course_summary(row) for row in rows]
+                self._snapshot = catalog.make_snapshot(0, courses)
+        return self._snapshot
+
+
+class SeatPoller:
+    # The seat stream of seats.py. Enrollments publish their changes in the
+    # Flask process's memory, so here one task reads every course's counts
+    # each `interval` while anyone is listening and broadcasts the ones that
+    # changed: one query and one notify per tick however many clients are
+    # connected.
+
+    def __init__(self, interval, keepalive, backlog):
+        self.interval = interval
+        self.keepalive = keepalive
+        self._messages = deque(maxlen=backlog)
+        self._sequence = 0
+        self._changed = asyncio.Condition()
+        self._listeners = 0
+        self._task = None
+
+    async def _append(self, event, data):
+        async with self._changed:
+            self._sequence += 1
+            self._messages.append((self._sequence, seats.encode_event(self._sequence, event, data)))
+            self._changed.notify_all()
+
+    async def _poll(self):
+        counts = None
+        while self._listeners:
+            try:
+                async with Session() as session:
+                    rows = await session.execute(
+                        db.select(Course.id, Course.enrolled_count, Course.capacity))
+                    latest = {course_id: (enrolled_count, capacity)
+                              for course_id, enrolled_count, capacity in rows}
+            except Exception as e:
+                print(f"Error polling seat counts: {e}")
+            else:
+                if counts is not None and latest.keys() != counts.keys():
+                    await self._append('resync', '{}')
+                elif counts is not None:
+                    changed = [[course_id, *latest[course_id]] for course_id in sorted(latest)
+                               if latest[course_id] != counts[course_id]]
+                    if changed:
+                        await self._append('seats', json.dumps({'seats': changed}, separators=(',', ':')))
+                counts = latest
+            await asyncio.sleep(self.interval)
+        self._task = None
+
+    async def subscribe(self, last_id=None):
+        self._listeners += 1
+        if self._task is None:
+            self._task = asyncio.create_task(self._poll())
+        try:
+            async with self._changed:
+                cursor = self._sequence if last_id is None or last_id > self._sequence else last_id
+
+            yield f"retry: {int(self.interval * 1000) + 1000}\n\n".encode()
+            while True:
+                async with self._changed:
+                    try:
+                        await asyncio.wait_for(
+                            self._changed.wait_for(lambda: self._sequence > cursor), self.keepalive)
+                    except asyncio.TimeoutError:
+                        frames = None
+                    else:
+                        if self._messages and self._messages[0][0] > cursor + 1:
+                            frames = [seats.encode_event(self._sequence, 'resync', '{}')]
+                        else:
+                            frames = [body for sequence, body in self._messages if sequence > cursor]
+                        cursor = self._sequence
+
+                yield b": keepalive\n\n" if frames is None else b''.join(frames)
+        finally:
+            self._listeners -= 1
+
+
+course_catalog = AsyncCatalog(flask_app.config.get('CATALOG_MAX_AGE', 5) or 1)
+seat_poller = SeatPoller(flask_app.config.get('SEAT_FEED_INTERVAL', 1.0),
+                         flask_app.config.get('SEAT_FEED_KEEPALIVE', 15.0),
+                         flask_app.config.get('SEAT_FEED_BACKLOG', 64))
+
+
+async def get_user(request):
+    user_id = session_user_id(request)
+
+    if user_id:
+        user = await current_user(user_id)
+        if user:
+            return JSONResponse({
+                'authenticated': True,
+                'user': user.to_dict()
+            })
+
+    return JSONResponse({'authenticated': False})
+
+
+async def get_courses(request):
+    user_id = session_user_id(request)
+
+    if not user_id:
+        return JSONResponse({'error': 'Not logged in'}, 401)
+
+    user = await current_user(user_id)
+
+    if not user:
+        return JSONResponse({'error': 'User not found'}, 404)
+
+    snapshot = await course_catalog.snapshot()
+    etag = f'"{snapshot.etag}"'
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    if _not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type='application/json', headers=headers)
+
+
+async def student_courses(request):
+    user_id = session_user_id(request)
+
+    if not user_id:
+        return JSONResponse({'error': 'Not logged in'}, 401)
+
+    user = await current_user(user_id)
+
+    if not user or user.role != 'student':
+        return JSONResponse({'error': 'Permission denied'}, 403)
+
+    snapshot = await course_catalog.snapshot()
+    async with Session() as session:
+        enrolled_ids = set(await session.scalars(enrolled_course_ids_query(user.id)))
+        grades = dict((await session.execute(student_grades_query(user.id))).all())
+
+    return JSONResponse(build_dashboard(snapshot.courses, enrolled_ids, grades))
+
+
+async def seat_stream(request):
+    user_id = session_user_id(request)
+
+    if not user_id:
+        return JSONResponse({'error': 'Not logged in'}, 401)
+
+    try:
+        last_id = int(request.headers['last-event-id'])
+    except (KeyError, ValueError):
+        last_id = None
+    return StreamingResponse(seat_poller.subscribe(last_id), media_type='text/event-stream',
+                             headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+async def export_data(request):
+    user_id = session_user_id(request)
+
+    if not user_id:
+        return JSONResponse({'error': 'Not logged in'}, 401)
+
+    user = await current_user(user_id)
+
+    if not user or user.role != 'admin':
+        return JSONResponse({'error': 'Permission denied'}, 403)
+
+    name = request.path_params['name']
+    fmt = request.query_params.get('format', 'csv')
+    if name not in export.EXPORTS or fmt not in export.FORMATS:
+        return JSONResponse({'error': 'Unknown export or format'}, 404)
+
+    try:
+        course_id = int(request.query_params['course_id']) if 'course_id' in request.query_params else None
+    except ValueError:
+        return JSONResponse({'error': 'Invalid course_id'}, 400)
+
+    async def chunks():
+        async with Session() as session:
+            result = await session.stream(export.export_query(name, course_id))
+            encoder = export.ExportEncoder(list(result.keys()), fmt)
+            header = encoder.header()
+            if header:
+                yield header
+            async for rows in result.partitions():
+                yield encoder.encode(rows)
+
+    return StreamingResponse(chunks(), media_type=export.FORMATS[fmt],
+                             headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'})
+
+
+app = Starlette(
+    routes=[
+        Route('/api/user', get_user),
+        Route('/api/courses', get_courses),
+        Route('/api/student/courses', student_courses),
+        Route('/api/courses/seats/stream', seat_stream),
+        Route('/api/admin/export/{name}', export_data),
+    ],
+    middleware=[
+        # Same policy as CORS(app, supports_credentials=True) in app.py
+        Middleware(CORSMiddleware, allow_origin_regex='.*', allow_credentials=True,
+                   allow_methods=['*'], allow_headers=['*']),
+    ],
+    on_shutdown=[engine.dispose],
+)
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Serve the async API tier')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import atexit
+import json
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from flask import has_request_context
+from models import db, AuditEvent
+import auth
+
+# Write-behind audit trail. record() only appends the event to a bounded
+# in-memory buffer; a background thread writes the buffer out in batches,
+# either as multi-row inserts into audit_log or as lines appended to a JSON
+# Lines file. Events are recorded after the change they describe commits.
+#
+# At most AUDIT_BUFFER_SIZE events wait in memory. When writes fall that far
+# behind (or the process dies), events are lost rather than slowing requests
+# down; AUDIT_OVERFLOW picks which:
+#
+#   drop_oldest   evict the oldest waiting event (default)
+#   drop_newest   discard the event being recorded
+#   block         wait up to AUDIT_BLOCK_TIMEOUT seconds for room, then drop
+#                 the new event; trades request latency for completeness
+#
+# Dropped events are counted and shown by /api/admin/audit.
+#
+#   AUDIT_SINK            db, file or off (default db)
+#   AUDIT_FILE            JSON Lines path for the file sink (default instance/audit.jsonl)
+#   AUDIT_BUFFER_SIZE     events held in memory (default 10000)
+#   AUDIT_BATCH_SIZE      events per write (default 500)
+#   AUDIT_FLUSH_INTERVAL  seconds between writes (default 1)
+#   AUDIT_OVERFLOW        drop_oldest, drop_newest or block (see above)
+#   AUDIT_BLOCK_TIMEOUT   longest wait for room under `block` (default 0.05)
+
+OVERFLOW_POLICIES = ('drop_oldest', 'drop_newest', 'block')
+
+
+class AuditLog:
+
+    def __init__(self, buffer_size=10000, batch_size=500, flush_interval=1.0,
+                 overflow='drop_oldest', block_timeout=0.05):
+        self.sink = 'db'
+        self.path = None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self._buffer = deque()
+        self._buffer_size = buffer_size
+        self._condition = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._app = None
+        self._thread = None
+
+    def configure(self, sink, path, buffer_size, batch_size, flush_interval, overflow, block_timeout):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"AUDIT_OVERFLOW must be one of {', '.join(OVERFLOW_POLICIES)}")
+        with self._condition:
+            self.sink = sink
+            self.path = path
+            self._buffer_size = buffer_size
+            self.batch_size = batch_size
+            self.flush_interval = flush_interval
+            self.overflow = overflow
+            self.block_timeout = block_timeout
+
+    def start(self, app):
+        if self._thread is not None or self.sink == 'off':
+            return
+        self._app = app
+        self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+        self._thread.start()
+        # Write what is still buffered on a normal shutdown
+        atexit.register(self.flush)
+
+    def record(self, action, actor_id=None, course_id=None, student_id=None, **details):
+        if self.sink == 'off':
+            return
+        event = {
+            'created_at': datetime.utcnow(),
+            'actor_id': actor_id if actor_id is not None else _request_actor(),
+            'action': action,
+            'course_id': course_id,
+            'student_id': student_id,
+            'details': details,
+        }
+        with self._condition:
+            self.recorded += 1
+            if len(self._buffer) >= self._buffer_size:
+                if self.overflow == 'block':
+                    self._condition.wait_for(lambda: len(self._buffer) < self._buffer_size,
+                                             self.block_timeout)
+                if len(self._buffer) >= self._buffer_size:
+                    self.dropped += 1
+                    if self.overflow == 'drop_oldest':
+                        self._buffer.popleft()
+                    else:
+                        return
+            self._buffer.append(event)
+            if len(self._buffer) >= self.batch_size:
+                self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                'sink': self.sink,
+                'recorded': self.recorded,
+                'written': self.written,
+                'dropped': self.dropped,
+                'pending': len(self._buffer),
+                'buffer_size': self._buffer_size,
+                'overflow': self.overflow,
+            }
+
+    def _take(self):
+        with self._condition:
+            batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+            self._condition.notify_all()
+            return batch
+
+    def _requeue(self, batch):
+        # Put a failed batch back in front, within the buffer bound
+        with self._condition:
+            room = max(self._buffer_size - len(self._buffer), 0)
+            self.dropped += len(batch) - min(room, len(batch))
+            self._buffer.extendleft(reversed(batch[:room]))
+
+    def _write(self, batch):
+        if self.sink == 'file':
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for event in batch:
+                    f.write(json.dumps(dict(event, created_at=event['created_at'].isoformat()),
+                                       separators=(',', ':')))
+                    f.write('\n')
+            return
+        rows = [dict(event, details=json.dumps(event['details'], separators=(',', ':')) if event['details'] else None)
+                for event in batch]
+        with self._app.app_context(), db.engine.begin() as connection:
+            connection.execute(AuditEvent.__table__.insert(), rows)
+
+    def flush(self):
+        # Write everything buffered so far. Returns False if a write failed;
+        # the failed batch stays buffered for the next attempt.
+        with self._write_lock:
+            while True:
+                batch = self._take()
+                if not batch:
+                    return True
+                try:
+                    self._write(batch)
+                except Exception as e:
+                    print(f"Error writing {len(batch)} audit events: {e}")
+                    self._requeue(batch)
+                    return False
+                with self._condition:
+                    self.written += len(batch)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: len(self._buffer) >= self.batch_size,
+                                         self.flush_interval)
+            if not self.flush():
+                # Back off instead of retrying a failing write in a loop
+                time.sleep(self.flush_interval)
+
+
+def _request_actor():
+    if not has_request_context():
+        return None
+    user = auth.current_user()
+    return user.id if user else None
+
+
+log = AuditLog()
+
+
+def init_app(app):
+    path = app.config.get('AUDIT_FILE') or os.path.join(app.instance_path, 'audit.jsonl')
+    if app.config.get('AUDIT_SINK', 'db') == 'file':
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    log.configure(sink=app.config.get('AUDIT_SINK', 'db'),
+                  path=path,
+                  buffer_size=app.config.get('AUDIT_BUFFER_SIZE', 10000),
+                  batch_size=app.config.get('AUDIT_BATCH_SIZE', 500),
+                  flush_interval=app.config.get('AUDIT_FLUSH_INTERVAL', 1.0),
+                  overflow=app.config.get('AUDIT_OVERFLOW', 'drop_oldest'),
+                  block_timeout=app.config.get('AUDIT_BLOCK_TIMEOUT', 0.05))
+
+
+def record(action, **fields):
+    log.record(action, **fields)
+
+
+def recent(course_id=None, student_id=None, before=None, limit=100):
+    # Newest first, walked backwards with `before` (the last id of a page)
+    query = AuditEvent.query
+    if course_id is not None:
+        query = query.filter(AuditEvent.course_id == course_id)
+    if student_id is not None:
+        query = query.filter(AuditEvent.student_id == student_id)
+    if before is not None:
+        query = query.filter(AuditEvent.id < before)
+    return [event.to_dict() for event in query.order_by(AuditEvent.id.desc()).limit(limit)]
@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from flask import g, session
+from models import db, User
+
+# Resolves the logged-in user once per request. Only the identity fields the
+# routes check (id, username, role) are kept, in a small process-wide cache,
+# so role checks normally need no database round trip. The admin views drop
+# an edited or deleted user's entry here and announce it through
+# cache_sync.py, so other server processes clear their caches within
+# CACHE_SYNC_INTERVAL; other changes show up after AUTH_CACHE_TTL.
+#
+#   AUTH_CACHE_TTL    seconds an identity is trusted (default 60)
+#   AUTH_CACHE_SIZE   identities kept per process (default 10000)
+
+
+class Identity(namedtuple('Identity', ['id', 'username', 'role'])):
+    __slots__ = ()
+
+    @classmethod
+    def from_user(cls, user):
+        return cls(user.id, user.username, user.role)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'username': self.username,
+            'role': self.role
+        }
+
+
+class IdentityCache:
+    # LRU of user_id -> Identity with a TTL, so changes made outside the admin
+    # views (which invalidate explicitly) are picked up after `ttl` seconds
+
+    def __init__(self, ttl=60, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            identity, expires = entry
+            if expires < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return identity
+
+    def put(self, identity):
+        with self._lock:
+            self._entries[identity.id] = (identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(identity.id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+identity_cache = IdentityCache()
+
+
+def init_app(app):
+    identity_cache.ttl = app.config.get('AUTH_CACHE_TTL', 60)
+    identity_cache.max_size = app.config.get('AUTH_CACHE_SIZE', 10000)
+
+
+def remember(user):
+    identity = Identity.from_user(user)
+    identity_cache.put(identity)
+    g.auth_identity = identity
+    return identity
+
+
+def invalidate(user_id):
+    identity_cache.invalidate(user_id)
+
+
+def current_user():
+    # Identity of the session's user, or None if not logged in / deleted
+    if 'auth_identity' in g:
+        return g.auth_identity
+
+    identity = None
+    user_id = session.get('user_id')
+    if user_id:
+        identity = identity_cache.get(user_id)
+        if identity is None:
+            row = (db.session.query(User.id, User.username, User.role)
+                   .filter(User.id == user_id)
+                   .first())
+            if row is not None:
+                identity = Identity(*row)
+                identity_cache.put(identity)
+
+    g.auth_identity = identity
+    return identity
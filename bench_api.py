@@ -0,0 +1,291 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import subprocess
+import tempfile
+import time
+
+# End-to-end benchmark of every API route through the Flask test client, on a
+# generated dataset (see generate_data.py) or an existing database. Routes in
+# app.url_map without a request here are listed at the end of a run. Reports
+# p50/p95/p99 latency, queries per request and throughput per route, and
+# writes them as JSON so runs on different commits can be compared:
+#
+#   python bench_api.py --size medium --output before.json
+#   python bench_api.py --size medium --output after.json --compare before.json
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def build_routes(app, db, rng):
+    # Each route is (name, role, make_request) where make_request returns
+    # (method, path, json body or None) for one call
+    from models import User, Course, enrollments
+    from generate_data import DEFAULT_PASSWORD
+
+    with app.app_context():
+        students = [row[0] for row in db.session.query(User.id).filter(User.role == 'student')
+                    .filter(User.password_hash.isnot(None)).limit(1000)]
+        teacher_courses = db.session.query(Course.teacher_id, Course.id).filter(Course.enrolled_count > 0).limit(1000).all()
+        course_ids = [row[0] for row in db.session.query(Course.id).limit(5000)]
+        full_courses = [row[0] for row in db.session.query(Course.id)
+                        .filter(Course.enrolled_count >= Course.capacity).limit(1000)]
+        roster = {course_id: [row[0] for row in db.session.query(enrollments.c.user_id)
+                              .filter(enrollments.c.course_id == course_id).limit(300)]
+                  for _, course_id in teacher_courses[:50]}
+        usernames = [row[0] for row in db.session.query(User.username).filter(User.id.in_(students[:50]))]
+        admin_id = db.session.query(User.id).filter(User.role == 'admin').scalar()
+
+    if not (students and teacher_courses and admin_id):
+        raise SystemExit('The database needs students, an admin and teachers with enrolled courses')
+
+    graded = [(teacher_id, course_id) for teacher_id, course_id in teacher_courses if roster.get(course_id)]
+    state = {'enrolled': [], 'waitlisted': []}
+
+    def teacher_course():
+        return rng.choice(graded)
+
+    def enroll():
+        student, course_id = rng.choice(students), rng.choice(course_ids)
+        state['enrolled'].append((student, course_id))
+        return student, 'POST', '/api/student/enroll', {'course_id': course_id}
+
+    def drop():
+        if state['enrolled']:
+            student, course_id = state['enrolled'].pop()
+        else:
+            student, course_id = rng.choice(students), rng.choice(course_ids)
+        return student, 'POST', '/api/student/drop', {'course_id': course_id}
+
+    def join_waitlist():
+        student, course_id = rng.choice(students), rng.choice(full_courses or course_ids)
+        state['waitlisted'].append((student, course_id))
+        return student, 'POST', '/api/student/waitlist', {'course_id': course_id}
+
+    def leave_waitlist():
+        if state['waitlisted']:
+            student, course_id = state['waitlisted'].pop()
+        else:
+            student, course_id = rng.choice(students), rng.choice(course_ids)
+        return student, 'POST', '/api/student/waitlist/leave', {'course_id': course_id}
+
+    def update_grade():
+        teacher_id, course_id = teacher_course()
+        return teacher_id, 'POST', '/api/teacher/update-grade', {
+            'course_id': course_id, 'student_id': rng.choice(roster[course_id]), 'value': rng.randint(50, 100)}
+
+    def batch_grades():
+        teacher_id, course_id = teacher_course()
+        return teacher_id, 'POST', '/api/teacher/grades', {
+            'course_id': course_id,
+            'grades': [{'student_id': s, 'value': rng.randint(50, 100)} for s in roster[course_id]]}
+
+    def as_student(method, path, body=None):
+        return lambda: (rng.choice(students), method, path() if callable(path) else path, body)
+
+    def as_teacher(path):
+        def make():
+            teacher_id, course_id = teacher_course()
+            return teacher_id, 'GET', path.format(course_id=course_id), None
+        return make
+
+    def as_admin(path):
+        return lambda: (admin_id, 'GET', path() if callable(path) else path, None)
+
+    def shared_path():
+        course_a, course_b = rng.sample(course_ids, 2) if len(course_ids) > 1 else course_ids * 2
+        return f'/api/admin/courses/{course_a}/shared/{course_b}'
+
+    return [
+        ('login', lambda: (None, 'POST', '/api/login',
+                           {'username': rng.choice(usernames), 'password': DEFAULT_PASSWORD})),
+        ('user', as_student('GET', '/api/user')),
+        ('courses', as_student('GET', '/api/courses')),
+        ('courses_search', as_student('GET', lambda: f'/api/courses/search?prefix={rng.choice("BCEHMP")}')),
+        ('courses_search_substring', as_student('GET', '/api/courses/search?q=ience')),
+        ('student_courses', as_student('GET', '/api/student/courses')),
+        ('student_waitlist', as_student('GET', '/api/student/waitlist')),
+        ('student_gpa', as_student('GET', '/api/student/gpa')),
+        ('transcript', as_student('GET', '/api/student/transcript')),
+        ('enroll', enroll),
+        ('drop', drop),
+        ('join_waitlist', join_waitlist),
+        ('leave_waitlist', leave_waitlist),
+        ('teacher_courses', as_teacher('/api/teacher/courses')),
+        ('teacher_course', as_teacher('/api/teacher/course/{course_id}')),
+        ('teacher_course_students', as_teacher('/api/teacher/course/{course_id}/students')),
+        ('teacher_course_stats', as_teacher('/api/teacher/course/{course_id}/stats')),
+        ('update_grade', update_grade),
+        ('batch_grades', batch_grades),
+        ('schedule_conflicts', as_admin('/api/admin/schedule-conflicts')),
+        ('export_grades', as_admin('/api/admin/export/grades?format=csv')),
+        ('export_rosters', as_admin('/api/admin/export/rosters?format=jsonl')),
+        ('shared_students', as_admin(shared_path)),
+        ('audit', as_admin('/api/admin/audit')),
+        ('request_stats', as_admin('/api/admin/stats')),
+        ('enrollment_index', as_admin('/api/admin/enrollment-index')),
+        ('admin_index', as_admin('/admin/')),
+        ('logout', lambda: (rng.choice(students), 'POST', '/api/logout', None)),
+    ]
+
+
+# Not benchmarked: a stream that never ends, a body upload and redirects.
+# Flask-Admin's own views live under /admin/ and are left out too.
+UNTIMED_ENDPOINTS = {'seat_stream', 'import_data', 'admin_index', 'admin_login', 'admin_logout',
+                     'login_page', 'static'}
+
+
+def missing_routes(app, routes):
+    # Rules of app.url_map that no entry of `routes` requests
+    from werkzeug.exceptions import HTTPException
+
+    adapter = app.url_map.bind('localhost')
+    covered = set()
+    for _, make_request in routes:
+        _, method, path, _ = make_request()
+        try:
+            covered.add(adapter.match(path.split('?')[0], method)[0])
+        except HTTPException:
+            pass
+    return sorted(rule.rule for rule in app.url_map.iter_rules()
+                  if rule.endpoint not in covered and rule.endpoint not in UNTIMED_ENDPOINTS
+                  and not rule.rule.startswith('/admin/'))
+
+
+def run(app, db, routes, requests_per_route, heavy_requests):
+    from sqlalchemy import event
+
+    queries = [0]
+    with app.app_context():
+        @event.listens_for(db.engine, 'before_cursor_execute')
+        def count_query(*args):
+            queries[0] += 1
+
+    client = app.test_client()
+    results = {}
+    for name, make_request in routes:
+        count = heavy_requests if name in ('login', 'schedule_conflicts') or name.startswith('export') \
+            else requests_per_route
+        latencies = []
+        query_counts = []
+        errors = 0
+        for _ in range(count):
+            user_id, method, path, body = make_request()
+            with client.session_transaction() as sess:
+                sess.clear()
+                if user_id is not None:
+                    sess['user_id'] = user_id
+            queries[0] = 0
+            start = time.perf_counter()
+            response = client.open(path, method=method, json=body)
+            response.get_data()
+            latencies.append(time.perf_counter() - start)
+            query_counts.append(queries[0])
+            if response.status_code >= 500:
+                errors += 1
+
+        latencies.sort()
+        total = sum(latencies)
+        results[name] = {
+            'requests': count,
+            'errors': errors,
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'queries_per_request': round(sum(query_counts) / count, 2),
+            'requests_per_second': round(count / total, 1) if total else None,
+        }
+        r = results[name]
+        print(f"{name:26} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  p99 {r['p99_ms']:8.2f} ms  "
+              f"{r['queries_per_request']:6.1f} q/req  {r['requests_per_second']:8.1f} req/s"
+              + (f"  {errors} errors" if errors else ''))
+    return results
+
+
+def compare(results, baseline_path, threshold):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    regressions = 0
+    for name, current in results.items():
+        before = baseline['routes'].get(name)
+        if not before:
+            continue
+        ratio = current['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 1
+        more_queries = current['queries_per_request'] > before['queries_per_request'] + 0.5
+        flag = ''
+        if ratio > 1 + threshold or more_queries:
+            flag = '  REGRESSION'
+            regressions += 1
+        print(f"{name:26} p95 {before['p95_ms']:8.2f} -> {current['p95_ms']:8.2f} ms ({ratio:5.2f}x)  "
+              f"queries {before['queries_per_request']:.1f} -> {current['queries_per_request']:.1f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every API route')
+    parser.add_argument('--database-url', help='benchmark an existing database instead of generating one')
+    parser.add_argument('--size', default='small', help='generate_data.py size preset')
+    parser.add_argument('--requests', type=int, default=200, help='requests per route')
+    parser.add_argument('--heavy-requests', type=int, default=10,
+                        help='requests for logins, exports and reports')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write results as JSON')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='p95 slowdown flagged as a regression')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    # One client makes every request, so lift the login throttle
+    os.environ['FLASK_LOGIN_USER_BURST'] = os.environ['FLASK_LOGIN_IP_BURST'] = '1000000'
+
+    from app import app, db
+    from generate_data import SIZES, generate
+
+    dataset = {'database_url': args.database_url}
+    if not args.database_url:
+        with app.app_context():
+            dataset = generate(seed=args.seed, **SIZES[args.size])
+        dataset['size'] = args.size
+
+    routes = build_routes(app, db, random.Random(args.seed))
+    print()
+    started = time.perf_counter()
+    results = run(app, db, routes, args.requests, args.heavy_requests)
+    print(f"\nTotal {time.perf_counter() - started:.1f}s")
+    missing = missing_routes(app, routes)
+    if missing:
+        print(f"Not benchmarked: {', '.join(missing)}")
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'dataset': dataset,
+        'routes': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
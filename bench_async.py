@@ -0,0 +1,212 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import time
+import bench_common
+
+# Sync vs async tier under many concurrent clients. Seeds a fresh database,
+# then runs the same load against the threaded Flask server (one thread per
+# connection) and against async_app.py under uvicorn (one coroutine per
+# connection), one server process each:
+#
+#   - `--streams` clients hold /api/courses/seats/stream open the whole time
+#   - `--clients` keep-alive clients loop on /api/courses (80%) and
+#     /api/student/courses (20%) for `--duration` seconds
+#
+# Reports throughput, latency, errors and the server's resident memory and
+# thread count at the end of the run. The clients share the machine with the
+# server, so compare the two tiers rather than reading absolute numbers.
+
+
+def _cookies(env, students):
+    # Signed Flask session cookies, so the clients skip the (deliberately
+    # slow) password check
+    os.environ.update(env)
+    from app import app, db
+    from models import User
+
+    serializer = app.session_interface.get_signing_serializer(app)
+    with app.app_context():
+        ids = [user_id for (user_id,) in db.session.query(User.id).filter(
+            User.username.like('bench_student%')).order_by(User.id).limit(students)]
+    return [f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': user_id})}" for user_id in ids]
+
+
+def _serve_async(env, port):
+    os.environ.update(env)
+    import uvicorn
+    from async_app import app
+
+    uvicorn.run(app, host='127.0.0.1', port=port, log_level='error', backlog=4096)
+
+
+TIERS = {
+    'sync': bench_common.serve,
+    'async': _serve_async,
+}
+
+
+def _process_stats(pid):
+    # (resident MiB, threads) from /proc, or None where that is unavailable
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f)
+    except OSError:
+        return None
+    return int(fields['VmRSS'].split()[0]) / 1024, int(fields['Threads'])
+
+
+class Connection:
+    # Minimal HTTP/1.1 keep-alive client, enough for these endpoints
+
+    def __init__(self, port, cookie):
+        self.port = port
+        self.cookie = cookie
+        self.reader = None
+        self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.reader = self.writer = None
+
+    async def get(self, path):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection('127.0.0.1', self.port)
+        self.writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {self.cookie}\r\n\r\n'.encode())
+        await self.writer.drain()
+
+        status = int((await self.reader.readuntil(b'\r\n')).split()[1])
+        headers = {}
+        while True:
+            line = await self.reader.readuntil(b'\r\n')
+            if line == b'\r\n':
+                break
+            name, value = line.decode().split(':', 1)
+            headers[name.strip().lower()] = value.strip().lower()
+
+        if headers.get('transfer-encoding') == 'chunked':
+            while True:
+                size = int((await self.reader.readuntil(b'\r\n')).split(b';')[0], 16)
+                await self.reader.readexactly(size + 2)
+                if not size:
+                    break
+        elif 'content-length' in headers:
+            await self.reader.readexactly(int(headers['content-length']))
+        elif status != 304:
+            await self.reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection') == 'close':
+            await self.close()
+        return status
+
+
+async def _stream(port, cookie, stop):
+    # Holds a seat stream open until the run ends
+    try:
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(f'GET /api/courses/seats/stream HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                     f'Cookie: {cookie}\r\n\r\n'.encode())
+        await writer.drain()
+        await reader.readuntil(b'\r\n\r\n')
+    except (OSError, asyncio.IncompleteReadError):
+        return False
+    await stop.wait()
+    writer.close()
+    return True
+
+
+async def _client(port, cookie, deadline, results, seed):
+    rng = random.Random(seed)
+    connection = Connection(port, cookie)
+    while time.monotonic() < deadline:
+        path = '/api/courses' if rng.random() < 0.8 else '/api/student/courses'
+        start = time.perf_counter()
+        try:
+            status = await asyncio.wait_for(connection.get(path), 30)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ValueError, IndexError):
+            status = 0
+            await connection.close()
+        results.append((path, status, time.perf_counter() - start))
+    await connection.close()
+
+
+async def _load(port, cookies, args):
+    stop = asyncio.Event()
+    streams = [asyncio.create_task(_stream(port, cookies[i % len(cookies)], stop))
+               for i in range(args.streams)]
+    # Let the streams connect before the clients start
+    await asyncio.sleep(1)
+
+    results = []
+    deadline = time.monotonic() + args.duration
+    await asyncio.gather(*(_client(port, cookies[i % len(cookies)], deadline, results, i)
+                           for i in range(args.clients)))
+    return results, stop, streams
+
+
+def run(name, env, cookies, args, port):
+    ctx = multiprocessing.get_context('spawn')
+    server = ctx.Process(target=TIERS[name], args=(env, port), daemon=True)
+    server.start()
+    try:
+        loop = asyncio.new_event_loop()
+        # Wait for the server to accept connections
+        for _ in range(300):
+            try:
+                loop.run_until_complete(Connection(port, cookies[0]).get('/api/user'))
+                break
+            except OSError:
+                time.sleep(0.1)
+
+        results, stop, streams = loop.run_until_complete(_load(port, cookies, args))
+        stats = _process_stats(server.pid)
+        stop.set()
+        connected = sum(loop.run_until_complete(asyncio.gather(*streams)))
+        loop.close()
+    finally:
+        server.terminate()
+        server.join()
+
+    ok = [elapsed for _, status, elapsed in results if status == 200]
+    errors = len(results) - len(ok)
+    line = (f"{name}: {len(ok) / args.duration:.0f} req/s, {errors} errors "
+            f"({args.clients} clients, {connected}/{args.streams} streams open, {args.duration}s)")
+    if stats:
+        line += f", server {stats[0]:.0f} MiB / {stats[1]} threads"
+    print(line)
+    for endpoint in ('/api/courses', '/api/student/courses'):
+        latencies = sorted(elapsed for path, status, elapsed in results if path == endpoint and status == 200)
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[int(len(latencies) * 0.99)] * 1000
+            print(f"  {endpoint}: {len(latencies)} ok, p50 {p50:.1f} ms, p99 {p99:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the sync and async API tiers under many concurrent clients')
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--streams', type=int, default=200, help='seat streams held open during the run')
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--port', type=int, default=5200)
+    parser.add_argument('--tier', choices=['sync', 'async', 'both'], default='both')
+    args = parser.parse_args()
+
+    env = {'DATABASE_URL': bench_common.temp_database_url()}
+    ctx = multiprocessing.get_context('spawn')
+    seeder = ctx.Process(target=bench_common.seed_process, args=(env, args.clients, args.courses, 50))
+    seeder.start()
+    seeder.join()
+    with ctx.Pool(1) as pool:
+        cookies = pool.apply(_cookies, (env, args.clients))
+
+    names = list(TIERS) if args.tier == 'both' else [args.tier]
+    for offset, name in enumerate(names):
+        run(name, env, cookies, args, args.port + offset)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+import logging
+import os
+import tempfile
+from timeslots import format_timeslot
+
+# Setup shared by the bench_*.py scripts: a throwaway SQLite database, the
+# bench_teacher and bench_student{i} accounts with a catalog of bench
+# courses, and the threaded server the multi-process benchmarks start.
+
+PASSWORD = 'x'
+
+
+def temp_database_url():
+    return 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+
+
+def use_temp_database():
+    # Throwaway SQLite database unless DATABASE_URL is already set; call
+    # before importing app
+    os.environ.setdefault('DATABASE_URL', temp_database_url())
+
+
+def bench_timeslot(index):
+    # Distinct 15-minute meetings, one every 20 minutes round the week, so a
+    # student can hold many bench courses without a schedule conflict
+    block = index // 7 % 72
+    return format_timeslot(1 << index % 7, block * 20, block * 20 + 15)
+
+
+def seed(students, courses, capacity=30):
+    # One teacher, `courses` courses and `students` students (password
+    # PASSWORD) in the current app context. Returns (teacher id, course ids,
+    # student ids).
+    from models import db, User, Course
+
+    teacher = User(username='bench_teacher', password=PASSWORD, role='teacher')
+    db.session.add(teacher)
+    db.session.flush()
+    course_rows = [Course(name=f'Bench {i}', capacity=capacity, timeslot=bench_timeslot(i),
+                          teacher_id=teacher.id) for i in range(courses)]
+    student_rows = [User(username=f'bench_student{i}', password=PASSWORD, role='student')
+                    for i in range(students)]
+    db.session.add_all(course_rows + student_rows)
+    db.session.commit()
+    return teacher.id, [c.id for c in course_rows], [s.id for s in student_rows]
+
+
+def seed_process(env, students, courses, capacity=30):
+    # seed() in a fresh process configured by `env`, for multiprocessing
+    os.environ.update(env)
+    from app import app
+
+    with app.app_context():
+        seed(students, courses, capacity)
+
+
+def serve(env, port):
+    # Threaded WSGI server for app.py, for multiprocessing
+    os.environ.update(env)
+    from werkzeug.serving import make_server
+    from app import app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
@@ -0,0 +1,70 @@
+import argparse
+import random
+import threading
+import time
+import bench_common
+
+# Multi-threaded enroll/drop stress test. Runs against a throwaway SQLite
+# database unless DATABASE_URL is already set, and checks that no course ever
+# ends up over capacity.
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress /api/student/enroll and /api/student/drop')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--students', type=int, default=200)
+    parser.add_argument('--courses', type=int, default=5)
+    parser.add_argument('--capacity', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=200, help='requests per thread')
+    args = parser.parse_args()
+
+    bench_common.use_temp_database()
+    from app import app, db
+    from models import Course, enrollments
+
+    with app.app_context():
+        _, course_ids, student_ids = bench_common.seed(args.students, args.courses, args.capacity)
+
+    statuses = {}
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        client = app.test_client()
+        local = {}
+        for _ in range(args.requests):
+            with client.session_transaction() as sess:
+                sess['user_id'] = rng.choice(student_ids)
+            path = '/api/student/enroll' if rng.random() < 0.7 else '/api/student/drop'
+            response = client.post(path, json={'course_id': rng.choice(course_ids)})
+            key = (path, response.status_code)
+            local[key] = local.get(key, 0) + 1
+        with lock:
+            for key, count in local.items():
+                statuses[key] = statuses.get(key, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.threads * args.requests
+    print(f"{total} requests from {args.threads} threads in {elapsed:.2f}s ({total / elapsed:.0f} req/s)")
+    for (path, status), count in sorted(statuses.items()):
+        print(f"  {path} {status}: {count}")
+
+    with app.app_context():
+        ok = True
+        for course in Course.query.filter(Course.id.in_(course_ids)):
+            actual = db.session.query(enrollments).filter(enrollments.c.course_id == course.id).count()
+            if actual > course.capacity or actual != course.enrolled_count:
+                ok = False
+            print(f"  {course.name}: {actual}/{course.capacity} enrolled (counter {course.enrolled_count})")
+        print('Capacity respected' if ok else 'CAPACITY VIOLATED')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+import argparse
+import time
+import bench_common
+
+# Compares posting a section's grades one request at a time through
+# /api/teacher/update-grade against a single /api/teacher/grades batch.
+# Runs against a throwaway SQLite database unless DATABASE_URL is set.
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark single vs batch grade submission')
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    bench_common.use_temp_database()
+    from app import app, db
+    from models import Course, enrollments
+
+    with app.app_context():
+        teacher_id, (course_id,), student_ids = bench_common.seed(args.students, 1, args.students)
+        db.session.execute(enrollments.insert(),
+                           [{'user_id': student_id, 'course_id': course_id} for student_id in student_ids])
+        db.session.get(Course, course_id).enrolled_count = args.students
+        db.session.commit()
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = teacher_id
+
+    for round_number in range(args.rounds):
+        value = 70.0 + round_number
+
+        start = time.perf_counter()
+        for student_id in student_ids:
+            response = client.post('/api/teacher/update-grade', json={
+                'course_id': course_id, 'student_id': student_id, 'value': value})
+            assert response.status_code == 200, response.json
+        single = time.perf_counter() - start
+
+        start = time.perf_counter()
+        response = client.post('/api/teacher/grades', json={
+            'course_id': course_id,
+            'grades': [{'student_id': s, 'value': value + 0.5} for s in student_ids]})
+        assert response.status_code == 200 and response.json['saved'] == len(student_ids), response.json
+        batch = time.perf_counter() - start
+
+        print(f"round {round_number + 1}: {len(student_ids)} grades, "
+              f"single {single * 1000:.0f} ms ({len(student_ids) / single:.0f} grades/s), "
+              f"batch {batch * 1000:.0f} ms ({len(student_ids) / batch:.0f} grades/s), "
+              f"{single / batch:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import random
+import time
+import bench_common
+
+# Loads a synthetic enrollments table into the in-memory enrollment index
+# (enrollment_index.py), then reports its memory per million enrollments and
+# times membership, roster size and shared-student queries against the same
+# queries in SQL. Enrollment rows are written directly, without users or
+# courses. Runs against a throwaway SQLite database unless DATABASE_URL is set.
+
+
+def _time(calls, function, *args_list):
+    start = time.perf_counter()
+    for args in args_list[:calls]:
+        function(*args)
+    return (time.perf_counter() - start) / min(calls, len(args_list)) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the in-memory enrollment index')
+    parser.add_argument('--students', type=int, default=200000)
+    parser.add_argument('--courses', type=int, default=5000)
+    parser.add_argument('--per-student', type=int, default=5)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    bench_common.use_temp_database()
+
+    from app import app, db
+    from models import enrollments
+    import enrollment_index
+
+    rng = random.Random(args.seed)
+    rows = [{'user_id': student_id, 'course_id': course_id}
+            for student_id in range(1, args.students + 1)
+            for course_id in rng.sample(range(1, args.courses + 1), args.per_student)]
+
+    with app.app_context():
+        db.session.execute(enrollments.insert(), rows)
+        db.session.commit()
+
+        index = enrollment_index.index
+        start = time.perf_counter()
+        index.load()
+        print(f"load: {index.size:,} enrollments in {time.perf_counter() - start:.2f}s")
+        memory = index.memory()
+        print(f"memory: {memory['bytes'] / 2 ** 20:.1f} MiB, {memory['bytes_per_enrollment']} bytes "
+              f"per enrollment, {memory['mib_per_million']} MiB per million enrollments")
+
+        pairs = [(row['user_id'], row['course_id'] if i % 2 else rng.randint(1, args.courses))
+                 for i, row in enumerate(rng.sample(rows, args.queries))]
+        courses = [(rng.randint(1, args.courses),) for _ in range(args.queries)]
+        sections = [(rng.randint(1, args.courses), rng.randint(1, args.courses)) for _ in range(args.queries)]
+
+        # With the index disabled the module helpers answer in SQL
+        enrollment_index.enabled = False
+        for name, calls, in_memory, in_sql in (
+                ('membership', pairs, index.contains, enrollment_index.is_enrolled),
+                ('roster size', courses, index.roster_size, enrollment_index.roster_size),
+                ('shared students', sections, index.shared, enrollment_index.shared_students)):
+            memory_us = _time(args.queries, in_memory, *calls)
+            sql_us = _time(args.queries // 10, in_sql, *calls)
+            print(f"{name}: {memory_us:.1f} us in memory, {sql_us:.0f} us in SQL")
+
+
+if __name__ == '__main__':
+    main()
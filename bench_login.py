@@ -0,0 +1,66 @@
+import argparse
+import os
+import threading
+import time
+import bench_common
+
+# Logins/sec through /api/login at the configured hash cost, with login
+# throttling relaxed so only the KDF pool limits throughput. Runs against a
+# throwaway SQLite database unless DATABASE_URL is set.
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark /api/login throughput')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--logins', type=int, default=20, help='logins per thread')
+    parser.add_argument('--method', help='PASSWORD_HASH_METHOD, e.g. scrypt:16384:8:1')
+    parser.add_argument('--kdf-workers', type=int, help='PASSWORD_KDF_WORKERS')
+    args = parser.parse_args()
+
+    bench_common.use_temp_database()
+    os.environ['FLASK_LOGIN_USER_BURST'] = os.environ['FLASK_LOGIN_IP_BURST'] = '1000000'
+    if args.method:
+        os.environ['FLASK_PASSWORD_HASH_METHOD'] = args.method
+    if args.kdf_workers:
+        os.environ['FLASK_PASSWORD_KDF_WORKERS'] = str(args.kdf_workers)
+    os.environ.setdefault('FLASK_PASSWORD_KDF_QUEUE', '1000000')
+
+    from app import app, db
+    from models import User
+    import passwords
+
+    with app.app_context():
+        # One hash shared by all users keeps setup fast; each login still
+        # pays for a full verification
+        password_hash = passwords.hash_password('bench-password')
+        users = [User(username=f'bench_user{i}', password='', password_hash=password_hash, role='student')
+                 for i in range(args.threads)]
+        db.session.add_all(users)
+        db.session.commit()
+
+    failures = []
+
+    def worker(index):
+        client = app.test_client()
+        for _ in range(args.logins):
+            response = client.post('/api/login', json={'username': f'bench_user{index}',
+                                                       'password': 'bench-password'})
+            if response.status_code != 200:
+                failures.append(response.status_code)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    total = args.threads * args.logins
+    print(f"{passwords.hash_method}: {total} logins from {args.threads} threads in {elapsed:.2f}s "
+          f"({total / elapsed:.1f} logins/s, {app.config.get('PASSWORD_KDF_WORKERS', 4)} KDF workers)")
+    if failures:
+        print(f"  {len(failures)} failed logins: {sorted(set(failures))}")
+
+
+if __name__ == '__main__':
+    main()
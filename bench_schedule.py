@@ -0,0 +1,68 @@
+import argparse
+import random
+import time
+from schedule import WeeklySchedule, sweep_conflicts
+from timeslots import parse_timeslot
+
+# Timing for the in-memory parts of the schedule conflict engine on synthetic
+# data: the single-pass conflict sweep over every enrollment, and lookups in
+# the per-day interval index that waitlist promotion builds for its
+# candidates. (Enroll itself checks with one SQL query, see schedule.py.)
+
+DAY_PATTERNS = ['MW', 'TTH', 'MWF', 'F', 'MF', 'T', 'TH', 'W']
+
+
+def random_timeslot(rng):
+    start = rng.randrange(8 * 60, 20 * 60, 30)
+    end = start + rng.choice([50, 75, 90, 110])
+
+    def clock(minutes):
+        hour, minute = divmod(minutes, 60)
+        return f"{(hour - 1) % 12 + 1}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
+
+    return f"{rng.choice(DAY_PATTERNS)} {clock(start)} - {clock(end)}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark schedule conflict detection')
+    parser.add_argument('--students', type=int, default=50000)
+    parser.add_argument('--courses', type=int, default=3000)
+    parser.add_argument('--per-student', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    slots = [parse_timeslot(random_timeslot(rng)) for _ in range(args.courses)]
+
+    rows = []
+    for student_id in range(args.students):
+        for course_id in rng.sample(range(args.courses), args.per_student):
+            rows.append((student_id, course_id) + slots[course_id])
+
+    start = time.perf_counter()
+    conflicts = sum(1 for _ in sweep_conflicts(rows))
+    elapsed = time.perf_counter() - start
+    print(f"sweep: {len(rows)} enrollments of {args.students} students in {elapsed * 1000:.0f} ms "
+          f"({len(rows) / elapsed:,.0f} enrollments/s), {conflicts} clashing pairs")
+
+    # Checks against each student's index, grown one accepted course at a
+    # time and rejecting clashes
+    start = time.perf_counter()
+    checks = rejected = 0
+    index = None
+    current = None
+    for student_id, course_id, days, begin, end in rows:
+        if student_id != current:
+            index, current = WeeklySchedule(), student_id
+        checks += 1
+        if index.conflicts(days, begin, end):
+            rejected += 1
+        else:
+            index.add(course_id, days, begin, end)
+    elapsed = time.perf_counter() - start
+    print(f"index checks: {checks} in {elapsed * 1000:.0f} ms "
+          f"({elapsed / checks * 1e6:.1f} us per check), {rejected} rejected")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+import argparse
+import http.cookiejar
+import json
+import multiprocessing
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+import bench_common
+
+# Multi-process load test: N server processes (each a threaded WSGI server on
+# its own port) x M client threads hitting /api/courses and
+# /api/student/enroll. Runs once on SQLAlchemy's and SQLite's defaults
+# (DB_TUNING=0: no pool settings, busy timeout or pragmas) and once tuned,
+# each on a fresh database file.
+
+CONFIGS = {
+    'default': {'DB_TUNING': '0'},
+    'tuned': {'DB_TUNING': '1'},
+}
+
+
+def _wait_for(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/user', timeout=1)
+            return
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.1)
+    raise RuntimeError(f'server on port {port} did not start')
+
+
+def _client(base_url, username, course_count, deadline, results, lock):
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def call(path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(base_url + path, data=data,
+                                     headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with opener.open(req, timeout=30) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            status = e.code
+        except (urllib.error.URLError, ConnectionError):
+            status = 0
+        return status, time.perf_counter() - start
+
+    call('/api/login', {'username': username, 'password': bench_common.PASSWORD})
+    rng = random.Random(username)
+    local = []
+    while time.monotonic() < deadline:
+        if rng.random() < 0.8:
+            path = '/api/courses'
+            status, elapsed = call(path)
+        else:
+            path = '/api/student/enroll'
+            status, elapsed = call(path, {'course_id': rng.randint(1, course_count)})
+        local.append((path, status, elapsed))
+    with lock:
+        results.extend(local)
+
+
+def run(name, env, args, port):
+    ctx = multiprocessing.get_context('spawn')
+    # All clients log in from 127.0.0.1, so lift the per-IP login throttle
+    env = dict(env, DATABASE_URL=bench_common.temp_database_url(), FLASK_LOGIN_IP_BURST='1000000')
+
+    seeder = ctx.Process(target=bench_common.seed_process, args=(env, args.clients, args.courses, args.capacity))
+    seeder.start()
+    seeder.join()
+
+    servers = [ctx.Process(target=bench_common.serve, args=(env, port + i), daemon=True) for i in range(args.workers)]
+    for server in servers:
+        server.start()
+    try:
+        for i in range(args.workers):
+            _wait_for(port + i)
+
+        results = []
+        lock = threading.Lock()
+        deadline = time.monotonic() + args.duration
+        clients = [threading.Thread(target=_client, args=(
+            f'http://127.0.0.1:{port + i % args.workers}', f'bench_student{i}',
+            args.courses, deadline, results, lock)) for i in range(args.clients)]
+        for client in clients:
+            client.start()
+        for client in clients:
+            client.join()
+    finally:
+        for server in servers:
+            server.terminate()
+            server.join()
+
+    print(f"{name}: {len(results) / args.duration:.0f} req/s "
+          f"({args.workers} workers x {args.clients} clients, {args.duration}s)")
+    for endpoint in ('/api/courses', '/api/student/enroll'):
+        latencies = sorted(elapsed for path, _, elapsed in results if path == endpoint)
+        errors = sum(1 for path, status, _ in results if path == endpoint and (status == 0 or status >= 500))
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[int(len(latencies) * 0.95)] * 1000
+            print(f"  {endpoint}: {len(latencies)} requests, p50 {p50:.1f} ms, p95 {p95:.1f} ms, "
+                  f"{errors} errors")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare default and tuned database settings under load')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--courses', type=int, default=200)
+    parser.add_argument('--capacity', type=int, default=30)
+    parser.add_argument('--port', type=int, default=5100)
+    parser.add_argument('--config', choices=['default', 'tuned', 'both'], default='both')
+    args = parser.parse_args()
+
+    names = list(CONFIGS) if args.config == 'both' else [args.config]
+    for offset, name in enumerate(names):
+        run(name, CONFIGS[name], args, args.port + offset * args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+import argparse
+import csv
+import json
+import os
+import time
+from itertools import islice
+from models import db, User, Course, enrollments
+from timeslots import parse_timeslot
+import passwords
+import audit
+import catalog
+import dashboards
+import enrollment_index
+import seats
+import cache_sync
+
+# Bulk loading of a term's users, courses and enrollments from CSV or JSON
+# Lines. Input is read as a stream and written in chunks with Core
+# executemany inserts, one transaction per chunk. Usernames and courses are
+# resolved through in-memory maps and capacity is checked per chunk in
+# aggregate, so no row costs its own query.
+#
+#   users:        username, role, password (hashed on the login KDF pool) or
+#                 password_hash
+#   courses:      name, capacity, timeslot, teacher (username)
+#   enrollments:  username, course_id or course (name, must be unique)
+
+KINDS = ('users', 'courses', 'enrollments')
+ROLES = ('student', 'teacher', 'admin')
+MAX_REPORTED_ERRORS = 100
+
+
+def read_records(stream, fmt):
+    # Dicts from a text stream, one per CSV row or JSON line
+    if fmt == 'csv':
+        yield from csv.DictReader(stream)
+    elif fmt == 'jsonl':
+        for line in stream:
+            if line.strip():
+                record = json.loads(line)
+                if not isinstance(record, dict):
+                    raise ValueError('each JSON line must be an object')
+                yield record
+    else:
+        raise ValueError(f'Unknown format {fmt}')
+
+
+class ImportStats:
+
+    def __init__(self, kind, skipped=0):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.rows = skipped
+        self.resumed_at = skipped
+        self.inserted = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, row_number, message):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row_number, 'error': message})
+
+    def to_dict(self):
+        elapsed = time.perf_counter() - self.started
+        processed = self.rows - self.resumed_at
+        return {
+            'kind': self.kind,
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'rejected': self.rejected,
+            'errors': sorted(self.errors, key=lambda error: error['row']),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(processed / elapsed) if elapsed else None,
+        }
+
+
+def _username_map():
+    return dict(db.session.query(User.username, User.id))
+
+
+def _import_users(chunk, stats, state):
+    usernames = state.setdefault('usernames', _username_map())
+    rows = []
+    for row_number, record in chunk:
+        username = (record.get('username') or '').strip()
+        role = (record.get('role') or '').strip()
+        if not username or role not in ROLES:
+            stats.reject(row_number, 'username and a valid role are required')
+            continue
+        if username in usernames:
+            stats.reject(row_number, f'Username {username} already exists')
+            continue
+        password_hash = record.get('password_hash') or None
+        password = None if password_hash else record.get('password') or None
+        if not password and not password_hash:
+            stats.reject(row_number, 'password or password_hash is required')
+            continue
+        usernames[username] = None
+        rows.append({'username': username, 'role': role,
+                     'password': password, 'password_hash': password_hash})
+
+    # Plaintext passwords are hashed here and never stored
+    plaintext = [row for row in rows if row['password'] is not None]
+    for row, password_hash in zip(plaintext, passwords.hash_passwords([row['password'] for row in plaintext])):
+        row['password_hash'] = password_hash
+    for row in rows:
+        row['password'] = ''
+
+    if rows:
+        db.session.execute(User.__table__.insert(), rows)
+        new_ids = db.session.query(User.username, User.id).filter(
+            User.username.in_([row['username'] for row in rows]))
+        usernames.update(new_ids)
+    return len(rows)
+
+
+def _import_courses(chunk, stats, state):
+    usernames = state.setdefault('usernames', _username_map())
+    rows = []
+    for row_number, record in chunk:
+        teacher_id = usernames.get((record.get('teacher') or '').strip())
+        try:
+            capacity = int(record.get('capacity'))
+        except (TypeError, ValueError):
+            capacity = None
+        name = (record.get('name') or '').strip()
+        timeslot = (record.get('timeslot') or '').strip()
+        if not name or not timeslot or capacity is None or capacity < 0:
+            stats.reject(row_number, 'name, timeslot and a non-negative capacity are required')
+            continue
+        if teacher_id is None:
+            stats.reject(row_number, f"Unknown teacher {record.get('teacher')}")
+            continue
+        # Core inserts skip Course's timeslot validator, so parse here
+        days, start, end = parse_timeslot(timeslot) or (None, None, None)
+        rows.append({'name': name, 'capacity': capacity, 'timeslot': timeslot,
+                     'teacher_id': teacher_id, 'enrolled_count': 0,
+                     'meeting_days': days, 'start_minute': start, 'end_minute': end})
+
+    if rows:
+        db.session.execute(Course.__table__.insert(), rows)
+    return len(rows)
+
+
+def _course_maps():
+    seats = {}
+    names = {}
+    for course_id, name, free in db.session.query(Course.id, Course.name,
+                                                  Course.capacity - Course.enrolled_count):
+        seats[course_id] = free
+        # None marks a name shared by several courses
+        names[name] = None if name in names else course_id
+    return seats, names
+
+
+def _import_enrollments(chunk, stats, state):
+    usernames = state.setdefault('usernames', _username_map())
+    if 'seats' not in state:
+        state['seats'], state['course_names'] = _course_maps()
+    seats, course_names = state['seats'], state['course_names']
+
+    candidates = []
+    for row_number, record in chunk:
+        user_id = usernames.get((record.get('username') or '').strip())
+        if user_id is None:
+            stats.reject(row_number, f"Unknown user {record.get('username')}")
+            continue
+        course_id = record.get('course_id')
+        if course_id not in (None, ''):
+            try:
+                course_id = int(course_id)
+            except (TypeError, ValueError):
+                course_id = None
+        else:
+            course_id = course_names.get((record.get('course') or '').strip())
+        if course_id not in seats:
+            stats.reject(row_number, 'Unknown or ambiguous course')
+            continue
+        candidates.append((row_number, user_id, course_id))
+
+    # Existing enrollments of this chunk's students, in one query
+    existing = set()
+    if candidates:
+        existing = set(db.session.query(enrollments.c.user_id, enrollments.c.course_id).filter(
+            enrollments.c.user_id.in_({user_id for _, user_id, _ in candidates})))
+
+    # The seat map turns most overflow away without a query
+    by_course = {}
+    for row_number, user_id, course_id in candidates:
+        if (user_id, course_id) in existing:
+            stats.reject(row_number, 'Already enrolled')
+            continue
+        if seats[course_id] <= 0:
+            stats.reject(row_number, 'Course is full')
+            continue
+        existing.add((user_id, course_id))
+        seats[course_id] -= 1
+        by_course.setdefault(course_id, []).append((row_number, user_id))
+
+    # The map was read when the import started and live enrollments may have
+    # taken seats since, so each course's seats are taken with the same
+    # guarded UPDATE as enrollment.enroll. When it fails the current count is
+    # read and only the rows that still fit go in.
+    rows = []
+    for course_id, entries in by_course.items():
+        while entries:
+            reserved = db.session.execute(
+                db.update(Course)
+                .where(Course.id == course_id,
+                       Course.enrolled_count + len(entries) <= Course.capacity)
+                .values(enrolled_count=Course.enrolled_count + len(entries))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if reserved:
+                break
+            free = max(db.session.query(Course.capacity - Course.enrolled_count)
+                       .filter(Course.id == course_id).scalar() or 0, 0)
+            for row_number, user_id in entries[free:]:
+                stats.reject(row_number, 'Course is full')
+            entries = entries[:free]
+            seats[course_id] = 0
+        rows.extend({'user_id': user_id, 'course_id': course_id} for _, user_id in entries)
+
+    if rows:
+        db.session.execute(enrollments.insert(), rows)
+    return len(rows)
+
+
+_IMPORTERS = {
+    'users': _import_users,
+    'courses': _import_courses,
+    'enrollments': _import_enrollments,
+}
+
+
+def run_import(kind, records, chunk_size=5000, skip=0, on_chunk=None):
+    # Imports `records` (an iterable of dicts), skipping the first `skip`
+    # already-imported ones. Commits after each chunk and calls
+    # on_chunk(rows_done) so callers can persist progress.
+    importer = _IMPORTERS[kind]
+    stats = ImportStats(kind, skipped=skip)
+    state = {}
+    numbered = enumerate(records, start=1)
+    for _ in islice(numbered, skip):
+        pass
+
+    while True:
+        chunk = list(islice(numbered, chunk_size))
+        if not chunk:
+            break
+        try:
+            stats.inserted += importer(chunk, stats, state)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        stats.rows = chunk[-1][0]
+        if on_chunk:
+            on_chunk(stats.rows)
+
+    return stats
+
+
+def finish(kind, stats):
+    # Shared by the HTTP endpoint and the CLI: records the import and drops
+    # the caches it made stale, in this process and (through cache_sync.py)
+    # in every running server. Returns the stats as a dict.
+    result = stats.to_dict()
+    audit.record('import', kind=kind, inserted=result['inserted'], rejected=result['rejected'])
+    catalog.bump()
+    dashboards.clear()
+    enrollment_index.reload()
+    seats.resync()
+    cache_sync.announce(cache_sync.DATA)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import users, courses or enrollments')
+    parser.add_argument('kind', choices=KINDS)
+    parser.add_argument('path')
+    parser.add_argument('--format', choices=['csv', 'jsonl'],
+                        help='defaults to the file extension')
+    parser.add_argument('--chunk-size', type=int, default=5000)
+    parser.add_argument('--resume', action='store_true',
+                        help='continue after the rows recorded in PATH.progress')
+    args = parser.parse_args()
+
+    fmt = args.format or os.path.splitext(args.path)[1].lstrip('.').lower()
+    progress_path = args.path + '.progress'
+    skip = 0
+    if args.resume and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            progress = json.load(f)
+        if progress.get('kind') == args.kind:
+            skip = progress['rows_done']
+
+    def save_progress(rows_done):
+        with open(progress_path, 'w') as f:
+            json.dump({'kind': args.kind, 'rows_done': rows_done}, f)
+        print(f"  {rows_done} rows committed")
+
+    from app import app
+    with app.app_context(), open(args.path, newline='', encoding='utf-8') as stream:
+        stats = run_import(args.kind, read_records(stream, fmt), args.chunk_size, skip, save_progress)
+        result = finish(args.kind, stats)
+
+    print(f"Imported {result['inserted']} {args.kind} ({result['rejected']} rejected) "
+          f"in {result['seconds']}s, {result['rows_per_second']} rows/s")
+    for error in result['errors'][:10]:
+        print(f"  row {error['row']}: {error['error']}")
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+
+
+if __name__ == '__main__':
+    main()
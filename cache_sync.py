@@ -0,0 +1,101 @@
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from models import db, CacheVersion
+import catalog
+import dashboards
+import enrollment_index
+import seats
+import auth
+
+# Cross-process invalidation of the in-process caches. The catalog snapshot,
+# the dashboards, the enrollment index, the seat feed and the identity cache
+# live in each server process, so a change made somewhere else (archive.py, a CLI import, another
+# worker) would otherwise only show up as their TTLs run out, or never for the
+# enrollment index. Such changes call announce() after they commit, which
+# bumps a counter row in cache_versions; a thread in every server process
+# reads the rows every CACHE_SYNC_INTERVAL seconds and drops its own caches
+# when a counter moves.
+#
+#   CACHE_SYNC_INTERVAL   seconds between polls (default 1; 0 turns it off)
+
+DATA = 'data'
+IDENTITIES = 'identities'
+
+
+def _drop_data():
+    # Courses, enrollments or grades changed in bulk
+    catalog.bump()
+    dashboards.cache.clear(shared=False)
+    enrollment_index.reload()
+    seats.resync()
+
+
+def _drop_identities():
+    # A user's role or username changed, or the user was deleted
+    auth.identity_cache.clear()
+
+
+HANDLERS = {
+    DATA: _drop_data,
+    IDENTITIES: _drop_identities,
+}
+
+
+class CacheSync:
+
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self._versions = None
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None or not self.interval:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='cache-sync', daemon=True)
+        self._thread.start()
+
+    def poll(self):
+        versions = dict(db.session.query(CacheVersion.name, CacheVersion.version))
+        db.session.rollback()
+        previous, self._versions = self._versions, versions
+        if previous is None:
+            return
+        for name, handler in HANDLERS.items():
+            if versions.get(name) != previous.get(name):
+                handler()
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.poll()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error polling cache versions: {e}")
+            time.sleep(self.interval)
+
+
+sync = CacheSync()
+
+
+def init_app(app):
+    sync.interval = app.config.get('CACHE_SYNC_INTERVAL', 1.0)
+
+
+def announce(*names):
+    # Commits. Call after the change itself has committed.
+    for name in names:
+        table = CacheVersion.__table__
+        bumped = db.session.execute(
+            table.update().where(table.c.name == name).values(version=table.c.version + 1)).rowcount
+        if not bumped:
+            try:
+                db.session.execute(table.insert().values(name=name, version=1))
+            except IntegrityError:
+                # Another process created the row first
+                db.session.rollback()
+                db.session.execute(
+                    table.update().where(table.c.name == name).values(version=table.c.version + 1))
+        db.session.commit()
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import threading
+import time
+from collections import namedtuple
+from queries import course_summaries
+
+# In-process snapshot of the course catalog for /api/courses. The write paths
+# call bump() when courses, enrollments or teacher names change; the next read
+# rebuilds the snapshot once and every other read is served from memory as
+# pre-encoded JSON with a strong ETag.
+#
+# Each worker process has its own counter, so with several workers a change
+# made on another worker is picked up after CATALOG_MAX_AGE seconds.
+
+Snapshot = namedtuple('Snapshot', ['version', 'built_at', 'courses', 'body', 'etag'])
+
+
+def make_snapshot(version, courses):
+    body = json.dumps(courses, separators=(',', ':')).encode()
+    return Snapshot(version, time.monotonic(), courses, body, hashlib.sha1(body).hexdigest())
+
+
+class CatalogCache:
+
+    def __init__(self, max_age=5):
+        self.max_age = max_age
+        self._version = 0
+        self._snapshot = None
+        self._version_lock = threading.Lock()
+        self._build_lock = threading.Lock()
+
+    def bump(self):
+        with self._version_lock:
+            self._version += 1
+
+    def _is_fresh(self, snapshot):
+        if snapshot is None or snapshot.version != self._version:
+            return False
+        return not self.max_age or time.monotonic() - snapshot.built_at < self.max_age
+
+    def snapshot(self):
+        snapshot = self._snapshot
+        if self._is_fresh(snapshot):
+            return snapshot
+
+        # One rebuild at a time; requests that waited reuse its result
+        with self._build_lock:
+            snapshot = self._snapshot
+            if self._is_fresh(snapshot):
+                return snapshot
+
+            # Read the version first, so a bump during the build forces
+            # another rebuild rather than being lost
+            version = self._version
+            snapshot = make_snapshot(version, course_summaries())
+            self._snapshot = snapshot
+
+        return snapshot
+
+    def courses(self):
+        # Shared list of course dicts; callers must copy before modifying
+        return self.snapshot().courses
+
+
+cache = CatalogCache()
+
+
+def init_app(app):
+    cache.max_age = app.config.get('CATALOG_MAX_AGE', 5)
+
+
+def bump():
+    cache.bump()
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from models import db
+from queries import enrolled_course_ids_query, student_grades_query, build_dashboard
+import catalog
+
+# Materialized /api/student/courses and /api/teacher/courses payloads, kept
+# per user as pre-encoded JSON with an ETag, so a repeat visit is one cache
+# lookup.
+#
+# A payload is the catalog snapshot (catalog.py) combined with the user's own
+# rows. Each entry remembers the catalog version it was built from; course
+# edits, capacity changes and every seat taken bump the catalog, and the
+# affected payloads are re-combined in memory on their next read. A student's
+# own rows (enrolled course ids and grades) are read from the database only
+# after invalidate() was called for that student by a route that changed them.
+# Teacher payloads are the teacher's courses from the catalog, so they have
+# no rows of their own.
+#
+# Invalidation is per process, like the catalog: with several workers a
+# change made on another worker shows up after DASHBOARD_CACHE_TTL seconds.
+# DASHBOARD_CACHE_PATH adds a second level in a separate SQLite file shared by
+# every worker on the host; it holds the students' own rows, so a worker that
+# misses in memory skips the two queries against the main database. Rows
+# there are versioned and expire, see DiskStore.
+#
+#   DASHBOARD_CACHE_TTL         seconds an entry is trusted (default 5)
+#   DASHBOARD_CACHE_SIZE        entries kept in memory, LRU (default 10000)
+#   DASHBOARD_CACHE_PATH        SQLite file for the shared level (default: off)
+#   DASHBOARD_CACHE_SHARED_TTL  seconds a shared row is trusted (default 300)
+
+Entry = namedtuple('Entry', ['rows', 'version', 'body', 'etag', 'expires'])
+
+
+class DiskStore:
+    # student_id -> the student's own rows, as JSON, with a version and an
+    # expiry. An invalidation leaves an empty row with the next version, and
+    # put() only writes if the version read by get() is still current, so rows
+    # a worker read from the database before another worker's change never
+    # replace it. The expiry bounds whatever slips past that, such as a put
+    # racing clear() for a student without a row.
+
+    def __init__(self, path, ttl=300):
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # Unversioned layout of earlier releases; it only ever held copies
+        self._connection.execute('DROP TABLE IF EXISTS student_rows')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS student_cache (student_id INTEGER PRIMARY KEY, '
+            'version INTEGER NOT NULL, data TEXT, expires REAL)')
+        self._lock = threading.Lock()
+
+    def get(self, student_id):
+        # (rows or None, version to hand back to put)
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT version, data, expires FROM student_cache WHERE student_id = ?', (student_id,)).fetchone()
+        if row is None:
+            return None, 0
+        version, data, expires = row
+        if data is None or expires < time.time():
+            return None, version
+        data = json.loads(data)
+        return (set(data['enrolled']), {int(course_id): value for course_id, value in data['grades'].items()}), version
+
+    def put(self, student_id, version, rows):
+        enrolled, grades = rows
+        data = json.dumps({'enrolled': sorted(enrolled), 'grades': grades}, separators=(',', ':'))
+        with self._lock:
+            self._connection.execute(
+                'INSERT INTO student_cache (student_id, version, data, expires) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT (student_id) DO UPDATE SET data = excluded.data, expires = excluded.expires '
+                'WHERE student_cache.version = excluded.version',
+                (student_id, version, data, time.time() + self.ttl))
+
+    def delete(self, student_ids):
+        with self._lock:
+            self._connection.executemany(
+                'INSERT INTO student_cache (student_id, version) VALUES (?, 1) '
+                'ON CONFLICT (student_id) DO UPDATE SET version = version + 1, data = NULL, expires = NULL',
+                [(student_id,) for student_id in student_ids])
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute('UPDATE student_cache SET version = version + 1, data = NULL, expires = NULL')
+
+
+def _encode(payload, rows, version, expires):
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    return Entry(rows, version, body, hashlib.sha1(body).hexdigest(), expires)
+
+
+def _student_rows(student_id):
+    enrolled = set(db.session.scalars(enrolled_course_ids_query(student_id)))
+    grades = dict(db.session.execute(student_grades_query(student_id)).all())
+    return enrolled, grades
+
+
+class DashboardCache:
+
+    def __init__(self, ttl=5, max_size=10000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.store = None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Bumped by every invalidation; an entry built from rows read before
+        # an invalidation is served once but not stored
+        self._generation = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry.expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def _put(self, key, entry, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def student(self, student_id):
+        snapshot = catalog.cache.snapshot()
+        key = ('student', student_id)
+        generation = self._generation
+        entry = self._get(key)
+        if entry is not None and entry.version == snapshot.etag:
+            self.hits += 1
+            return entry
+        self.misses += 1
+
+        # Rows reused for a newer catalog keep their original expiry
+        rows, expires = (entry.rows, entry.expires) if entry is not None else (None, time.monotonic() + self.ttl)
+        if rows is None and self.store is not None:
+            rows, stored_version = self.store.get(student_id)
+            if rows is None:
+                rows = _student_rows(student_id)
+                if generation == self._generation:
+                    self.store.put(student_id, stored_version, rows)
+        if rows is None:
+            rows = _student_rows(student_id)
+
+        entry = _encode(build_dashboard(snapshot.courses, *rows), rows, snapshot.etag, expires)
+        self._put(key, entry, generation)
+        return entry
+
+    def teacher(self, teacher_id):
+        snapshot = catalog.cache.snapshot()
+        key = ('teacher', teacher_id)
+        generation = self._generation
+        entry = self._get(key)
+        if entry is not None and entry.version == snapshot.etag:
+            self.hits += 1
+            return entry
+        self.misses += 1
+
+        courses = [course for course in snapshot.courses if course['teacher_id'] == teacher_id]
+        entry = _encode(courses, None, snapshot.etag, time.monotonic() + self.ttl)
+        self._put(key, entry, generation)
+        return entry
+
+    def invalidate(self, *student_ids):
+        if not student_ids:
+            return
+        with self._lock:
+            self._generation += 1
+            for student_id in student_ids:
+                self._entries.pop(('student', student_id), None)
+        if self.store is not None:
+            self.store.delete(student_ids)
+
+    def clear(self, shared=True):
+        # shared=False keeps the SQLite level, for a process reacting to a
+        # clear another process already made there
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+        if shared and self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'shared': self.store is not None,
+            }
+
+
+cache = DashboardCache()
+
+
+def init_app(app):
+    cache.ttl = app.config.get('DASHBOARD_CACHE_TTL', 5)
+    cache.max_size = app.config.get('DASHBOARD_CACHE_SIZE', 10000)
+    path = app.config.get('DASHBOARD_CACHE_PATH')
+    cache.store = DiskStore(path, app.config.get('DASHBOARD_CACHE_SHARED_TTL', 300)) if path else None
+
+
+def invalidate(*student_ids):
+    cache.invalidate(*student_ids)
+
+
+def clear():
+    cache.clear()
@@ -0,0 +1,114 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from models import db
+
+# Engine configuration from the environment, so the same code can run on the
+# bundled SQLite file or a shared server database behind several workers.
+#
+#   DATABASE_URL            SQLAlchemy URL (default sqlite:///student_enrollment.db)
+#   DB_POOL_SIZE            persistent connections per worker process (default 5)
+#   DB_MAX_OVERFLOW         extra connections allowed under burst (default 10)
+#   DB_POOL_TIMEOUT         seconds to wait for a free connection (default 30)
+#   DB_POOL_RECYCLE         seconds before a connection is replaced (default 1800)
+#   DB_POOL_PRE_PING        test connections before use (default 1)
+#   DB_TUNING               apply the pool settings above, the busy timeout and
+#                           the SQLite pragmas below (default 1); 0 leaves the
+#                           engine on SQLAlchemy's and the driver's defaults
+#   SQLITE_BUSY_TIMEOUT_MS  wait on a locked database instead of failing (default 5000)
+#   SQLITE_MMAP_SIZE        bytes of the file to memory-map (default 256 MiB)
+
+DEFAULT_DATABASE_URL = 'sqlite:///student_enrollment.db'
+
+# asyncio drivers for the async tier (async_app.py), by backend
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def _env_flag(name, default):
+    return os.environ.get(name, default).strip().lower() not in ('0', 'false', 'no', 'off', '')
+
+
+def _is_sqlite_memory(url):
+    return url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:')
+
+
+def configure(app):
+    # Call before db.init_app(app)
+    uri = os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    url = make_url(uri)
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['DB_TUNING'] = _env_flag('DB_TUNING', '1')
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    app.config['SQLITE_MMAP_SIZE'] = _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)
+    if not app.config['DB_TUNING']:
+        # Untuned baseline, e.g. the 'default' run of bench_server.py
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {}
+        return
+
+    options = {
+        'pool_pre_ping': _env_flag('DB_POOL_PRE_PING', '1'),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+    }
+    # In-memory SQLite uses a single shared connection, so there is no pool to size
+    if not _is_sqlite_memory(url):
+        options['pool_size'] = _env_int('DB_POOL_SIZE', 5)
+        options['max_overflow'] = _env_int('DB_MAX_OVERFLOW', 10)
+        options['pool_timeout'] = _env_int('DB_POOL_TIMEOUT', 30)
+    if url.get_backend_name() == 'sqlite':
+        options['connect_args'] = {'timeout': app.config['SQLITE_BUSY_TIMEOUT_MS'] / 1000}
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
+
+def _tune_sqlite(app, engine):
+    if engine.dialect.name != 'sqlite' or not app.config['DB_TUNING']:
+        return
+    busy_timeout = app.config['SQLITE_BUSY_TIMEOUT_MS']
+    mmap_size = app.config['SQLITE_MMAP_SIZE']
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # WAL lets readers run alongside the single writer, and with it
+        # NORMAL sync only fsyncs at checkpoints
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        cursor.execute(f'PRAGMA busy_timeout={int(busy_timeout)}')
+        cursor.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+        cursor.close()
+
+
+def init_engine(app):
+    # Call after db.init_app(app), once the engine exists
+    with app.app_context():
+        _tune_sqlite(app, db.engine)
+
+
+def create_async_engine(app):
+    # asyncio engine on the same database and pool settings as the app's
+    # engine. Raises ValueError for backends without an asyncio driver.
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    with app.app_context():
+        # Flask-SQLAlchemy has already resolved relative SQLite paths
+        url = db.engine.url
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'No asyncio driver for {url.get_backend_name()}')
+
+    options = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+    if 'pool_size' in options:
+        options['poolclass'] = AsyncAdaptedQueuePool
+    engine = create_async_engine(url.set(drivername=driver), **options)
+    _tune_sqlite(app, engine.sync_engine)
+    return engine
@@ -0,0 +1,107 @@
+from sqlalchemy.exc import IntegrityError
+from models import db, Course, Grade, enrollments
+import catalog
+import schedule
+import seats
+import grade_stats
+import audit
+import dashboards
+import enrollment_index
+
+# Seat reservation for the enroll/drop API. A seat is taken with a single
+# conditional UPDATE on courses.enrolled_count, so concurrent requests can never
+# push a course over capacity and the roster is never loaded.
+
+ENROLLED = 'enrolled'
+DROPPED = 'dropped'
+FULL = 'full'
+ALREADY_ENROLLED = 'already_enrolled'
+NOT_ENROLLED = 'not_enrolled'
+COURSE_NOT_FOUND = 'course_not_found'
+SCHEDULE_CONFLICT = 'schedule_conflict'
+
+
+def is_enrolled(student_id, course_id):
+    # Always asked of the database: write paths never trust the per-process
+    # enrollment index, which can lag other workers and archive.py
+    return db.session.query(
+        db.exists().where(enrollments.c.user_id == student_id,
+                          enrollments.c.course_id == course_id)
+    ).scalar()
+
+
+def enroll(student_id, course_id):
+    # Reserve the seat first; the row lock (or SQLite's write lock) taken by
+    # the UPDATE serializes competing requests for the same course
+    reserved = db.session.execute(
+        db.update(Course)
+        .where(Course.id == course_id, Course.enrolled_count < Course.capacity)
+        .values(enrolled_count=Course.enrolled_count + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+
+    if not reserved:
+        db.session.rollback()
+        if db.session.get(Course, course_id) is None:
+            return COURSE_NOT_FOUND
+        if is_enrolled(student_id, course_id):
+            return ALREADY_ENROLLED
+        return FULL
+
+    # Checked after the seat is reserved, so it runs under the same write lock
+    if schedule.find_conflicts(student_id, course_id):
+        db.session.rollback()
+        return SCHEDULE_CONFLICT
+
+    try:
+        db.session.execute(enrollments.insert().values(user_id=student_id, course_id=course_id))
+        db.session.commit()
+    except IntegrityError:
+        # Primary key on (user_id, course_id): the student already holds a seat
+        db.session.rollback()
+        return ALREADY_ENROLLED
+
+    audit.record('enroll', student_id=student_id, course_id=course_id)
+    enrollment_index.enrolled(student_id, course_id)
+    dashboards.invalidate(student_id)
+    catalog.bump()
+    seats.publish(course_id)
+    return ENROLLED
+
+
+def drop(student_id, course_id):
+    removed = db.session.execute(
+        enrollments.delete().where(enrollments.c.user_id == student_id,
+                                   enrollments.c.course_id == course_id)
+    ).rowcount
+
+    if not removed:
+        db.session.rollback()
+        if db.session.get(Course, course_id) is None:
+            return COURSE_NOT_FOUND
+        return NOT_ENROLLED
+
+    db.session.execute(
+        db.update(Course)
+        .where(Course.id == course_id)
+        .values(enrolled_count=Course.enrolled_count - 1)
+        .execution_options(synchronize_session=False)
+    )
+    grade = db.session.query(Grade.value).filter(
+        Grade.student_id == student_id, Grade.course_id == course_id).scalar()
+    if grade is not None:
+        db.session.execute(
+            db.delete(Grade)
+            .where(Grade.student_id == student_id, Grade.course_id == course_id)
+            .execution_options(synchronize_session=False)
+        )
+        grade_stats.record_changes([(course_id, grade, None)])
+    db.session.commit()
+    # The grade is deleted with the enrollment; keep its value in the history
+    audit.record('drop', student_id=student_id, course_id=course_id, grade=grade)
+    enrollment_index.dropped(student_id, course_id)
+    dashboards.invalidate(student_id)
+    catalog.bump()
+    seats.publish(course_id)
+
+    return DROPPED
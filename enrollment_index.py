@@ -0,0 +1,293 @@
+import sys
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from models import db, enrollments
+
+# Optional in-memory copy of the enrollments table, held twice as sorted
+# arrays of 32-bit ids: the roster of each course and the courses of each
+# student. Membership is a bisect, roster size a len() and the students two
+# sections share a walk over the smaller roster, all without a query.
+#
+# A background thread loads the table at startup; until it is ready (or when
+# ENROLLMENT_INDEX is off) the helpers below fall back to SQL. The enroll,
+# drop, promotion and admin paths report their changes after they commit.
+# Like the catalog the copy is per process, so changes made by another worker
+# or by archive.py appear after the next reload: set
+# ENROLLMENT_INDEX_REFRESH with several workers. Because of that lag the
+# index only serves read paths (roster sizes, shared students); enroll, drop
+# and grading decide from the database.
+#
+# The ids take 8 bytes per enrollment, but the array and dict entry of each
+# student dominate: about 40 MiB per million enrollments at five courses per
+# student. `python bench_index.py` measures it, and /api/admin/enrollment-index
+# reports the live figure.
+#
+#   ENROLLMENT_INDEX           keep the index (default 0)
+#   ENROLLMENT_INDEX_REFRESH   seconds between full reloads (default 0, never)
+
+TYPECODE = 'i'
+
+
+def _insert(values, value):
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        return False
+    values.insert(position, value)
+    return True
+
+
+def _remove(values, value):
+    position = bisect_left(values, value)
+    if position < len(values) and values[position] == value:
+        del values[position]
+        return True
+    return False
+
+
+def _contains(values, value):
+    position = bisect_left(values, value)
+    return position < len(values) and values[position] == value
+
+
+def _intersection(a, b):
+    # Sorted ids in both arrays: bisects into the larger one for each id of
+    # the smaller one
+    if len(a) > len(b):
+        a, b = b, a
+    return [value for value in a if _contains(b, value)]
+
+
+class EnrollmentIndex:
+
+    def __init__(self, refresh=0):
+        self.refresh = refresh
+        self.ready = False
+        self.size = 0
+        self.loaded_at = None
+        self.load_seconds = None
+        self._courses = {}
+        self._students = {}
+        self._lock = threading.Lock()
+        # Changes reported while a reload reads the table, replayed on top
+        self._replay = None
+        self._reload = threading.Event()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='enrollment-index', daemon=True)
+        self._thread.start()
+
+    def request_reload(self):
+        self._reload.set()
+
+    def _run(self, app):
+        while True:
+            with app.app_context():
+                try:
+                    self.load()
+                except Exception as e:
+                    print(f"Error loading the enrollment index: {e}")
+                finally:
+                    db.session.remove()
+            self._reload.wait(self.refresh or None)
+            self._reload.clear()
+
+    def load(self, batch_size=10000):
+        started = time.perf_counter()
+        with self._lock:
+            self._replay = []
+        try:
+            courses = {}
+            students = {}
+            rows = db.session.execute(
+                db.select(enrollments.c.course_id, enrollments.c.user_id)
+                .order_by(enrollments.c.course_id, enrollments.c.user_id)
+                .execution_options(yield_per=batch_size))
+            for course_id, user_id in rows:
+                roster = courses.get(course_id)
+                if roster is None:
+                    roster = courses[course_id] = array(TYPECODE)
+                roster.append(user_id)
+                # Courses arrive in order, so each student's array stays sorted
+                student = students.get(user_id)
+                if student is None:
+                    student = students[user_id] = array(TYPECODE)
+                student.append(course_id)
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self._courses, self._students = courses, students
+            for change in replay:
+                change()
+            self.size = sum(map(len, courses.values()))
+            self.ready = True
+            self.loaded_at = time.time()
+            self.load_seconds = time.perf_counter() - started
+
+    # Changes, reported by the write paths after they commit
+
+    def _record(self, change):
+        # Caller holds the lock
+        change()
+        if self._replay is not None:
+            self._replay.append(change)
+
+    def _add(self, student_id, course_id):
+        if _insert(self._courses.setdefault(course_id, array(TYPECODE)), student_id):
+            _insert(self._students.setdefault(student_id, array(TYPECODE)), course_id)
+            self.size += 1
+
+    def _discard(self, student_id, course_id):
+        if _remove(self._courses.get(course_id, ()), student_id):
+            _remove(self._students.get(student_id, ()), course_id)
+            self.size -= 1
+
+    def _discard_course(self, course_id):
+        for student_id in self._courses.pop(course_id, ()):
+            _remove(self._students.get(student_id, ()), course_id)
+            self.size -= 1
+
+    def _discard_student(self, student_id):
+        for course_id in self._students.pop(student_id, ()):
+            _remove(self._courses.get(course_id, ()), student_id)
+            self.size -= 1
+
+    def add(self, student_id, course_id):
+        with self._lock:
+            self._record(lambda: self._add(student_id, course_id))
+
+    def discard(self, student_id, course_id):
+        with self._lock:
+            self._record(lambda: self._discard(student_id, course_id))
+
+    def discard_course(self, course_id):
+        with self._lock:
+            self._record(lambda: self._discard_course(course_id))
+
+    def discard_student(self, student_id):
+        with self._lock:
+            self._record(lambda: self._discard_student(student_id))
+
+    # Queries
+
+    def contains(self, student_id, course_id):
+        with self._lock:
+            # A student's course list is the shorter of the two
+            return _contains(self._students.get(student_id, ()), course_id)
+
+    def roster_size(self, course_id):
+        with self._lock:
+            return len(self._courses.get(course_id, ()))
+
+    def roster(self, course_id):
+        with self._lock:
+            return list(self._courses.get(course_id, ()))
+
+    def shared(self, course_a, course_b):
+        with self._lock:
+            return _intersection(self._courses.get(course_a, ()), self._courses.get(course_b, ()))
+
+    def memory(self):
+        # Bytes held by the arrays, the two dicts and their int keys
+        with self._lock:
+            total = 0
+            for ids in (self._courses, self._students):
+                total += sys.getsizeof(ids)
+                total += sum(map(sys.getsizeof, ids))
+                total += sum(map(sys.getsizeof, ids.values()))
+            size = self.size
+            courses, students = len(self._courses), len(self._students)
+        return {
+            'enrollments': size,
+            'courses': courses,
+            'students': students,
+            'bytes': total,
+            'bytes_per_enrollment': round(total / size, 1) if size else None,
+            'mib_per_million': round(total / size * 1000000 / 2 ** 20, 1) if size else None,
+        }
+
+    def stats(self):
+        return dict(self.memory(), ready=self.ready, load_seconds=self.load_seconds)
+
+
+index = EnrollmentIndex()
+enabled = False
+
+
+def init_app(app):
+    global enabled
+    enabled = bool(int(app.config.get('ENROLLMENT_INDEX', 0)))
+    index.refresh = app.config.get('ENROLLMENT_INDEX_REFRESH', 0)
+
+
+def start(app):
+    if enabled:
+        index.start(app)
+
+
+def active():
+    return enabled and index.ready
+
+
+def is_enrolled(student_id, course_id):
+    # Read paths only; see enrollment.is_enrolled for writes
+    if active():
+        return index.contains(student_id, course_id)
+    return db.session.query(
+        db.exists().where(enrollments.c.user_id == student_id,
+                          enrollments.c.course_id == course_id)
+    ).scalar()
+
+
+def roster_size(course_id):
+    if active():
+        return index.roster_size(course_id)
+    return db.session.query(db.func.count()).filter(enrollments.c.course_id == course_id).scalar()
+
+
+def shared_students(course_a, course_b):
+    # Sorted ids of the students enrolled in both courses
+    if active():
+        return index.shared(course_a, course_b)
+    other = db.select(enrollments.c.user_id).where(enrollments.c.course_id == course_b)
+    return list(db.session.scalars(
+        db.select(enrollments.c.user_id)
+        .where(enrollments.c.course_id == course_a, enrollments.c.user_id.in_(other))
+        .order_by(enrollments.c.user_id)))
+
+
+def enrolled(student_id, *course_ids):
+    if enabled:
+        for course_id in course_ids:
+            index.add(student_id, course_id)
+
+
+def dropped(student_id, *course_ids):
+    if enabled:
+        for course_id in course_ids:
+            index.discard(student_id, course_id)
+
+
+def course_deleted(course_id):
+    if enabled:
+        index.discard_course(course_id)
+
+
+def student_deleted(student_id):
+    if enabled:
+        index.discard_student(student_id)
+
+
+def reload():
+    # For bulk changes (imports): read the whole table again in the background
+    if enabled:
+        index.request_reload()
@@ -0,0 +1,109 @@
+import csv
+import io
+import json
+from models import db, User, Course, Grade, enrollments
+
+# Streaming exports for the registrar. Each export is one joined query read
+# through a server-side cursor in batches, written out as CSV or JSON Lines
+# chunk by chunk, so memory stays flat however many rows there are.
+
+BATCH_SIZE = 1000
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+}
+
+
+def _grades_query(course_id=None):
+    student = db.aliased(User)
+    query = (db.select(Grade.id.label('grade_id'), Grade.student_id, student.username,
+                       Grade.course_id, Course.name.label('course_name'), Grade.value)
+             .join(student, student.id == Grade.student_id)
+             .join(Course, Course.id == Grade.course_id)
+             .order_by(Grade.id))
+    if course_id is not None:
+        query = query.where(Grade.course_id == course_id)
+    return query
+
+
+def _enrollments_query(course_id=None):
+    student = db.aliased(User)
+    query = (db.select(enrollments.c.user_id.label('student_id'), student.username,
+                       enrollments.c.course_id, Course.name.label('course_name'))
+             .join(student, student.id == enrollments.c.user_id)
+             .join(Course, Course.id == enrollments.c.course_id)
+             .order_by(enrollments.c.user_id, enrollments.c.course_id))
+    if course_id is not None:
+        query = query.where(enrollments.c.course_id == course_id)
+    return query
+
+
+def _rosters_query(course_id=None):
+    student = db.aliased(User)
+    teacher = db.aliased(User)
+    query = (db.select(Course.id.label('course_id'), Course.name.label('course_name'),
+                       Course.timeslot, teacher.username.label('teacher'),
+                       student.id.label('student_id'), student.username, Grade.value.label('grade'))
+             .select_from(enrollments)
+             .join(Course, Course.id == enrollments.c.course_id)
+             .join(student, student.id == enrollments.c.user_id)
+             .outerjoin(teacher, teacher.id == Course.teacher_id)
+             .outerjoin(Grade, (Grade.course_id == enrollments.c.course_id) &
+                               (Grade.student_id == enrollments.c.user_id))
+             .order_by(enrollments.c.course_id, enrollments.c.user_id))
+    if course_id is not None:
+        query = query.where(enrollments.c.course_id == course_id)
+    return query
+
+
+EXPORTS = {
+    'grades': _grades_query,
+    'enrollments': _enrollments_query,
+    'rosters': _rosters_query,
+}
+
+
+def export_query(name, course_id=None):
+    return EXPORTS[name](course_id).execution_options(yield_per=BATCH_SIZE)
+
+
+class ExportEncoder:
+    # Turns batches of rows into CSV or JSON Lines text chunks
+
+    def __init__(self, columns, fmt):
+        self.columns = columns
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer) if fmt == 'csv' else None
+
+    def _drain(self):
+        chunk = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return chunk
+
+    def header(self):
+        # Sent straight away so the first byte is immediate
+        if self._writer:
+            self._writer.writerow(self.columns)
+        return self._drain()
+
+    def encode(self, rows):
+        if self._writer:
+            self._writer.writerows(rows)
+        else:
+            for row in rows:
+                self._buffer.write(json.dumps(dict(zip(self.columns, row)), separators=(',', ':')))
+                self._buffer.write('\n')
+        return self._drain()
+
+
+def stream_export(name, fmt, course_id=None):
+    # Generator of text chunks; run it inside the request (stream_with_context)
+    result = db.session.execute(export_query(name, course_id))
+    encoder = ExportEncoder(list(result.keys()), fmt)
+
+    header = encoder.header()
+    if header:
+        yield header
+    for rows in result.partitions():
+        yield encoder.encode(rows)
@@ -12,30 +12,27 @@ function CourseDetails({ user }) {
   useEffect(() => {
     const fetchCourseDetails = async () => {
       try {
-        // Fetch course information
-        const courseResponse = await fetch(`http://localhost:5000/api/courses`, {
-          credentials: 'include'
-        });
-        
-        if (!courseResponse.ok) {
-          throw new Error('Failed to fetch course information');
-        }
-        
-        const coursesData = await courseResponse.ok ? await courseResponse.json() : [];
-        const currentCourse = coursesData.find(c => c.id === parseInt(courseId));
-        setCourseInfo(currentCourse);
-        
-        // Fetch students enrolled in the course
-        const studentsResponse = await fetch(`http://localhost:5000/api/teacher/course/${courseId}/students`, {
-          credentials: 'include'
-        });
-        
-        if (!studentsResponse.ok) {
-          throw new Error('Failed to fetch students');
-        }
+        // Course information, roster and grades come from one endpoint;
+        // very large sections are returned in pages
+        let roster = [];
+        let after = null;
+        do {
+          const query = after === null ? '' : `?after=${after}`;
+          const response = await fetch(`http://localhost:5000/api/teacher/course/${courseId}${query}`, {
+            credentials: 'include'
+          });
+          
+          if (!response.ok) {
+            throw new Error('Failed to fetch course details');
+          }
+          
+          const data = await response.json();
+          setCourseInfo(data.course);
+          roster = roster.concat(data.students);
+          after = data.next_after;
+        } while (after !== null);
         
-        const studentsData = await studentsResponse.json();
-        setStudents(studentsData);
+        setStudents(roster);
       } catch (error) {
         setError('Error fetching course details');
         console.error('Error fetching course details:', error);
@@ -37,6 +37,33 @@ function StudentDashboard({ user }) {
     fetchCourses();
   }, []);
 
+  // Seat counts are pushed by the server instead of refetching the dashboard
+  useEffect(() => {
+    const source = new EventSource('http://localhost:5000/api/courses/seats/stream', {
+      withCredentials: true
+    });
+    
+    source.addEventListener('seats', (event) => {
+      const seats = new Map();
+      JSON.parse(event.data).seats.forEach(([id, enrolledCount, capacity]) => {
+        seats.set(id, { enrolled_count: enrolledCount, capacity });
+      });
+      const applySeats = (courses) => courses.map(course =>
+        seats.has(course.id) ? { ...course, ...seats.get(course.id) } : course
+      );
+      setEnrolledCourses(applySeats);
+      setAvailableCourses(applySeats);
+      setAllCourses(applySeats);
+    });
+    
+    // Sent when the server cannot describe a change as seat counts
+    source.addEventListener('resync', () => {
+      fetchCourses();
+    });
+    
+    return () => source.close();
+  }, []);
+
   const handleEnroll = async (courseId) => {
     try {
       const response = await fetch('http://localhost:5000/api/student/enroll', {
@@ -0,0 +1,133 @@
+import argparse
+import os
+import random
+import time
+
+# Seeded generator for realistic term-sized datasets, loaded through the
+# bulk importer. Every generated user's password is DEFAULT_PASSWORD; they all
+# share one precomputed hash so generation doesn't spend hours in the KDF.
+
+DEFAULT_PASSWORD = 'password'
+SIZES = {
+    'small': {'students': 2000, 'teachers': 40, 'courses': 150, 'per_student': 5},
+    'medium': {'students': 10000, 'teachers': 100, 'courses': 600, 'per_student': 6},
+    'large': {'students': 50000, 'teachers': 300, 'courses': 3000, 'per_student': 8},
+}
+SUBJECTS = ['Biology', 'Chemistry', 'Computer Science', 'Economics', 'English', 'History',
+            'Mathematics', 'Music', 'Philosophy', 'Physics', 'Psychology', 'Sociology']
+DAY_PATTERNS = ['MW', 'TTH', 'MWF', 'MF', 'F', 'T', 'TH', 'W']
+DURATIONS = [50, 75, 90, 110]
+
+
+def _clock(minutes):
+    hour, minute = divmod(minutes, 60)
+    return f"{(hour - 1) % 12 + 1}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
+
+
+def random_timeslot(rng):
+    start = rng.randrange(8 * 60, 20 * 60, 30)
+    return f"{rng.choice(DAY_PATTERNS)} {_clock(start)} - {_clock(start + rng.choice(DURATIONS))}"
+
+
+def generate(students, teachers, courses, per_student, graded=0.5, seed=1, chunk_size=10000, log=print):
+    # Loads the dataset into the current app's database. Returns a summary.
+    from models import db, Course, enrollments
+    import bulk_import
+    import grading
+    import passwords
+
+    rng = random.Random(seed)
+    password_hash = passwords.hash_password(DEFAULT_PASSWORD)
+    summary = {}
+
+    def load(kind, records):
+        stats = bulk_import.run_import(kind, records, chunk_size=chunk_size).to_dict()
+        log(f"{kind}: {stats['inserted']} inserted, {stats['rejected']} rejected, "
+            f"{stats['rows_per_second']} rows/s")
+        summary[kind] = stats['inserted']
+
+    load('users', ({'username': f'term_teacher{i}', 'role': 'teacher', 'password_hash': password_hash}
+                   for i in range(teachers)))
+    load('users', ({'username': f'term_student{i}', 'role': 'student', 'password_hash': password_hash}
+                   for i in range(students)))
+    summary['users'] = students + teachers
+
+    # Capacities leave roughly 50% slack over the expected demand so most
+    # enrollments fit but popular sections still fill up
+    mean_capacity = max(10, int(students * per_student / courses * 1.5))
+    first_course_id = (db.session.query(db.func.max(Course.id)).scalar() or 0) + 1
+    load('courses', ({'name': f'{rng.choice(SUBJECTS)} {100 + i}',
+                      'capacity': rng.randint(mean_capacity // 2, mean_capacity * 3 // 2),
+                      'timeslot': random_timeslot(rng),
+                      'teacher': f'term_teacher{rng.randrange(teachers)}'}
+                     for i in range(courses)))
+
+    course_ids = [course_id for (course_id,) in db.session.query(Course.id)
+                  .filter(Course.id >= first_course_id)
+                  .order_by(Course.id)]
+    # Mildly skewed popularity: lower-numbered sections are picked more often
+    weights = [1 / (rank + len(course_ids) / 4) for rank in range(len(course_ids))]
+
+    def enrollment_records():
+        for i in range(students):
+            picked = set()
+            while len(picked) < min(per_student, len(course_ids)):
+                picked.add(rng.choices(course_ids, weights)[0])
+            for course_id in picked:
+                yield {'username': f'term_student{i}', 'course_id': course_id}
+    load('enrollments', enrollment_records())
+
+    # Grades for a share of the enrollments, written in chunks
+    start = time.perf_counter()
+    batch = []
+    graded_count = 0
+    rows = (db.session.query(enrollments.c.user_id, enrollments.c.course_id)
+            .filter(enrollments.c.course_id >= first_course_id)
+            .all())
+    for user_id, course_id in rows:
+        if rng.random() < graded:
+            batch.append({'student_id': user_id, 'course_id': course_id,
+                          'value': round(min(100.0, max(0.0, rng.gauss(78, 12))), 1)})
+        if len(batch) >= chunk_size:
+            grading.upsert_grades(batch)
+            graded_count += len(batch)
+            batch = []
+    if batch:
+        grading.upsert_grades(batch)
+        graded_count += len(batch)
+    db.session.commit()
+    elapsed = time.perf_counter() - start
+    log(f"grades: {graded_count} inserted, {graded_count / elapsed if elapsed else 0:.0f} rows/s")
+    summary['grades'] = graded_count
+
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic term dataset')
+    parser.add_argument('--size', choices=SIZES, default='small')
+    parser.add_argument('--students', type=int)
+    parser.add_argument('--teachers', type=int)
+    parser.add_argument('--courses', type=int)
+    parser.add_argument('--per-student', type=int, help='enrollments per student')
+    parser.add_argument('--graded', type=float, default=0.5, help='share of enrollments with a grade')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--database-url', help='defaults to DATABASE_URL / the app default')
+    args = parser.parse_args()
+
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    size = dict(SIZES[args.size])
+    for key in size:
+        if getattr(args, key) is not None:
+            size[key] = getattr(args, key)
+
+    from app import app
+    with app.app_context():
+        start = time.perf_counter()
+        summary = generate(graded=args.graded, seed=args.seed, **size)
+        print(f"Generated {summary} in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
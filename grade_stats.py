@@ -0,0 +1,261 @@
+import argparse
+import math
+from collections import Counter
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Grade, GradeStats, GradeBucket, enrollments
+
+# Per-course grade aggregates (count, sum, sum of squares and a histogram),
+# kept up to date by every grade write so section statistics are a primary
+# key read instead of a scan of the course's grades. Writers pass the old and
+# new value of each grade they change to record_changes() in the same
+# transaction.
+#
+# Concurrent writes to the very same grade can still skew the totals, as can
+# edits made outside the app; `python grade_stats.py` compares the aggregates
+# with the grades table and `--fix` rebuilds the ones that differ.
+
+BUCKET_WIDTH = 10
+BUCKETS = 10
+PERCENTILES = (25, 50, 75, 90)
+
+# Four-point scale used for the student GPA
+GRADE_POINTS = ((90, 4.0), (80, 3.0), (70, 2.0), (60, 1.0))
+
+_INSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def bucket_of(value):
+    # Grades of 100 and above land in the top bucket, negatives in the first
+    return min(max(int(value // BUCKET_WIDTH), 0), BUCKETS - 1)
+
+
+def _bucket_expression(value):
+    return db.case(*((value < BUCKET_WIDTH * (bucket + 1), bucket)
+                     for bucket in range(BUCKETS - 1)),
+                   else_=BUCKETS - 1)
+
+
+def _ensure_rows(model, keys):
+    # Zero rows for aggregates that do not exist yet, so the deltas below
+    # can always be applied as relative UPDATEs
+    insert = _INSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        db.session.execute(insert(model.__table__).on_conflict_do_nothing(), keys)
+        return
+    columns = list(keys[0])
+    existing = set(db.session.query(*(getattr(model, column) for column in columns)).filter(
+        getattr(model, columns[0]).in_({key[columns[0]] for key in keys})))
+    missing = [key for key in keys if tuple(key[column] for column in columns) not in existing]
+    if missing:
+        db.session.execute(db.insert(model), missing)
+
+
+def record_changes(changes):
+    # changes: iterable of (course_id, old_value, new_value), where old_value
+    # is None for a new grade and new_value is None for a deleted one. The
+    # caller commits.
+    totals = {}
+    buckets = Counter()
+    for course_id, old, new in changes:
+        if old == new:
+            continue
+        # Form input arrives as Decimal
+        old = None if old is None else float(old)
+        new = None if new is None else float(new)
+        total = totals.setdefault(course_id, [0, 0.0, 0.0])
+        if old is not None:
+            total[0] -= 1
+            total[1] -= old
+            total[2] -= old * old
+            buckets[(course_id, bucket_of(old))] -= 1
+        if new is not None:
+            total[0] += 1
+            total[1] += new
+            total[2] += new * new
+            buckets[(course_id, bucket_of(new))] += 1
+
+    if not totals:
+        return
+    _ensure_rows(GradeStats, [{'course_id': course_id} for course_id in totals])
+    stats = GradeStats.__table__
+    db.session.execute(
+        stats.update()
+        .where(stats.c.course_id == db.bindparam('target_id'))
+        .values(count=stats.c.count + db.bindparam('delta_count'),
+                total=stats.c.total + db.bindparam('delta_total'),
+                total_squares=stats.c.total_squares + db.bindparam('delta_squares')),
+        [{'target_id': course_id, 'delta_count': count, 'delta_total': total, 'delta_squares': squares}
+         for course_id, (count, total, squares) in totals.items()])
+
+    buckets = {key: delta for key, delta in buckets.items() if delta}
+    if not buckets:
+        return
+    _ensure_rows(GradeBucket, [{'course_id': course_id, 'bucket': bucket}
+                               for course_id, bucket in buckets])
+    histogram = GradeBucket.__table__
+    db.session.execute(
+        histogram.update()
+        .where(histogram.c.course_id == db.bindparam('target_id'),
+               histogram.c.bucket == db.bindparam('target_bucket'))
+        .values(count=histogram.c.count + db.bindparam('delta_count')),
+        [{'target_id': course_id, 'target_bucket': bucket, 'delta_count': delta}
+         for (course_id, bucket), delta in buckets.items()])
+
+
+def forget(course_ids):
+    # For deleted courses. The caller commits.
+    for model in (GradeStats, GradeBucket):
+        model.query.filter(model.course_id.in_(course_ids)).delete(synchronize_session=False)
+
+
+def _percentiles(histogram, count):
+    # Linear interpolation inside the bucket holding each rank, so these are
+    # approximate to within one bucket width
+    result = {}
+    for percentile in PERCENTILES:
+        rank = count * percentile / 100
+        seen = 0
+        for bucket, bucket_count in enumerate(histogram):
+            if bucket_count and seen + bucket_count >= rank:
+                fraction = (rank - seen) / bucket_count
+                result[str(percentile)] = round(BUCKET_WIDTH * (bucket + fraction), 2)
+                break
+            seen += bucket_count
+    return result
+
+
+def course_stats(course_id):
+    stats = db.session.get(GradeStats, course_id)
+    histogram = [0] * BUCKETS
+    for bucket, count in db.session.query(GradeBucket.bucket, GradeBucket.count).filter(
+            GradeBucket.course_id == course_id):
+        histogram[bucket] = count
+
+    count = stats.count if stats else 0
+    result = {
+        'course_id': course_id,
+        'count': count,
+        'mean': None,
+        'stddev': None,
+        'percentiles': {},
+        'histogram': [{'min': bucket * BUCKET_WIDTH, 'max': (bucket + 1) * BUCKET_WIDTH, 'count': histogram[bucket]}
+                      for bucket in range(BUCKETS)],
+    }
+    if count:
+        mean = stats.total / count
+        variance = max(stats.total_squares / count - mean * mean, 0.0)
+        result['mean'] = round(mean, 2)
+        result['stddev'] = round(math.sqrt(variance), 2)
+        result['percentiles'] = _percentiles(histogram, count)
+    return result
+
+
+def grade_points(value):
+    for minimum, points in GRADE_POINTS:
+        if value >= minimum:
+            return points
+    return 0.0
+
+
+def student_gpa(student_id):
+    # A student has a handful of grades, read through the (student_id,
+    # course_id) index, so this is computed on demand
+    values = [value for (value,) in db.session.query(Grade.value).filter(Grade.student_id == student_id)]
+    enrolled = db.session.query(db.func.count()).filter(enrollments.c.user_id == student_id).scalar()
+    return {
+        'enrolled_courses': enrolled,
+        'graded_courses': len(values),
+        'average': round(sum(values) / len(values), 2) if values else None,
+        'gpa': round(sum(map(grade_points, values)) / len(values), 2) if values else None,
+    }
+
+
+def _computed_stats(course_ids=None):
+    query = db.select(Grade.course_id, db.func.count(Grade.id), db.func.sum(Grade.value),
+                      db.func.sum(Grade.value * Grade.value)).group_by(Grade.course_id)
+    if course_ids is not None:
+        query = query.where(Grade.course_id.in_(course_ids))
+    return query
+
+
+def _computed_buckets(course_ids=None):
+    bucket = _bucket_expression(Grade.value)
+    query = db.select(Grade.course_id, bucket, db.func.count(Grade.id)).group_by(Grade.course_id, bucket)
+    if course_ids is not None:
+        query = query.where(Grade.course_id.in_(course_ids))
+    return query
+
+
+def recompute(course_ids=None):
+    # Rebuild the aggregates from the grades table, for every course or only
+    # the given ones. The caller commits.
+    for model in (GradeStats, GradeBucket):
+        query = model.query
+        if course_ids is not None:
+            query = query.filter(model.course_id.in_(course_ids))
+        query.delete(synchronize_session=False)
+    db.session.execute(GradeStats.__table__.insert().from_select(
+        ['course_id', 'count', 'total', 'total_squares'], _computed_stats(course_ids)))
+    db.session.execute(GradeBucket.__table__.insert().from_select(
+        ['course_id', 'bucket', 'count'], _computed_buckets(course_ids)))
+
+
+def verify(tolerance=1e-6):
+    # Course ids whose stored aggregates differ from the grades table
+    stored = {course_id: (count, total, squares) for course_id, count, total, squares in
+              db.session.query(GradeStats.course_id, GradeStats.count, GradeStats.total,
+                               GradeStats.total_squares).filter(GradeStats.count != 0)}
+    computed = {course_id: (count, total, squares) for course_id, count, total, squares in
+                db.session.execute(_computed_stats())}
+
+    mismatched = set()
+    for course_id in stored.keys() | computed.keys():
+        expected = computed.get(course_id, (0, 0.0, 0.0))
+        actual = stored.get(course_id, (0, 0.0, 0.0))
+        if expected[0] != actual[0] or any(
+                not math.isclose(a, b, rel_tol=tolerance, abs_tol=tolerance)
+                for a, b in zip(expected[1:], actual[1:])):
+            mismatched.add(course_id)
+
+    stored_buckets = {(course_id, bucket): count for course_id, bucket, count in
+                      db.session.query(GradeBucket.course_id, GradeBucket.bucket, GradeBucket.count)
+                      .filter(GradeBucket.count != 0)}
+    computed_buckets = {(course_id, bucket): count for course_id, bucket, count in
+                        db.session.execute(_computed_buckets())}
+    for key in stored_buckets.keys() | computed_buckets.keys():
+        if stored_buckets.get(key) != computed_buckets.get(key):
+            mismatched.add(key[0])
+
+    return sorted(mismatched)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the grade aggregates against the grades table')
+    parser.add_argument('--fix', action='store_true', help='rebuild the aggregates that differ')
+    parser.add_argument('--rebuild', action='store_true', help='rebuild the aggregates of every course')
+    args = parser.parse_args()
+
+    from app import app
+    with app.app_context():
+        if args.rebuild:
+            recompute()
+            db.session.commit()
+            print("Rebuilt grade statistics for every course")
+            return
+
+        mismatched = verify()
+        if not mismatched:
+            print("Grade statistics match the grades table")
+            return
+        print(f"Grade statistics differ for {len(mismatched)} courses: {mismatched[:20]}")
+        if args.fix:
+            recompute(mismatched)
+            db.session.commit()
+            print(f"Rebuilt grade statistics for {len(mismatched)} courses")
+
+
+if __name__ == '__main__':
+    main()
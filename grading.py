@@ -0,0 +1,121 @@
+import math
+from sqlalchemy.dialects import postgresql, sqlite
+from models import db, Grade, enrollments
+import grade_stats
+import audit
+import dashboards
+
+# Grade writes. Batches are validated with one enrollment query and written
+# with a native upsert against the unique (student_id, course_id) index. The
+# grades being replaced are read first so the course aggregates in
+# grade_stats.py can be adjusted by the difference.
+
+_UPSERT_DIALECTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _existing_grades(rows):
+    # {(student_id, course_id): (grade id, value)} for the rows already graded,
+    # one query per course in the batch
+    student_ids = {}
+    for row in rows:
+        student_ids.setdefault(row['course_id'], set()).add(row['student_id'])
+    existing = {}
+    for course_id, students in student_ids.items():
+        for student_id, grade_id, value in db.session.query(Grade.student_id, Grade.id, Grade.value).filter(
+                Grade.course_id == course_id, Grade.student_id.in_(students)):
+            existing[(student_id, course_id)] = (grade_id, value)
+    return existing
+
+
+def upsert_grades(rows):
+    # rows: list of {'student_id', 'course_id', 'value'}. The caller commits,
+    # then passes the returned (student_id, course_id, old, new) changes to
+    # audit_grades().
+    existing = _existing_grades(rows)
+    changes = [(row['student_id'], row['course_id'],
+                existing.get((row['student_id'], row['course_id']), (None, None))[1], row['value'])
+               for row in rows]
+    grade_stats.record_changes((course_id, old, new) for _, course_id, old, new in changes)
+
+    insert = _UPSERT_DIALECTS.get(db.session.get_bind().dialect.name)
+    if insert is not None:
+        stmt = insert(Grade.__table__)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['student_id', 'course_id'],
+            set_={'value': stmt.excluded.value})
+        db.session.execute(stmt, rows)
+        return changes
+
+    # Other backends: bulk update the existing ids and insert the rest
+    ids = {key: grade_id for key, (grade_id, _) in existing.items()}
+
+    updates = [{'id': ids[(row['student_id'], row['course_id'])], 'value': row['value']}
+               for row in rows if (row['student_id'], row['course_id']) in ids]
+    inserts = [row for row in rows if (row['student_id'], row['course_id']) not in ids]
+    if updates:
+        db.session.execute(db.update(Grade), updates)
+    if inserts:
+        db.session.execute(db.insert(Grade), inserts)
+    return changes
+
+
+def audit_grades(changes):
+    for student_id, course_id, old, new in changes:
+        if old != new:
+            audit.record('grade', student_id=student_id, course_id=course_id, old=old, new=new)
+
+
+def parse_value(value):
+    # float() also accepts 'nan' and 'inf', which no grade can be
+    if isinstance(value, bool):
+        raise ValueError
+    value = float(value)
+    if not math.isfinite(value):
+        raise ValueError
+    return value
+
+
+def submit_grades(course_id, rows):
+    # rows: list of {'student_id': ..., 'value': ...}. Returns the number of
+    # grades saved and a list of per-row errors ({'index', 'student_id', 'error'}).
+    errors = []
+    values = {}
+    for index, row in enumerate(rows):
+        student_id = row.get('student_id') if isinstance(row, dict) else None
+        if not isinstance(student_id, int) or isinstance(student_id, bool):
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Invalid student_id'})
+            continue
+        try:
+            value = parse_value(row.get('value'))
+        except (TypeError, ValueError):
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Invalid grade value'})
+            continue
+        if student_id in values:
+            errors.append({'index': index, 'student_id': student_id, 'error': 'Duplicate student in batch'})
+            continue
+        values[student_id] = (index, value)
+
+    if not values:
+        return 0, errors
+
+    enrolled = {user_id for (user_id,) in db.session.query(enrollments.c.user_id).filter(
+        enrollments.c.course_id == course_id,
+        enrollments.c.user_id.in_(values.keys()))}
+    for student_id in list(values):
+        if student_id not in enrolled:
+            index, _ = values.pop(student_id)
+            errors.append({'index': index, 'student_id': student_id,
+                           'error': 'Student not enrolled in this course'})
+
+    if values:
+        changes = upsert_grades([{'student_id': student_id, 'course_id': course_id, 'value': value}
+                                 for student_id, (_, value) in values.items()])
+        db.session.commit()
+        audit_grades(changes)
+        dashboards.invalidate(*values)
+
+    errors.sort(key=lambda error: error['index'])
+    return len(values), errors
@@ -1,5 +1,7 @@
 from app import app, db
-from models import User, Course, Grade
+from models import User, Course, Grade, refresh_enrolled_counts
+import passwords
+import grade_stats
 
 def create_sample_data():
     with app.app_context():
@@ -19,6 +21,9 @@ def create_sample_data():
         student2 = User(username='student2', password='student123', role='student')
         student3 = User(username='student3', password='student123', role='student')
         
+        for user in [admin, teacher1, teacher2, student1, student2, student3]:
+            passwords.set_password(user, user.password)
+        
         db.session.add_all([admin, teacher1, teacher2, student1, student2, student3])
         db.session.commit()
         
@@ -50,6 +55,7 @@ def create_sample_data():
         student1.courses_enrolled.append(course2)
         student2.courses_enrolled.append(course1)
         student3.courses_enrolled.append(course3)
+        refresh_enrolled_counts()
         
         grade1 = Grade(student_id=student1.id, course_id=course1.id, value=85.5)
         grade2 = Grade(student_id=student1.id, course_id=course2.id, value=92.0)
@@ -57,6 +63,8 @@ def create_sample_data():
         grade4 = Grade(student_id=student3.id, course_id=course3.id, value=88.0)
         
         db.session.add_all([grade1, grade2, grade3, grade4])
+        db.session.flush()
+        grade_stats.recompute()
         db.session.commit()
         
         print("Sample data created")
@@ -0,0 +1,174 @@
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from models import db
+
+# Per-request SQL and latency instrumentation. Every request gets its query
+# count, total database time and slowest statements recorded, returned in a
+# Server-Timing header and folded into per-endpoint aggregates for the admin
+# stats page. Optionally, a sampling profiler collects stacks from requests
+# that run longer than a threshold.
+#
+#   INSTRUMENTATION            collect stats (default True)
+#   SERVER_TIMING              add the Server-Timing header (default True)
+#   PROFILE_SLOW_REQUESTS_MS   sample stacks of requests slower than this (default off)
+#   PROFILE_INTERVAL_MS        sampling interval (default 10)
+
+SLOW_STATEMENTS = 3
+MAX_STACKS = 50
+
+
+class EndpointStats:
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.slowest = []
+        self.stacks = Counter()
+
+    def add(self, elapsed, status, queries, db_time, slowest):
+        self.requests += 1
+        self.errors += status >= 500
+        self.total_time += elapsed
+        self.max_time = max(self.max_time, elapsed)
+        self.db_time += db_time
+        self.queries += queries
+        self.max_queries = max(self.max_queries, queries)
+        self.slowest = sorted(self.slowest + slowest, reverse=True)[:SLOW_STATEMENTS]
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'mean_ms': round(self.total_time / self.requests * 1000, 2),
+            'max_ms': round(self.max_time * 1000, 2),
+            'mean_db_ms': round(self.db_time / self.requests * 1000, 2),
+            'mean_queries': round(self.queries / self.requests, 2),
+            'max_queries': self.max_queries,
+            'slowest_statements': [{'ms': round(duration * 1000, 2), 'statement': statement}
+                                   for duration, statement in self.slowest],
+            'sampled_stacks': [{'samples': count, 'stack': stack}
+                               for stack, count in self.stacks.most_common(10)],
+        }
+
+
+class Instrumentation:
+
+    def __init__(self):
+        self.server_timing = True
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._profile_threshold = None
+        self._profile_interval = 0.01
+
+    def init_app(self, app):
+        if not app.config.get('INSTRUMENTATION', True):
+            return
+        self.server_timing = app.config.get('SERVER_TIMING', True)
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.teardown_request(self._teardown_request)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+
+        threshold = app.config.get('PROFILE_SLOW_REQUESTS_MS')
+        if threshold is not None:
+            self._profile_threshold = threshold / 1000
+            self._profile_interval = app.config.get('PROFILE_INTERVAL_MS', 10) / 1000
+            threading.Thread(target=self._sample, name='request-profiler', daemon=True).start()
+
+    # SQL hooks
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'instrumentation_queries' in g:
+            g.instrumentation_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context() or g.get('instrumentation_query_start') is None:
+            return
+        duration = time.perf_counter() - g.instrumentation_query_start
+        g.instrumentation_query_start = None
+        g.instrumentation_queries += 1
+        g.instrumentation_db_time += duration
+        slowest = g.instrumentation_slowest
+        if len(slowest) < SLOW_STATEMENTS or duration > slowest[-1][0]:
+            slowest.append((duration, ' '.join(statement.split())[:300]))
+            slowest.sort(reverse=True)
+            del slowest[SLOW_STATEMENTS:]
+
+    # Request hooks
+
+    def _before_request(self):
+        g.instrumentation_start = time.perf_counter()
+        g.instrumentation_queries = 0
+        g.instrumentation_db_time = 0.0
+        g.instrumentation_slowest = []
+        if self._profile_threshold is not None:
+            self._in_flight[threading.get_ident()] = (self._endpoint(), g.instrumentation_start)
+
+    def _after_request(self, response):
+        if 'instrumentation_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.instrumentation_start
+        if self.server_timing:
+            response.headers['Server-Timing'] = (
+                f'db;dur={g.instrumentation_db_time * 1000:.2f};desc="{g.instrumentation_queries} queries", '
+                f'total;dur={elapsed * 1000:.2f}')
+
+        key = self._endpoint()
+        with self._lock:
+            stats = self._stats.setdefault(key, EndpointStats())
+            stats.add(elapsed, response.status_code, g.instrumentation_queries,
+                      g.instrumentation_db_time, g.instrumentation_slowest)
+        return response
+
+    def _teardown_request(self, exc):
+        self._in_flight.pop(threading.get_ident(), None)
+
+    def _endpoint(self):
+        rule = request.url_rule.rule if request.url_rule else '<unmatched>'
+        return f'{request.method} {rule}'
+
+    # Sampling profiler
+
+    def _sample(self):
+        while True:
+            time.sleep(self._profile_interval)
+            now = time.perf_counter()
+            frames = sys._current_frames()
+            for thread_id, (endpoint, started) in list(self._in_flight.items()):
+                frame = frames.get(thread_id)
+                if frame is None or now - started < self._profile_threshold:
+                    continue
+                stack = ';'.join(f'{entry.name} ({entry.filename.rsplit("/", 1)[-1]}:{entry.lineno})'
+                                 for entry in traceback.extract_stack(frame)[-15:])
+                with self._lock:
+                    stats = self._stats.setdefault(endpoint, EndpointStats())
+                    if stack in stats.stacks or len(stats.stacks) < MAX_STACKS:
+                        stats.stacks[stack] += 1
+
+    # Reporting
+
+    def snapshot(self):
+        with self._lock:
+            rows = {key: stats.to_dict() for key, stats in self._stats.items()}
+        return dict(sorted(rows.items(), key=lambda item: -item[1]['mean_ms'] * item[1]['requests']))
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+instrumentation = Instrumentation()
@@ -1,6 +1,9 @@
+import json
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from sqlalchemy import func
+from sqlalchemy import event, func, table, column, union_all
+from datetime import datetime
+from timeslots import parse_timeslot
 
 db = SQLAlchemy()
 
@@ -15,7 +18,9 @@ class User(db.Model, UserMixin):
    
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
+    # Legacy plaintext password, cleared once password_hash is set
     password = db.Column(db.String(128), nullable=False)
+    password_hash = db.Column(db.String(255))
     role = db.Column(db.String(20), nullable=False)
    
     # These relationships are defined through backrefs in other models
@@ -23,6 +28,10 @@ class User(db.Model, UserMixin):
    
     def __str__(self):
         return self.username
+    
+    def set_password_hash(self, password_hash):
+        self.password_hash = password_hash
+        self.password = ''
         
     def __repr__(self):
         return f"<User {self.username}>"
@@ -34,42 +43,78 @@ class User(db.Model, UserMixin):
             'role': self.role
         }
 
+TERM_STATUSES = ('open', 'archiving', 'archived')
+
+class Term(db.Model):
+    # An academic term. Once a term is archived (archive.py) its courses,
+    # enrollments and grades live in the archived_* tables instead.
+    __tablename__ = 'terms'
+   
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='open', server_default='open')
+    archived_at = db.Column(db.DateTime)
+   
+    courses = db.relationship('Course', back_populates='term', lazy='dynamic')
+   
+    def __str__(self):
+        return self.name
+        
+    def __repr__(self):
+        return f"<Term {self.name}>"
+   
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'archived_at': self.archived_at.isoformat() if self.archived_at else None
+        }
+
 class Course(db.Model):
     __tablename__ = 'courses'
+    __table_args__ = (
+        # Keyset pagination for course search is ordered by (name, id)
+        db.Index('ix_courses_name_id', 'name', 'id'),
+        db.Index('ix_courses_teacher_id_name', 'teacher_id', 'name'),
+        db.Index('ix_courses_term_id', 'term_id'),
+    )
    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     capacity = db.Column(db.Integer, nullable=False)
     timeslot = db.Column(db.String(100), nullable=False)
     teacher_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    # NULL for courses not assigned to a term; those are never archived
+    term_id = db.Column(db.Integer, db.ForeignKey('terms.id'))
+    # Denormalized size of the roster, maintained by the enroll/drop paths and
+    # admin edits in the same transaction as the enrollments change
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Parsed from timeslot whenever it is set; NULL if it can't be parsed
+    meeting_days = db.Column(db.Integer)
+    start_minute = db.Column(db.Integer)
+    end_minute = db.Column(db.Integer)
    
     # Define relationships clearly
     teacher = db.relationship('User', foreign_keys=[teacher_id], backref=db.backref('courses_teaching', lazy='dynamic'))
+    term = db.relationship('Term', back_populates='courses')
     students = db.relationship('User', secondary=enrollments, backref=db.backref('courses_enrolled', lazy='dynamic'))
     grades = db.relationship('Grade', back_populates='course', cascade='all, delete-orphan')
+    waitlist = db.relationship('WaitlistEntry', back_populates='course', cascade='all, delete-orphan',
+                               lazy='dynamic', order_by='WaitlistEntry.id')
    
     def __str__(self):
         return self.name
+    
+    @db.validates('timeslot')
+    def _parse_timeslot(self, key, timeslot):
+        self.meeting_days, self.start_minute, self.end_minute = parse_timeslot(timeslot) or (None, None, None)
+        return timeslot
         
     def __repr__(self):
         return f"<Course {self.name}>"
    
     def to_dict(self, include_students=False):
-        # Safely get enrolled count
-        enrolled_count = 0
-        try:
-            # Use a direct query to count enrolled students
-            enrolled_count = db.session.query(func.count(enrollments.c.user_id)).filter(
-                enrollments.c.course_id == self.id
-            ).scalar()
-        except Exception as e:
-            print(f"Error counting students: {e}")
-            # Fallback to counting the list if query fails
-            try:
-                enrolled_count = len(list(self.students))
-            except:
-                enrolled_count = 0
-            
         course_dict = {
             'id': self.id,
             'name': self.name,
@@ -77,7 +122,7 @@ class Course(db.Model):
             'timeslot': self.timeslot,
             'teacher_id': self.teacher_id,
             'teacher_name': self.teacher.username if self.teacher else 'Unknown',
-            'enrolled_count': enrolled_count,
+            'enrolled_count': self.enrolled_count,
         }
        
         if include_students:
@@ -92,8 +137,81 @@ class Course(db.Model):
            
         return course_dict
 
+# Substring search on course names. On SQLite with FTS5 the courses table gets
+# an external-content trigram index kept in sync by triggers; other databases
+# fall back to LIKE.
+COURSE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5("
+    "name, content='courses', content_rowid='id', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_insert AFTER INSERT ON courses BEGIN "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_delete AFTER DELETE ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); END",
+    "CREATE TRIGGER IF NOT EXISTS courses_fts_update AFTER UPDATE OF name ON courses BEGIN "
+    "INSERT INTO courses_fts(courses_fts, rowid, name) VALUES ('delete', old.id, old.name); "
+    "INSERT INTO courses_fts(rowid, name) VALUES (new.id, new.name); END",
+)
+
+def supports_course_fts(connection):
+    if connection.dialect.name != 'sqlite':
+        return False
+    # The trigram tokenizer needs SQLite 3.34+
+    version = connection.exec_driver_sql('SELECT sqlite_version()').scalar()
+    if tuple(int(part) for part in version.split('.')) < (3, 34, 0):
+        return False
+    options = {row[0] for row in connection.exec_driver_sql('PRAGMA compile_options')}
+    return 'ENABLE_FTS5' in options
+
+def create_course_fts(connection, rebuild=False):
+    if not supports_course_fts(connection):
+        return False
+    for statement in COURSE_FTS_DDL:
+        connection.exec_driver_sql(statement)
+    if rebuild:
+        connection.exec_driver_sql("INSERT INTO courses_fts(courses_fts) VALUES ('rebuild')")
+    return True
+
+@event.listens_for(Course.__table__, 'after_create')
+def _create_course_fts(target, connection, **kw):
+    create_course_fts(connection)
+
+class WaitlistEntry(db.Model):
+    __tablename__ = 'waitlist'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_id', name='uq_waitlist_user_course'),
+        # FIFO order within a course is the insertion order of the rows
+        db.Index('ix_waitlist_course_id_id', 'course_id', 'id'),
+    )
+   
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+   
+    student = db.relationship('User')
+    course = db.relationship('Course', back_populates='waitlist')
+   
+    def __repr__(self):
+        return f"<WaitlistEntry {self.user_id} -> {self.course_id}>"
+
+def refresh_enrolled_counts(course_ids=None):
+    # Recompute Course.enrolled_count from the enrollments table, for every
+    # course or only the given ones. The caller commits.
+    count = (db.select(func.count(enrollments.c.user_id))
+             .where(enrollments.c.course_id == Course.id)
+             .scalar_subquery())
+    stmt = db.update(Course).values(enrolled_count=count)
+    if course_ids is not None:
+        stmt = stmt.where(Course.id.in_(course_ids))
+    return db.session.execute(stmt, execution_options={'synchronize_session': 'fetch'}).rowcount
+
 class Grade(db.Model):
     __tablename__ = 'grades'
+    __table_args__ = (
+        # One grade per student per course; also the index behind every
+        # (student_id, course_id) lookup and the upsert conflict target
+        db.Index('uq_grades_student_course', 'student_id', 'course_id', unique=True),
+    )
    
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -119,4 +237,132 @@ class Grade(db.Model):
             'value': self.value,
             'student_name': self.student.username if self.student else "Unknown",
             'course_name': self.course.name if self.course else "Unknown"
-        }
\ No newline at end of file
+        }
+
+class GradeStats(db.Model):
+    # Running totals of a course's grades, maintained by grade_stats.py
+    __tablename__ = 'grade_stats'
+   
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    total = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+    total_squares = db.Column(db.Float, nullable=False, default=0.0, server_default='0')
+   
+    def __repr__(self):
+        return f"<GradeStats {self.course_id}: {self.count}>"
+
+class GradeBucket(db.Model):
+    # Histogram of a course's grades, one row per bucket that has held a grade
+    __tablename__ = 'grade_buckets'
+   
+    course_id = db.Column(db.Integer, db.ForeignKey('courses.id'), primary_key=True)
+    bucket = db.Column(db.Integer, primary_key=True)
+    count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+   
+    def __repr__(self):
+        return f"<GradeBucket {self.course_id}/{self.bucket}: {self.count}>"
+
+class AuditEvent(db.Model):
+    # Append-only history of enrollment, grade and admin changes, written in
+    # batches by audit.py. No foreign keys, so the history outlives deleted
+    # users and courses.
+    __tablename__ = 'audit_log'
+    __table_args__ = (
+        db.Index('ix_audit_log_course_id_id', 'course_id', 'id'),
+        db.Index('ix_audit_log_student_id_id', 'student_id', 'id'),
+    )
+   
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, nullable=False)
+    actor_id = db.Column(db.Integer)
+    action = db.Column(db.String(32), nullable=False)
+    course_id = db.Column(db.Integer)
+    student_id = db.Column(db.Integer)
+    details = db.Column(db.Text)
+   
+    def __repr__(self):
+        return f"<AuditEvent {self.id}: {self.action}>"
+   
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'created_at': self.created_at.isoformat(),
+            'actor_id': self.actor_id,
+            'action': self.action,
+            'course_id': self.course_id,
+            'student_id': self.student_id,
+            'details': json.loads(self.details) if self.details else {}
+        }
+
+class CacheVersion(db.Model):
+    # Counters bumped by changes other processes must hear about (cache_sync.py)
+    __tablename__ = 'cache_versions'
+   
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+   
+    def __repr__(self):
+        return f"<CacheVersion {self.name}: {self.version}>"
+
+# Cold storage for archived terms, filled by archive.py. Rows keep their
+# original ids and carry what is needed to read them back without the live
+# tables; no foreign keys, as with audit_log, so users can still be deleted.
+archived_enrollments = db.Table('archived_enrollments',
+    db.Column('user_id', db.Integer, primary_key=True),
+    db.Column('course_id', db.Integer, primary_key=True)
+)
+
+class ArchivedCourse(db.Model):
+    __tablename__ = 'archived_courses'
+    __table_args__ = (
+        db.Index('ix_archived_courses_term_id', 'term_id'),
+    )
+   
+    id = db.Column(db.Integer, primary_key=True)
+    term_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    capacity = db.Column(db.Integer, nullable=False)
+    timeslot = db.Column(db.String(100), nullable=False)
+    teacher_id = db.Column(db.Integer, nullable=False)
+    teacher_name = db.Column(db.String(64))
+    enrolled_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+   
+    def __repr__(self):
+        return f"<ArchivedCourse {self.name}>"
+
+class ArchivedGrade(db.Model):
+    __tablename__ = 'archived_grades'
+    __table_args__ = (
+        db.Index('uq_archived_grades_student_course', 'student_id', 'course_id', unique=True),
+    )
+   
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, nullable=False)
+    course_id = db.Column(db.Integer, nullable=False)
+    value = db.Column(db.Float, nullable=False)
+   
+    def __repr__(self):
+        return f"<ArchivedGrade {self.id}: {self.value}>"
+
+# Every grade a student has received, live or archived. Created as a view so
+# reports and ad hoc SQL see one table; the app reads it through `transcripts`.
+def transcripts_select():
+    live = (db.select(Grade.student_id, Grade.course_id, Course.name.label('course_name'),
+                      Course.term_id, Grade.value)
+            .join(Course, Course.id == Grade.course_id))
+    archived = (db.select(ArchivedGrade.student_id, ArchivedGrade.course_id, ArchivedCourse.name,
+                          ArchivedCourse.term_id, ArchivedGrade.value)
+                .join(ArchivedCourse, ArchivedCourse.id == ArchivedGrade.course_id))
+    return union_all(live, archived)
+
+transcripts = table('transcripts',
+    column('student_id'), column('course_id'), column('course_name'), column('term_id'), column('value'))
+
+def create_transcripts_view(connection):
+    body = transcripts_select().compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    create = 'CREATE OR REPLACE VIEW' if connection.dialect.name == 'postgresql' else 'CREATE VIEW IF NOT EXISTS'
+    connection.exec_driver_sql(f'{create} transcripts AS {body}')
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_transcripts_view(target, connection, **kw):
+    create_transcripts_view(connection)
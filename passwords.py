@@ -0,0 +1,141 @@
+import hmac
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.security import generate_password_hash, check_password_hash
+from models import db, User
+from ratelimit import TokenBucketLimiter
+
+# Password hashing for logins. Hashes are computed on a small bounded thread
+# pool (hashlib releases the GIL while deriving keys), so a burst of logins
+# queues a limited amount of KDF work instead of stalling every request
+# thread. Users still holding a legacy plaintext password, or a hash made with
+# an older work factor, are rehashed on their next successful login.
+#
+#   PASSWORD_HASH_METHOD  werkzeug method incl. cost (default scrypt:32768:8:1)
+#   PASSWORD_KDF_WORKERS  concurrent hash computations (default 4)
+#   PASSWORD_KDF_QUEUE    logins allowed to wait for a worker (default 64)
+#   LOGIN_USER_RATE / LOGIN_USER_BURST  attempts per second / burst per username
+#   LOGIN_IP_RATE / LOGIN_IP_BURST      attempts per second / burst per client IP
+
+
+class KdfBusy(Exception):
+    pass
+
+
+class KdfPool:
+
+    def __init__(self, workers=4, max_pending=64):
+        self._workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='kdf')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def run(self, fn, *args):
+        # Run fn on the pool and wait for it; raise KdfBusy rather than queue
+        # without bound
+        if not self._slots.acquire(blocking=False):
+            raise KdfBusy()
+        try:
+            return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def map(self, fn, values):
+        # fn over many values in one slot, one value per worker at a time so
+        # logins submitted meanwhile wait for a single round, not the batch
+        if not self._slots.acquire(blocking=False):
+            raise KdfBusy()
+        try:
+            results = []
+            for start in range(0, len(values), self._workers):
+                futures = [self._executor.submit(fn, value)
+                           for value in values[start:start + self._workers]]
+                results.extend(future.result() for future in futures)
+            return results
+        finally:
+            self._slots.release()
+
+
+hash_method = 'scrypt:32768:8:1'
+kdf_pool = KdfPool()
+user_limiter = TokenBucketLimiter(rate=0.2, burst=5)
+ip_limiter = TokenBucketLimiter(rate=2, burst=30)
+_dummy_hash = None
+
+
+def init_app(app):
+    global hash_method, kdf_pool, user_limiter, ip_limiter, _dummy_hash
+    hash_method = app.config.get('PASSWORD_HASH_METHOD', hash_method)
+    kdf_pool = KdfPool(app.config.get('PASSWORD_KDF_WORKERS', 4),
+                       app.config.get('PASSWORD_KDF_QUEUE', 64))
+    user_limiter = TokenBucketLimiter(rate=app.config.get('LOGIN_USER_RATE', 0.2),
+                                      burst=app.config.get('LOGIN_USER_BURST', 5))
+    ip_limiter = TokenBucketLimiter(rate=app.config.get('LOGIN_IP_RATE', 2),
+                                    burst=app.config.get('LOGIN_IP_BURST', 30))
+    _dummy_hash = None
+
+
+def hash_password(password):
+    return generate_password_hash(password, method=hash_method)
+
+
+def needs_rehash(password_hash):
+    return password_hash.split('$', 1)[0] != hash_method
+
+
+def throttle(username, ip):
+    # Seconds the caller must wait before another attempt, or 0. The user
+    # bucket goes first so a denied attempt doesn't also spend an IP token.
+    wait = user_limiter.acquire(username.lower())
+    if wait:
+        return wait
+    return ip_limiter.acquire(ip)
+
+
+def verify_login(user, password):
+    # True if `password` is correct for `user` (which may be None). Upgrades
+    # the stored credential in the current transaction when needed; the
+    # caller commits. Raises KdfBusy when the hash pool is saturated.
+    global _dummy_hash
+    if user is None:
+        # Spend the same work as a real check so unknown usernames don't answer faster
+        if _dummy_hash is None:
+            _dummy_hash = kdf_pool.run(hash_password, 'not a password')
+        kdf_pool.run(check_password_hash, _dummy_hash, password)
+        return False
+
+    if user.password_hash:
+        if not kdf_pool.run(check_password_hash, user.password_hash, password):
+            return False
+        if needs_rehash(user.password_hash):
+            user.password_hash = kdf_pool.run(hash_password, password)
+        return True
+
+    # Legacy plaintext row: compare, then replace it with a hash
+    if not user.password or not hmac.compare_digest(user.password.encode(), password.encode()):
+        return False
+    user.set_password_hash(kdf_pool.run(hash_password, password))
+    return True
+
+
+def hash_passwords(passwords):
+    # Hashes for bulk imports, computed on the pool. Raises KdfBusy.
+    return kdf_pool.map(hash_password, passwords)
+
+
+def set_password(user, password):
+    # Synchronous hash for admin tools and scripts
+    user.set_password_hash(hash_password(password))
+
+
+def migrate_plaintext(batch_size=500):
+    # Hash every remaining legacy plaintext password; returns how many
+    migrated = 0
+    while True:
+        users = (User.query.filter(User.password_hash.is_(None), User.password != '')
+                 .limit(batch_size).all())
+        if not users:
+            return migrated
+        for user in users:
+            set_password(user, user.password)
+        db.session.commit()
+        migrated += len(users)
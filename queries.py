@@ -0,0 +1,214 @@
+import base64
+import json
+from models import db, User, Term, Course, Grade, enrollments, transcripts
+
+# Read-side helpers that build API payloads from a fixed number of queries,
+# instead of serializing ORM objects one by one (which lazy-loads the teacher
+# for every course). The statements are built separately from the payloads
+# so the async tier (async_app.py) can run the same queries.
+
+
+def course_summaries_query(*criteria, order_by=(Course.id,), limit=None):
+    query = (db.select(Course.id, Course.name, Course.capacity, Course.timeslot,
+                       Course.teacher_id, User.username, Course.enrolled_count)
+             .outerjoin(User, User.id == Course.teacher_id)
+             .where(*criteria)
+             .order_by(*order_by))
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def course_summary(row):
+    # Same shape as Course.to_dict()
+    course_id, name, capacity, timeslot, teacher_id, teacher_name, enrolled_count = row
+    return {
+        'id': course_id,
+        'name': name,
+        'capacity': capacity,
+        'timeslot': timeslot,
+        'teacher_id': teacher_id,
+        'teacher_name': teacher_name if teacher_name else 'Unknown',
+        'enrolled_count': enrolled_count,
+    }
+
+
+def course_summaries(*criteria, order_by=(Course.id,), limit=None):
+    # Course dicts from a single joined query
+    rows = db.session.execute(course_summaries_query(*criteria, order_by=order_by, limit=limit))
+    return [course_summary(row) for row in rows]
+
+
+def enrolled_course_ids_query(student_id):
+    return db.select(enrollments.c.course_id).where(enrollments.c.user_id == student_id)
+
+
+def student_grades_query(student_id):
+    return db.select(Grade.course_id, Grade.value).where(Grade.student_id == student_id)
+
+
+def build_dashboard(courses, enrolled_ids, grades):
+    # Payload for /api/student/courses from the catalog's course summaries and
+    # the student's enrollments and grades (see dashboards.py)
+    enrolled_courses = []
+    available_courses = []
+    for course_dict in map(dict, courses):
+        if course_dict['id'] in enrolled_ids:
+            course_dict['enrolled'] = True
+            if course_dict['id'] in grades:
+                course_dict['grade'] = grades[course_dict['id']]
+            enrolled_courses.append(course_dict)
+        else:
+            course_dict['enrolled'] = False
+            available_courses.append(course_dict)
+
+    return {
+        'enrolled_courses': enrolled_courses,
+        'available_courses': available_courses
+    }
+
+
+def student_transcript(student_id):
+    # Grades from every term, live and archived, oldest term first; courses
+    # without a term come last
+    rows = db.session.execute(
+        db.select(transcripts.c.term_id, Term.name, transcripts.c.course_id,
+                  transcripts.c.course_name, transcripts.c.value)
+        .outerjoin(Term, Term.id == transcripts.c.term_id)
+        .where(transcripts.c.student_id == student_id)
+        .order_by(transcripts.c.term_id.is_(None), transcripts.c.term_id, transcripts.c.course_name))
+
+    terms = []
+    for term_id, term_name, course_id, course_name, value in rows:
+        if not terms or terms[-1]['term_id'] != term_id:
+            terms.append({'term_id': term_id, 'term': term_name, 'courses': []})
+        terms[-1]['courses'].append({'course_id': course_id, 'course_name': course_name, 'grade': value})
+    return terms
+
+
+ROSTER_FIELDS = ('id', 'username', 'role', 'grade')
+
+
+def course_detail(course_id, after=None, limit=None, fields=ROSTER_FIELDS):
+    # Course metadata plus one page of its roster with grades, from a single
+    # joined query. The roster is ordered by student id; `after` is the last id
+    # of the previous page. Returns None if the course does not exist.
+    teacher = db.aliased(User)
+    student = db.aliased(User)
+
+    enrollment_on = enrollments.c.course_id == Course.id
+    if after is not None:
+        enrollment_on &= enrollments.c.user_id > after
+
+    query = (db.session.query(Course.id, Course.name, Course.capacity, Course.timeslot,
+                              Course.teacher_id, teacher.username, Course.enrolled_count,
+                              student.id, student.username, student.role, Grade.value)
+             .outerjoin(teacher, teacher.id == Course.teacher_id)
+             .outerjoin(enrollments, enrollment_on)
+             .outerjoin(student, student.id == enrollments.c.user_id)
+             .outerjoin(Grade, (Grade.course_id == Course.id) & (Grade.student_id == student.id))
+             .filter(Course.id == course_id)
+             .order_by(enrollments.c.user_id))
+    if limit is not None:
+        # One extra row tells us whether another page exists
+        query = query.limit(limit + 1)
+    rows = query.all()
+
+    if not rows:
+        return None
+
+    course_id, name, capacity, timeslot, teacher_id, teacher_name, enrolled_count = rows[0][:7]
+    course = {
+        'id': course_id,
+        'name': name,
+        'capacity': capacity,
+        'timeslot': timeslot,
+        'teacher_id': teacher_id,
+        'teacher_name': teacher_name if teacher_name else 'Unknown',
+        'enrolled_count': enrolled_count,
+    }
+
+    students = []
+    for student_id, username, role, grade in (row[7:] for row in rows):
+        if student_id is None:
+            continue
+        record = {'id': student_id, 'username': username, 'role': role, 'grade': grade}
+        students.append({field: record[field] for field in fields})
+
+    next_after = None
+    if limit is not None and len(students) > limit:
+        students = students[:limit]
+        next_after = rows[limit - 1][7]
+
+    return {
+        'course': course,
+        'students': students,
+        'next_after': next_after
+    }
+
+
+_fts_available = {}
+
+
+def _course_fts_available():
+    engine = db.engine
+    if engine not in _fts_available:
+        _fts_available[engine] = db.inspect(engine).has_table('courses_fts')
+    return _fts_available[engine]
+
+
+def encode_cursor(name, course_id):
+    return base64.urlsafe_b64encode(json.dumps([name, course_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    # Raises ValueError on anything that is not a cursor we produced
+    try:
+        name, course_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(name, str) or not isinstance(course_id, int):
+        raise ValueError('Invalid cursor')
+    return name, course_id
+
+
+def _like_escape(text):
+    # LIKE wildcards in user input match literally (used with escape='\\')
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def search_courses(prefix=None, contains=None, teacher_id=None, timeslot=None,
+                   min_seats=None, cursor=None, limit=50):
+    # One page of courses ordered by (name, id), walked with a keyset cursor
+    # so every page is an index range scan rather than an OFFSET
+    criteria = []
+    if prefix:
+        criteria.append(Course.name.like(_like_escape(prefix) + '%', escape='\\'))
+    if contains:
+        if len(contains) >= 3 and _course_fts_available():
+            phrase = '"' + contains.replace('"', '""') + '"'
+            matches = db.text('SELECT rowid FROM courses_fts WHERE courses_fts MATCH :phrase').bindparams(phrase=phrase)
+            criteria.append(Course.id.in_(matches.columns(db.column('rowid'))))
+        else:
+            criteria.append(Course.name.ilike('%' + _like_escape(contains) + '%', escape='\\'))
+    if teacher_id is not None:
+        criteria.append(Course.teacher_id == teacher_id)
+    if timeslot:
+        criteria.append(Course.timeslot == timeslot)
+    if min_seats is not None:
+        criteria.append(Course.capacity - Course.enrolled_count >= min_seats)
+    if cursor is not None:
+        name, course_id = decode_cursor(cursor)
+        criteria.append(db.tuple_(Course.name, Course.id) > (name, course_id))
+
+    courses = course_summaries(*criteria, order_by=(Course.name, Course.id), limit=limit + 1)
+
+    next_cursor = None
+    if len(courses) > limit:
+        courses = courses[:limit]
+        next_cursor = encode_cursor(courses[-1]['name'], courses[-1]['id'])
+
+    return {
+        'courses': courses,
+        'next_cursor': next_cursor
+    }
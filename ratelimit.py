@@ -0,0 +1,39 @@
+import threading
+import time
+from collections import OrderedDict
+
+# In-process token buckets for throttling login attempts per key (username,
+# client IP). Checked before any password hash is computed.
+
+
+class TokenBucketLimiter:
+
+    def __init__(self, rate, burst, max_keys=100000):
+        # `rate` tokens per second refill a bucket of `burst` tokens
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key):
+        # Takes a token for `key`. Returns 0 if allowed, otherwise the number
+        # of seconds until a token will be available.
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0
+            else:
+                wait = (1 - tokens) / self.rate
+            # Most recently used keys at the end; idle keys are evicted first
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def reset(self, key):
+        with self._lock:
+            self._buckets.pop(key, None)
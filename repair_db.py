@@ -0,0 +1,99 @@
+from sqlalchemy import inspect, text
+from app import app, db, ensure_admin
+from models import refresh_enrolled_counts, create_course_fts
+import passwords
+import schedule
+import grade_stats
+
+# Brings an existing database up to the current models and repairs the
+# denormalized columns. Safe to run repeatedly.
+
+def add_missing_columns():
+    # db.create_all() only creates missing tables, so add columns introduced
+    # after a database was first created
+    inspector = inspect(db.engine)
+    added = []
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'
+            if column.server_default is not None:
+                ddl += f" DEFAULT {column.server_default.arg}"
+            db.session.execute(text(ddl))
+            added.append(f'{table.name}.{column.name}')
+    db.session.commit()
+    return added
+
+def dedupe_grades():
+    # Keep the most recently written grade for each (student, course) pair so
+    # the unique index can be built
+    removed = db.session.execute(text(
+        'DELETE FROM grades WHERE id NOT IN '
+        '(SELECT MAX(id) FROM grades GROUP BY student_id, course_id)'
+    )).rowcount
+    db.session.commit()
+    return removed
+
+def create_missing_indexes():
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def rebuild_course_search():
+    # (Re)creates the FTS index for course names and reloads it from courses
+    with db.engine.begin() as connection:
+        return create_course_fts(connection, rebuild=True)
+
+def backfill_meeting_times():
+    updated = schedule.refresh_meeting_times()
+    db.session.commit()
+    return updated
+
+def backfill_enrolled_counts():
+    updated = refresh_enrolled_counts()
+    db.session.commit()
+    return updated
+
+def backfill_grade_stats():
+    grade_stats.recompute()
+    db.session.commit()
+
+def repair_database():
+    with app.app_context():
+        db.create_all()
+        
+        added = add_missing_columns()
+        for name in added:
+            print(f"Added column {name}")
+        
+        removed = dedupe_grades()
+        if removed:
+            print(f"Removed {removed} duplicate grades")
+        create_missing_indexes()
+        if rebuild_course_search():
+            print("Rebuilt course name search index")
+        
+        updated = backfill_enrolled_counts()
+        print(f"Recounted enrollments for {updated} courses")
+        
+        parsed = backfill_meeting_times()
+        print(f"Parsed meeting times for {parsed} courses")
+        
+        backfill_grade_stats()
+        print("Rebuilt grade statistics")
+        
+        # Plaintext passwords are otherwise upgraded one by one at login
+        migrated = passwords.migrate_plaintext()
+        if migrated:
+            print(f"Hashed {migrated} plaintext passwords")
+        
+        # Skipped at startup while the users table lacked password_hash
+        ensure_admin()
+
+if __name__ == '__main__':
+    repair_database()
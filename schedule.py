@@ -0,0 +1,172 @@
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from sqlalchemy.orm import aliased
+from models import db, Course, User, enrollments
+from timeslots import parse_timeslot, day_bits, day_names
+
+# Schedule conflicts between enrolled courses, using the structured meeting
+# times on Course (see timeslots.py). An enrollment is checked with one query
+# that tests the overlap in the database, reaching the student's courses
+# through the enrollments primary key. Nothing is kept per student between
+# requests: like the enrollment index, such a copy would lag other workers.
+# Batch checks (waitlist promotion) build in-memory interval indexes for the
+# candidates from one query, and a sweep over all enrollments reports
+# existing clashes.
+
+class DaySchedule:
+    # Intervals on one weekday sorted by start, with a running maximum of the
+    # end times so an overlap query is two bisects plus the matches
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self._max_ends = list(accumulate((interval[1] for interval in self.intervals), max))
+
+    def add(self, start, end, course_id):
+        # Only the running maxima from the new interval on can change
+        position = bisect_right(self.intervals, (start, end, course_id))
+        self.intervals.insert(position, (start, end, course_id))
+        self._max_ends.insert(position, max(end, self._max_ends[position - 1]) if position else end)
+        for i in range(position + 1, len(self._max_ends)):
+            if self._max_ends[i] >= end:
+                break
+            self._max_ends[i] = end
+
+    def remove(self, course_id):
+        self.intervals = [interval for interval in self.intervals if interval[2] != course_id]
+        self._max_ends = list(accumulate((interval[1] for interval in self.intervals), max))
+
+    def overlapping(self, start, end):
+        # Everything before `lo` ends at or before `start`; everything from
+        # `hi` on starts at or after `end`
+        lo = bisect_right(self._max_ends, start)
+        hi = bisect_left(self.intervals, (end,))
+        return [course_id for s, e, course_id in self.intervals[lo:hi] if e > start]
+
+
+class WeeklySchedule:
+
+    def __init__(self, meetings=()):
+        # meetings: (course_id, days, start, end); each day is sorted once
+        by_day = {}
+        for course_id, days, start, end in meetings:
+            for bit in day_bits(days):
+                by_day.setdefault(bit, []).append((start, end, course_id))
+        self.days = {bit: DaySchedule(intervals) for bit, intervals in by_day.items()}
+
+    def add(self, course_id, days, start, end):
+        for bit in day_bits(days):
+            self.days.setdefault(bit, DaySchedule()).add(start, end, course_id)
+
+    def remove(self, course_id):
+        for day in self.days.values():
+            day.remove(course_id)
+
+    def conflicts(self, days, start, end, ignore=None):
+        found = set()
+        for bit in day_bits(days):
+            if bit in self.days:
+                found.update(self.days[bit].overlapping(start, end))
+        found.discard(ignore)
+        return sorted(found)
+
+
+def student_schedules(student_ids):
+    # WeeklySchedule per student from one query over their enrollments
+    meetings = {student_id: [] for student_id in student_ids}
+    if meetings:
+        rows = (db.session.query(enrollments.c.user_id, Course.id, Course.meeting_days,
+                                 Course.start_minute, Course.end_minute)
+                .join(Course, Course.id == enrollments.c.course_id)
+                .filter(enrollments.c.user_id.in_(meetings.keys()),
+                        Course.meeting_days.isnot(None)))
+        for student_id, *meeting in rows:
+            meetings[student_id].append(meeting)
+    return {student_id: WeeklySchedule(student_meetings) for student_id, student_meetings in meetings.items()}
+
+
+def find_conflicts(student_id, course_id):
+    # Courses the student is enrolled in that meet at the same time as
+    # course_id: shared meeting days and overlapping minutes, in one query
+    target = aliased(Course)
+    return list(db.session.scalars(
+        db.select(Course.id)
+        .select_from(enrollments)
+        .join(Course, Course.id == enrollments.c.course_id)
+        .join(target, target.id == course_id)
+        .where(enrollments.c.user_id == student_id,
+               Course.id != course_id,
+               Course.meeting_days.op('&')(target.meeting_days) != 0,
+               Course.start_minute < target.end_minute,
+               Course.end_minute > target.start_minute)
+        .order_by(Course.id)))
+
+
+def sweep_conflicts(rows):
+    # rows: (student_id, course_id, days, start, end) grouped by student_id.
+    # Yields (student_id, course_a, course_b, day_bit) once per clashing pair
+    # and day, in a single pass with a per-day sweep over each student's
+    # intervals.
+    def student_conflicts(student_id, intervals):
+        by_day = {}
+        for course_id, days, start, end in intervals:
+            for bit in day_bits(days):
+                by_day.setdefault(bit, []).append((start, end, course_id))
+        for bit, day in by_day.items():
+            if len(day) < 2:
+                continue
+            day.sort()
+            active = []
+            for start, end, course_id in day:
+                active = [interval for interval in active if interval[1] > start]
+                for _, _, other in active:
+                    yield student_id, min(other, course_id), max(other, course_id), bit
+                active.append((start, end, course_id))
+
+    current, intervals = None, []
+    for student_id, course_id, days, start, end in rows:
+        if student_id != current:
+            if intervals:
+                yield from student_conflicts(current, intervals)
+            current, intervals = student_id, []
+        intervals.append((course_id, days, start, end))
+    if intervals:
+        yield from student_conflicts(current, intervals)
+
+
+def conflict_report(batch_size=10000):
+    # Every clashing pair of enrollments, streamed from one ordered query
+    rows = (db.session.query(enrollments.c.user_id, Course.id, Course.meeting_days,
+                             Course.start_minute, Course.end_minute)
+            .join(Course, Course.id == enrollments.c.course_id)
+            .filter(Course.meeting_days.isnot(None))
+            .order_by(enrollments.c.user_id)
+            .yield_per(batch_size))
+    conflicts = list(sweep_conflicts(rows))
+
+    # Resolve names for the (usually few) rows in the report
+    student_ids = {conflict[0] for conflict in conflicts}
+    course_ids = {course_id for conflict in conflicts for course_id in conflict[1:3]}
+    usernames = dict(db.session.query(User.id, User.username).filter(User.id.in_(student_ids))) if student_ids else {}
+    courses = dict(db.session.query(Course.id, Course.name).filter(Course.id.in_(course_ids))) if course_ids else {}
+
+    return [{
+        'student_id': student_id,
+        'username': usernames.get(student_id),
+        'course_ids': [course_a, course_b],
+        'courses': [courses.get(course_a), courses.get(course_b)],
+        'day': day_names(bit)[0],
+    } for student_id, course_a, course_b, bit in conflicts]
+
+
+def refresh_meeting_times(course_ids=None):
+    # Re-parse Course.timeslot into the structured columns; the caller commits
+    query = db.session.query(Course.id, Course.timeslot)
+    if course_ids is not None:
+        query = query.filter(Course.id.in_(course_ids))
+    updates = []
+    for course_id, timeslot in query.all():
+        days, start, end = parse_timeslot(timeslot) or (None, None, None)
+        updates.append({'id': course_id, 'meeting_days': days, 'start_minute': start, 'end_minute': end})
+    if updates:
+        db.session.execute(db.update(Course), updates)
+    return len(updates)
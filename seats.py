@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from collections import deque
+from models import db, Course
+
+# Live seat counts for the student dashboard over Server-Sent Events. Write
+# paths call publish() with the courses whose enrollment changed; a background
+# thread coalesces everything published within `interval` seconds, reads the
+# new counts with one query and encodes a single message. Open streams all
+# wait on the same condition, so each tick is one encode and one notify_all
+# no matter how many clients are connected.
+#
+# Messages carry an increasing id. A client that falls further behind than
+# the retained backlog (or reconnects after it) is sent a `resync` event and
+# should refetch /api/student/courses instead of applying deltas.
+#
+#   SEAT_FEED_INTERVAL    seconds between batched messages (default 1)
+#   SEAT_FEED_KEEPALIVE   seconds between keepalive comments (default 15)
+#   SEAT_FEED_BACKLOG     messages kept for slow or reconnecting clients (default 64)
+
+
+def encode_event(sequence, event, data):
+    return f"id: {sequence}\nevent: {event}\ndata: {data}\n\n".encode()
+
+
+class SeatFeed:
+
+    def __init__(self, interval=1.0, keepalive=15.0, backlog=64):
+        self.interval = interval
+        self.keepalive = keepalive
+        self._pending = set()
+        self._resync = False
+        self._pending_condition = threading.Condition()
+        self._messages = deque(maxlen=backlog)
+        self._sequence = 0
+        self._broadcast = threading.Condition()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='seat-feed', daemon=True)
+        self._thread.start()
+
+    def publish(self, *course_ids):
+        with self._pending_condition:
+            self._pending.update(course_ids)
+            self._pending_condition.notify()
+
+    def resync(self):
+        # For changes too broad to describe as deltas (courses added or
+        # removed, bulk imports)
+        with self._pending_condition:
+            self._resync = True
+            self._pending_condition.notify()
+
+    def set_backlog(self, backlog):
+        with self._broadcast:
+            self._messages = deque(self._messages, maxlen=backlog)
+
+    def _append(self, event, data):
+        with self._broadcast:
+            self._sequence += 1
+            body = encode_event(self._sequence, event, data)
+            self._messages.append((self._sequence, body))
+            self._broadcast.notify_all()
+
+    def _tick(self, course_ids, resync):
+        if resync:
+            self._append('resync', '{}')
+            return
+        rows = (db.session.query(Course.id, Course.enrolled_count, Course.capacity)
+                .filter(Course.id.in_(course_ids))
+                .order_by(Course.id)
+                .all())
+        db.session.rollback()
+        if rows:
+            seats = [[course_id, enrolled_count, capacity]
+                     for course_id, enrolled_count, capacity in rows]
+            self._append('seats', json.dumps({'seats': seats}, separators=(',', ':')))
+
+    def _run(self, app):
+        while True:
+            with self._pending_condition:
+                while not self._pending and not self._resync:
+                    self._pending_condition.wait()
+            time.sleep(self.interval)
+            with self._pending_condition:
+                course_ids, self._pending = self._pending, set()
+                resync, self._resync = self._resync, False
+
+            with app.app_context():
+                try:
+                    self._tick(course_ids, resync)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error publishing seat counts for courses {sorted(course_ids)}: {e}")
+
+    def subscribe(self, last_id=None):
+        # Generator of encoded SSE frames, starting after `last_id` (the
+        # Last-Event-ID of a reconnecting client) or at the current message
+        with self._broadcast:
+            cursor = self._sequence if last_id is None else last_id
+            if cursor > self._sequence:
+                # Ids from before a server restart
+                cursor = self._sequence
+
+        yield f"retry: {int(self.interval * 1000) + 1000}\n\n".encode()
+        while True:
+            with self._broadcast:
+                if not self._broadcast.wait_for(lambda: self._sequence > cursor, self.keepalive):
+                    frames = None
+                elif self._messages and self._messages[0][0] > cursor + 1:
+                    # Missed messages that are no longer retained
+                    frames = [encode_event(self._sequence, 'resync', '{}')]
+                    cursor = self._sequence
+                else:
+                    frames = [body for sequence, body in self._messages if sequence > cursor]
+                    cursor = self._sequence
+
+            if frames is None:
+                yield b": keepalive\n\n"
+            else:
+                yield b''.join(frames)
+
+
+feed = SeatFeed()
+
+
+def init_app(app):
+    feed.interval = app.config.get('SEAT_FEED_INTERVAL', 1.0)
+    feed.keepalive = app.config.get('SEAT_FEED_KEEPALIVE', 15.0)
+    feed.set_backlog(app.config.get('SEAT_FEED_BACKLOG', 64))
+
+
+def publish(*course_ids):
+    feed.publish(*course_ids)
+
+
+def resync():
+    feed.resync()
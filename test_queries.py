@@ -0,0 +1,75 @@
+import os
+import tempfile
+
+# Always a throwaway database: the test adds users with fixed usernames
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'test.db')}"
+
+from sqlalchemy import event
+from app import app, db
+from models import User, Course, Grade, enrollments
+import auth
+import catalog
+import dashboards
+
+
+def _add_courses(teacher_id, count):
+    courses = [Course(name=f'Test {i}', capacity=30, timeslot='MW 10:00 AM - 11:00 AM',
+                      teacher_id=teacher_id) for i in range(count)]
+    db.session.add_all(courses)
+    db.session.flush()
+    return courses
+
+
+def _count_request(client, path):
+    # Queries of one uncached request: the catalog snapshot, the dashboard
+    # cache and the identity cache are emptied first
+    catalog.bump()
+    dashboards.clear()
+    auth.identity_cache.clear()
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        response = client.get(path)
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+    assert response.status_code == 200
+    return len(statements), response.json
+
+
+def test_student_courses_query_count_is_constant():
+    with app.app_context():
+        teacher = User(username='query_teacher', password='x', role='teacher')
+        student = User(username='query_student', password='x', role='student')
+        db.session.add_all([teacher, student])
+        db.session.flush()
+
+        courses = _add_courses(teacher.id, 5)
+        db.session.execute(enrollments.insert(), [{'user_id': student.id, 'course_id': course.id}
+                                                  for course in courses[:3]])
+        db.session.add(Grade(student_id=student.id, course_id=courses[0].id, value=90.0))
+        db.session.commit()
+        student_id, teacher_id = student.id, teacher.id
+
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = student_id
+    small, _ = _count_request(client, '/api/student/courses')
+
+    with app.app_context():
+        courses = _add_courses(teacher_id, 200)
+        db.session.execute(enrollments.insert(), [{'user_id': student_id, 'course_id': course.id}
+                                                  for course in courses[:50]])
+        db.session.add_all([Grade(student_id=student_id, course_id=course.id, value=80.0)
+                            for course in courses[:50]])
+        db.session.commit()
+    large, payload = _count_request(client, '/api/student/courses')
+
+    assert len(payload['enrolled_courses']) == 53
+    assert len(payload['available_courses']) == 152
+    assert small == large
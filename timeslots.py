@@ -0,0 +1,66 @@
+import re
+
+# Parsing of free-form Course.timeslot strings such as 'MW 10:00 AM - 11:30 AM'
+# into a weekday bitmask (Monday = 1 ... Sunday = 64) and start/end minutes
+# after midnight. Kept free of model imports so models.py can use it.
+
+DAYS = ('M', 'T', 'W', 'TH', 'F', 'SA', 'SU')
+_DAY_TOKENS = (('TH', 8), ('TU', 2), ('SA', 32), ('SU', 64),
+               ('M', 1), ('T', 2), ('W', 4), ('R', 8), ('F', 16), ('S', 32), ('U', 64))
+_TIMESLOT = re.compile(r'^\s*([A-Za-z]+)\s+(\d{1,2}):(\d{2})\s*([AP]M)\s*-\s*(\d{1,2}):(\d{2})\s*([AP]M)\s*$',
+                       re.IGNORECASE)
+
+
+def _parse_days(text):
+    text = text.upper()
+    mask = 0
+    while text:
+        for token, bit in _DAY_TOKENS:
+            if text.startswith(token):
+                mask |= bit
+                text = text[len(token):]
+                break
+        else:
+            return None
+    return mask
+
+
+def _minutes(hour, minute, meridiem):
+    hour, minute = int(hour), int(minute)
+    if not 1 <= hour <= 12 or minute > 59:
+        raise ValueError
+    return (hour % 12 + (12 if meridiem.upper() == 'PM' else 0)) * 60 + minute
+
+
+def parse_timeslot(timeslot):
+    # (days mask, start minute, end minute), or None if the string is not in
+    # the 'DAYS H:MM AM - H:MM PM' form
+    match = _TIMESLOT.match(timeslot or '')
+    if not match:
+        return None
+    days = _parse_days(match.group(1))
+    try:
+        start = _minutes(*match.group(2, 3, 4))
+        end = _minutes(*match.group(5, 6, 7))
+    except ValueError:
+        return None
+    if not days or end <= start:
+        return None
+    return days, start, end
+
+
+def day_bits(days):
+    return [bit for bit in (1, 2, 4, 8, 16, 32, 64) if days & bit]
+
+
+def day_names(days):
+    return [name for name, bit in zip(DAYS, (1, 2, 4, 8, 16, 32, 64)) if days & bit]
+
+
+def format_timeslot(days, start, end):
+    # Inverse of parse_timeslot
+    def clock(minutes):
+        hour, minute = divmod(minutes, 60)
+        return f"{(hour - 1) % 12 + 1}:{minute:02d} {'PM' if hour >= 12 else 'AM'}"
+
+    return f"{''.join(day_names(days))} {clock(start)} - {clock(end)}"
@@ -0,0 +1,201 @@
+import threading
+import time
+from sqlalchemy.exc import IntegrityError
+from models import db, Course, WaitlistEntry, enrollments
+import catalog
+import schedule
+import seats
+import audit
+import dashboards
+import enrollment_index
+
+# Per-course FIFO waitlist. Students queue once instead of retrying a full
+# course; a background thread moves waiters into seats freed by drops and
+# capacity edits.
+
+JOINED = 'joined'
+HAS_OPEN_SEATS = 'has_open_seats'
+ALREADY_ENROLLED = 'already_enrolled'
+ALREADY_WAITLISTED = 'already_waitlisted'
+COURSE_NOT_FOUND = 'course_not_found'
+
+# Extra waiters examined per course in case some have schedule conflicts
+CONFLICT_LOOKAHEAD = 50
+
+
+def position(student_id, course_id):
+    # 1-based place in line, or None if the student is not waiting
+    entry_id = (db.session.query(WaitlistEntry.id)
+                .filter_by(user_id=student_id, course_id=course_id)
+                .scalar())
+    if entry_id is None:
+        return None
+    return (db.session.query(db.func.count(WaitlistEntry.id))
+            .filter(WaitlistEntry.course_id == course_id, WaitlistEntry.id <= entry_id)
+            .scalar())
+
+
+def student_waitlist(student_id):
+    # Every course the student is waiting on with their position, in one query
+    ahead = db.aliased(WaitlistEntry)
+    place = (db.select(db.func.count(ahead.id))
+             .where(ahead.course_id == WaitlistEntry.course_id, ahead.id <= WaitlistEntry.id)
+             .scalar_subquery())
+    rows = (db.session.query(WaitlistEntry.course_id, Course.name, place)
+            .join(Course, Course.id == WaitlistEntry.course_id)
+            .filter(WaitlistEntry.user_id == student_id)
+            .order_by(WaitlistEntry.id)
+            .all())
+    return [{'course_id': course_id, 'name': name, 'position': pos} for course_id, name, pos in rows]
+
+
+def join(student_id, course_id):
+    course = db.session.get(Course, course_id)
+    if course is None:
+        return COURSE_NOT_FOUND
+    if course.enrolled_count < course.capacity:
+        return HAS_OPEN_SEATS
+    enrolled = db.session.query(
+        db.exists().where(enrollments.c.user_id == student_id,
+                          enrollments.c.course_id == course_id)
+    ).scalar()
+    if enrolled:
+        return ALREADY_ENROLLED
+
+    try:
+        db.session.add(WaitlistEntry(user_id=student_id, course_id=course_id))
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return ALREADY_WAITLISTED
+
+    audit.record('waitlist_join', student_id=student_id, course_id=course_id)
+    return JOINED
+
+
+def leave(student_id, course_id):
+    removed = (WaitlistEntry.query
+               .filter_by(user_id=student_id, course_id=course_id)
+               .delete(synchronize_session=False))
+    db.session.commit()
+    if removed:
+        audit.record('waitlist_leave', student_id=student_id, course_id=course_id)
+    return removed > 0
+
+
+def promote(course_ids):
+    # Fill free seats in the given courses from the head of each waitlist, all
+    # in one transaction. Only reads current state, so running it twice (or for
+    # a course without free seats) is a no-op.
+    promoted = 0
+    filled = []
+    courses = (db.session.query(Course.id, Course.capacity - Course.enrolled_count,
+                                Course.meeting_days, Course.start_minute, Course.end_minute)
+               .filter(Course.id.in_(course_ids))
+               .all())
+
+    for course_id, free, *slot in courses:
+        # Waiters who got a seat some other way just leave the line
+        already_enrolled = (db.select(enrollments.c.user_id)
+                            .where(enrollments.c.course_id == course_id))
+        WaitlistEntry.query.filter(WaitlistEntry.course_id == course_id,
+                                   WaitlistEntry.user_id.in_(already_enrolled)
+                                   ).delete(synchronize_session=False)
+        if free <= 0:
+            continue
+
+        # Look a little past the free seats so waiters with a schedule
+        # conflict can be passed over; they keep their place in line
+        candidates = (db.session.query(WaitlistEntry.id, WaitlistEntry.user_id)
+                      .filter(WaitlistEntry.course_id == course_id)
+                      .order_by(WaitlistEntry.id)
+                      .limit(free + CONFLICT_LOOKAHEAD)
+                      .all())
+        if slot[0] is not None:
+            schedules = schedule.student_schedules([user_id for _, user_id in candidates])
+            candidates = [(entry_id, user_id) for entry_id, user_id in candidates
+                          if not schedules[user_id].conflicts(*slot, ignore=course_id)]
+        waiters = candidates[:free]
+
+        # Same guard as enrollment.enroll: never take more seats than are left.
+        # If a direct enroll slipped in since the read above, re-read the free
+        # seats and promote fewer waiters rather than skipping the course.
+        while waiters:
+            reserved = db.session.execute(
+                db.update(Course)
+                .where(Course.id == course_id,
+                       Course.enrolled_count + len(waiters) <= Course.capacity)
+                .values(enrolled_count=Course.enrolled_count + len(waiters))
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if reserved:
+                break
+            free = (db.session.query(Course.capacity - Course.enrolled_count)
+                    .filter(Course.id == course_id)
+                    .scalar())
+            waiters = waiters[:max(free or 0, 0)]
+        if not waiters:
+            continue
+
+        db.session.execute(enrollments.insert(),
+                           [{'user_id': user_id, 'course_id': course_id} for _, user_id in waiters])
+        WaitlistEntry.query.filter(WaitlistEntry.id.in_([entry_id for entry_id, _ in waiters])
+                                   ).delete(synchronize_session=False)
+        promoted += len(waiters)
+        filled.append((course_id, [user_id for _, user_id in waiters]))
+
+    db.session.commit()
+    for course_id, student_ids in filled:
+        for student_id in student_ids:
+            audit.record('waitlist_promote', student_id=student_id, course_id=course_id)
+            enrollment_index.enrolled(student_id, course_id)
+    if promoted:
+        dashboards.invalidate(*(student_id for _, student_ids in filled for student_id in student_ids))
+        catalog.bump()
+        seats.publish(*(course_id for course_id, _ in filled))
+    return promoted
+
+
+class WaitlistPromoter:
+    # Background thread that batches freed-seat notifications. Several drops
+    # within `delay` seconds are promoted together in a single transaction.
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self._pending = set()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, app):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(app,),
+                                        name='waitlist-promoter', daemon=True)
+        self._thread.start()
+
+    def notify(self, *course_ids):
+        with self._condition:
+            self._pending.update(course_ids)
+            self._condition.notify()
+
+    def _run(self, app):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+            time.sleep(self.delay)
+            with self._condition:
+                course_ids, self._pending = self._pending, set()
+
+            with app.app_context():
+                try:
+                    promote(course_ids)
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Error promoting waitlist for courses {sorted(course_ids)}: {e}")
+                    # Put them back so the next notification retries them
+                    with self._condition:
+                        self._pending.update(course_ids)
+
+
+promoter = WaitlistPromoter()